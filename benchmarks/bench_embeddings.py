@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+"""
+Embedding backend benchmark - PyTorch (HuggingFaceEmbeddings) vs ONNX fp32 vs ONNX int8
+
+Measures, on chunks sampled from the ingested Chroma collection:
+  - throughput in sentences/sec for document batches and single queries
+  - agreement with the PyTorch vectors (min / mean cosine similarity)
+  - retrieval recall@k against PyTorch rankings, both when only queries use
+    the new backend (existing index kept) and when the index is re-embedded
+
+Usage:
+    py benchmarks/bench_embeddings.py [--k 4] [--chunks 2000] [--output results/bench_embeddings.json]
+
+Requires an ingested Chroma collection and an ONNX export
+(py src/rag/onnx_embeddings.py --export); backends that fail to load are skipped.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "src"))
+
+from rag.embeddings import EMBEDDING_BACKENDS, load_embeddings
+from rag.numpy_index import DB_DIR
+from rag.onnx_embeddings import FP32_MIN_COSINE, INT8_MIN_COSINE
+
+
+def load_query_texts() -> list:
+    path = os.path.join(PROJECT_ROOT, "src", "eval", "test_questions.json")
+    with open(path, "r", encoding="utf-8") as f:
+        return [q["question"] for q in json.load(f)["questions"]]
+
+
+def load_chunks(n: int) -> tuple:
+    from langchain_chroma import Chroma
+
+    collection = Chroma(persist_directory=DB_DIR)._collection
+    batch = collection.get(include=["documents", "embeddings"], limit=n)
+    return batch["documents"], np.asarray(batch["embeddings"], dtype=np.float32)
+
+
+def top_k(query_vectors: np.ndarray, doc_vectors: np.ndarray, k: int) -> np.ndarray:
+    return np.argsort(-(query_vectors @ doc_vectors.T), axis=1)[:, :k]
+
+
+def recall(found: np.ndarray, expected: np.ndarray) -> float:
+    hits = sum(len(set(f) & set(e)) for f, e in zip(found.tolist(), expected.tolist()))
+    return round(hits / expected.size, 4) if expected.size else 0.0
+
+
+def time_backend(embeddings, chunks: list, queries: list, repeats: int) -> tuple:
+    embeddings.embed_documents(chunks[:8])  # warm-up (lazy init, thread pools)
+
+    started = time.perf_counter()
+    doc_vectors = np.asarray(embeddings.embed_documents(chunks), dtype=np.float32)
+    doc_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for _ in range(repeats):
+        query_vectors = np.asarray([embeddings.embed_query(q) for q in queries], dtype=np.float32)
+    query_seconds = time.perf_counter() - started
+
+    return doc_vectors, query_vectors, {
+        "documents_per_sec": round(len(chunks) / doc_seconds, 1),
+        "queries_per_sec": round(len(queries) * repeats / query_seconds, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark PyTorch vs ONNX embedding backends")
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--chunks", type=int, default=2000, help="Chunks sampled from the collection")
+    parser.add_argument("--query-repeats", type=int, default=5)
+    parser.add_argument("--output", default=os.path.join(PROJECT_ROOT, "results", "bench_embeddings.json"))
+    args = parser.parse_args()
+
+    chunks, stored_vectors = load_chunks(args.chunks)
+    queries = load_query_texts()
+    print(f"Benchmarking on {len(chunks)} chunks and {len(queries)} queries")
+
+    runs = {}
+    for backend in EMBEDDING_BACKENDS:
+        try:
+            embeddings = load_embeddings(use_cache=False, backend=backend)
+        except (ImportError, FileNotFoundError) as e:
+            print(f"Skipping {backend}: {e}")
+            continue
+        print(f"  {backend}...")
+        runs[backend] = time_backend(embeddings, chunks, queries, args.query_repeats)
+
+    if "torch" not in runs:
+        print("The PyTorch backend is required as the reference; nothing to compare against.")
+        return
+
+    ref_docs, ref_queries, _ = runs["torch"]
+    # Rankings of the existing (PyTorch-built) index for PyTorch query vectors
+    reference = top_k(ref_queries, stored_vectors, args.k)
+
+    results = {"k": args.k, "chunks": len(chunks), "queries": len(queries), "backends": {}}
+    for backend, (doc_vectors, query_vectors, throughput) in runs.items():
+        cosine = np.sum(doc_vectors * ref_docs, axis=1)
+        tolerance = {"onnx": FP32_MIN_COSINE, "onnx-int8": INT8_MIN_COSINE}.get(backend)
+        results["backends"][backend] = {
+            **throughput,
+            "cosine_to_torch": {"min": round(float(cosine.min()), 6), "mean": round(float(cosine.mean()), 6)},
+            "within_tolerance": bool(cosine.min() >= tolerance) if tolerance else True,
+            "recall_at_k_existing_index": recall(top_k(query_vectors, stored_vectors, args.k), reference),
+            "recall_at_k_reindexed": recall(top_k(query_vectors, doc_vectors, args.k), reference),
+        }
+
+    torch_rate = results["backends"]["torch"]["documents_per_sec"]
+    for stats in results["backends"].values():
+        stats["speedup_vs_torch"] = round(stats["documents_per_sec"] / torch_rate, 2)
+
+    print(json.dumps(results, indent=2))
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,362 @@
+#!/usr/bin/env python
+"""
+Offline performance suite - ingest, retrieval, index memory and end-to-end runs
+
+Builds a synthetic Markdown corpus of configurable size in a scratch directory
+and measures, without any network access:
+  - ingest throughput (files, chunks and MiB per second) and NumPy index export
+  - retrieval latency per backend (Chroma, NumPy): single-query p50/p95/p99 and
+    batched retrieve_many latency and throughput
+  - memory footprint of each loaded index (resident set growth, Python heap
+    allocated while loading, matrix size and size on disk)
+  - end-to-end run_experiment throughput against the stub LLM
+
+Embeddings default to the model-free "hashing" backend (hashing_embeddings.py)
+so the numbers track the pipeline rather than the embedding model; pass
+--embedding-backend torch (or onnx) with a locally cached model to include it. Results are written as
+JSON together with the git commit, so runs can be compared across commits.
+
+Usage:
+    py benchmarks/bench_suite.py [--docs 200] [--doc-words 1500] [--queries 200]
+                                 [--questions 50] [--output results/bench_suite.json]
+"""
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import contextlib
+import subprocess
+import tracemalloc
+
+import numpy as np
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "src"))
+
+from rag.embeddings import EMBEDDING_BACKENDS
+import hashing_embeddings
+
+SYLLABLES = ("ba", "ce", "di", "fo", "gu", "ha", "ke", "li", "mo", "nu", "pa", "re", "si", "to", "vu", "za")
+
+
+def percentiles(samples_ms: list) -> dict:
+    arr = np.asarray(samples_ms, dtype=np.float64)
+    return {f"p{p}": round(float(np.percentile(arr, p)), 3) for p in (50, 95, 99)}
+
+
+def current_rss_mb():
+    """Current resident set size of this process in MiB, or None if unavailable"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return round(int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024), 1)
+    except (OSError, AttributeError, ValueError):
+        pass
+    try:
+        import psutil
+        return round(psutil.Process().memory_info().rss / (1024 * 1024), 1)
+    except ImportError:
+        return None
+
+
+def dir_size_mb(path: str, exclude=()) -> float:
+    total = 0
+    for root, dirs, files in os.walk(path):
+        dirs[:] = [name for name in dirs if name not in exclude]
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return round(total / (1024 * 1024), 2)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=PROJECT_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@contextlib.contextmanager
+def quiet(enabled: bool):
+    """Swallow the progress output of the code under test"""
+    if not enabled:
+        yield
+        return
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+# ---- synthetic corpus ----
+
+def make_vocabulary(rng: np.random.Generator, size: int) -> list:
+    words = set()
+    while len(words) < size:
+        n = rng.integers(2, 5)
+        words.add("".join(SYLLABLES[i] for i in rng.integers(0, len(SYLLABLES), n)))
+    return sorted(words)
+
+
+def build_corpus(root: str, docs: int, doc_words: int, vocab_size: int, seed: int) -> tuple:
+    """
+    Write docs Markdown files of about doc_words words each under root
+
+    Words follow a Zipf-like distribution over a pseudo-word vocabulary, so
+    BM25 and the hashing embeddings see realistic term-frequency skew.
+
+    Returns:
+        (corpus stats, list of sentences to draw queries from)
+    """
+    rng = np.random.default_rng(seed)
+    vocab = make_vocabulary(rng, vocab_size)
+    weights = 1.0 / np.arange(1, len(vocab) + 1)
+    weights /= weights.sum()
+
+    sentences = []
+    total_bytes = 0
+    for d in range(docs):
+        lines = [f"# Document {d}", ""]
+        written = 0
+        section = 0
+        while written < doc_words:
+            lines += [f"## Section {section}", ""]
+            for _ in range(rng.integers(3, 7)):
+                paragraph = []
+                for _ in range(rng.integers(3, 6)):
+                    length = int(rng.integers(8, 20))
+                    words = [vocab[i] for i in rng.choice(len(vocab), size=length, p=weights)]
+                    paragraph.append(" ".join(words).capitalize() + ".")
+                    sentences.append(words)
+                    written += length
+                lines += [" ".join(paragraph), ""]
+            section += 1
+        path = os.path.join(root, f"part-{d // 100:03d}", f"doc-{d:05d}.md")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        text = "\n".join(lines)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        total_bytes += len(text.encode("utf-8"))
+
+    stats = {
+        "docs": docs,
+        "doc_words": doc_words,
+        "vocabulary": len(vocab),
+        "mib": round(total_bytes / (1024 * 1024), 2),
+    }
+    return stats, sentences
+
+
+def make_queries(sentences: list, n: int, seed: int) -> list:
+    """Questions built from short spans of corpus sentences, so every query has matching chunks"""
+    rng = np.random.default_rng(seed + 1)
+    queries = []
+    for i in rng.integers(0, len(sentences), n):
+        words = sentences[i]
+        span = int(min(len(words), rng.integers(4, 8)))
+        start = int(rng.integers(0, len(words) - span + 1))
+        queries.append(f"What does the corpus say about {' '.join(words[start:start + span])}?")
+    return queries
+
+
+# ---- phases ----
+
+def bench_ingest(corpus_dir: str, db_dir: str, workers: int, corpus: dict, verbose: bool) -> dict:
+    from rag.ingest import ingest_corpus
+    from rag.numpy_index import NumpyIndex
+
+    started = time.perf_counter()
+    with quiet(not verbose):
+        stats = ingest_corpus(corpus_dir, db_dir=db_dir, workers=workers)
+    ingest_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    index = NumpyIndex.from_chroma(db_dir, os.path.join(db_dir, "numpy_index"))
+    export_seconds = time.perf_counter() - started
+
+    return {
+        "workers": workers,
+        "files": stats["files_changed"],
+        "files_failed": stats["files_failed"],
+        "chunks": stats["chunks_added"],
+        "seconds": round(ingest_seconds, 3),
+        "files_per_sec": round(stats["files_changed"] / ingest_seconds, 2),
+        "chunks_per_sec": round(stats["chunks_added"] / ingest_seconds, 2),
+        "mib_per_sec": round(corpus["mib"] / ingest_seconds, 3),
+        "numpy_export_seconds": round(export_seconds, 3),
+        "numpy_chunks": len(index),
+    }
+
+
+def bench_retrieval(backend: str, queries: list, k: int, batch_size: int, hybrid: bool) -> dict:
+    import resources
+    import agents.rag_agent as rag_agent_module
+
+    resources.reset()
+    rss_before = current_rss_mb()
+    # Python-level allocations made while opening the store and answering one query
+    tracemalloc.start()
+    agent = rag_agent_module.RAGAgent(backend=backend, hybrid=hybrid, require_llm=False)
+    agent.retrieve(queries[0], k=k)
+    heap_mib, heap_peak_mib = (v / (1024 * 1024) for v in tracemalloc.get_traced_memory())
+    tracemalloc.stop()
+
+    single_ms = []
+    for query in queries:
+        started = time.perf_counter()
+        agent.retrieve(query, k=k)
+        single_ms.append((time.perf_counter() - started) * 1000)
+
+    batch_ms = []
+    started_all = time.perf_counter()
+    for start in range(0, len(queries), batch_size):
+        started = time.perf_counter()
+        agent.retrieve_many(queries[start:start + batch_size], k=k)
+        batch_ms.append((time.perf_counter() - started) * 1000)
+    batch_seconds = time.perf_counter() - started_all
+    rss_after = current_rss_mb()
+
+    memory = {
+        "rss_growth_mib": round(rss_after - rss_before, 1) if rss_before is not None else None,
+        "python_heap_mib": round(heap_mib, 2),
+        "python_heap_peak_mib": round(heap_peak_mib, 2),
+        # The Chroma directory also holds the exported NumPy and BM25 indexes
+        "on_disk_mib": dir_size_mb(agent.store_path, exclude=("numpy_index", "bm25")),
+    }
+    if backend == "numpy":
+        memory["matrix_mib"] = round(agent.vectorstore.nbytes / (1024 * 1024), 2)
+    return {
+        "k": k,
+        "hybrid": agent.hybrid,
+        "queries": len(queries),
+        "single_latency_ms": percentiles(single_ms),
+        "single_queries_per_sec": round(len(queries) / (sum(single_ms) / 1000), 1),
+        "batch_size": batch_size,
+        "batch_latency_ms": percentiles(batch_ms),
+        "batch_queries_per_sec": round(len(queries) / batch_seconds, 1),
+        "memory": memory,
+    }
+
+
+def bench_end_to_end(queries: list, output_dir: str, backend: str, concurrency: int, serial: bool,
+                     verbose: bool) -> dict:
+    import resources
+    from eval.evaluator import run_experiment
+
+    resources.reset()
+    os.environ["RAG_VECTOR_BACKEND"] = backend
+    questions = [{"id": i + 1, "question": q, "category": "synthetic"} for i, q in enumerate(queries)]
+    started = time.perf_counter()
+    with quiet(not verbose):
+        results = run_experiment(questions, os.path.join(output_dir, "results.json"),
+                                 concurrency=concurrency, serial=serial)
+    seconds = time.perf_counter() - started
+
+    return {
+        "backend": backend,
+        "questions": len(questions),
+        "concurrency": concurrency,
+        "serial": serial,
+        "seconds": round(seconds, 3),
+        "questions_per_sec": round(len(questions) / seconds, 2),
+        "unscored": results["summary"]["unscored"],
+        "timing": results["timing"],
+        "stages": results["stages"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark of ingest, retrieval and end-to-end runs")
+    parser.add_argument("--docs", type=int, default=200, help="Synthetic documents to ingest")
+    parser.add_argument("--doc-words", type=int, default=1500, help="Approximate words per document")
+    parser.add_argument("--vocabulary", type=int, default=5000, help="Distinct words in the synthetic corpus")
+    parser.add_argument("--workers", type=int, default=None, help="Ingest worker processes (default: CPU count)")
+    parser.add_argument("--queries", type=int, default=200, help="Retrieval queries to time")
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=32, help="Queries per retrieve_many call")
+    parser.add_argument("--hybrid", action="store_true", help="Fuse BM25 with dense retrieval")
+    parser.add_argument("--backends", default="chroma,numpy", help="Vector backends to time (comma-separated)")
+    parser.add_argument("--questions", type=int, default=50, help="Questions for the end-to-end run (0 skips it)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Questions in flight in the end-to-end run")
+    parser.add_argument("--serial", action="store_true", help="End-to-end run without intra-question overlap")
+    parser.add_argument("--llm-latency", default="0", help="Stub LLM latency spec (e.g. 0.2, lognormal:0.5:0.3)")
+    parser.add_argument("--embedding-backend", choices=EMBEDDING_BACKENDS + ("hashing",), default="hashing")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work-dir", help="Scratch directory (default: a temporary directory, removed afterwards)")
+    parser.add_argument("--verbose", action="store_true", help="Show ingest and experiment output")
+    parser.add_argument("--output", default=os.path.join(PROJECT_ROOT, "results", "bench_suite.json"))
+    args = parser.parse_args()
+
+    # Everything below must run without network access or API keys
+    os.environ.update({
+        "EMBEDDING_BACKEND": (hashing_embeddings.BACKEND if args.embedding_backend == "hashing"
+                              else args.embedding_backend),
+        "LLM_BACKEND": "stub",
+        "LLM_STUB_LATENCY": args.llm_latency,
+        "LLM_CACHE": "0",
+        "HF_HUB_OFFLINE": "1",
+        "RAG_HYBRID": "1" if args.hybrid else "0",
+    })
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="rag_bench_")
+    corpus_dir = os.path.join(work_dir, "corpus")
+    db_dir = os.path.join(work_dir, "db")
+    try:
+        print(f"Generating {args.docs} documents in {work_dir}...")
+        corpus, sentences = build_corpus(corpus_dir, args.docs, args.doc_words, args.vocabulary, args.seed)
+        queries = make_queries(sentences, max(args.queries, args.questions), args.seed)
+
+        print("Ingesting...")
+        ingest = bench_ingest(corpus_dir, db_dir, args.workers or os.cpu_count() or 1, corpus, args.verbose)
+        print(f"  {ingest['chunks']} chunks in {ingest['seconds']}s ({ingest['chunks_per_sec']} chunks/sec)")
+
+        import agents.rag_agent as rag_agent_module
+        rag_agent_module.DB_DIR = db_dir
+        rag_agent_module.NUMPY_INDEX_DIR = os.path.join(db_dir, "numpy_index")
+        rag_agent_module.BM25_DIR = os.path.join(db_dir, "bm25")
+
+        retrieval = {}
+        for backend in backends:
+            print(f"Timing retrieval ({backend})...")
+            retrieval[backend] = bench_retrieval(backend, queries[:args.queries], args.k, args.batch_size, args.hybrid)
+            print(f"  single p50 {retrieval[backend]['single_latency_ms']['p50']} ms, "
+                  f"batched {retrieval[backend]['batch_queries_per_sec']} queries/sec")
+
+        end_to_end = None
+        if args.questions:
+            print(f"Running {args.questions} questions end to end against the stub LLM...")
+            end_to_end = bench_end_to_end(queries[:args.questions], os.path.join(work_dir, "e2e"), backends[-1],
+                                          args.concurrency, args.serial, args.verbose)
+            print(f"  {end_to_end['questions_per_sec']} questions/sec")
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "embedding_backend": args.embedding_backend,
+            "llm_latency": args.llm_latency,
+            "seed": args.seed,
+        },
+        "corpus": corpus,
+        "ingest": ingest,
+        "retrieval": retrieval,
+        "end_to_end": end_to_end,
+    }
+
+    print(json.dumps(results, indent=2))
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
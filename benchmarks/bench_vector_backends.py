@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+"""
+Vector backend benchmark - Chroma (HNSW) vs NumPy memory-mapped exact index
+
+Measures, for the same query vectors:
+  - cold start: opening the store and answering the first query
+  - per-query latency (p50/p95/p99) and batched-query throughput
+  - recall@k of each backend against exact search
+
+Usage:
+    py benchmarks/bench_vector_backends.py [--k 4] [--queries 200] [--output results/bench_vector_backends.json]
+
+Requires an ingested Chroma collection; the NumPy index is exported from it
+if missing (or always, with --rebuild-index).
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "src"))
+
+from rag.embeddings import load_embeddings
+from rag.numpy_index import NumpyIndex, DB_DIR, NUMPY_INDEX_DIR
+
+
+def percentiles(samples_ms: list) -> dict:
+    arr = np.asarray(samples_ms, dtype=np.float64)
+    return {f"p{p}": round(float(np.percentile(arr, p)), 3) for p in (50, 95, 99)}
+
+
+def load_query_texts(n: int) -> list:
+    path = os.path.join(PROJECT_ROOT, "src", "eval", "test_questions.json")
+    with open(path, "r", encoding="utf-8") as f:
+        questions = [q["question"] for q in json.load(f)["questions"]]
+    # Repeat the benchmark questions to reach n queries
+    return [questions[i % len(questions)] for i in range(n)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Chroma vs NumPy vector backends")
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=200, help="Number of queries to time")
+    parser.add_argument("--dtype", choices=["float32", "float16"], default="float32")
+    parser.add_argument("--rebuild-index", action="store_true")
+    parser.add_argument("--output", default=os.path.join(PROJECT_ROOT, "results", "bench_vector_backends.json"))
+    args = parser.parse_args()
+
+    if args.rebuild_index or not NumpyIndex.exists(NUMPY_INDEX_DIR):
+        print("Exporting Chroma collection to NumPy index...")
+        NumpyIndex.from_chroma(DB_DIR, NUMPY_INDEX_DIR, dtype=args.dtype)
+
+    embeddings = load_embeddings()
+    # Embed once so both backends see identical query vectors
+    query_vectors = embeddings.embed_documents(load_query_texts(args.queries))
+
+    from langchain_chroma import Chroma
+
+    # ---- cold start ----
+    started = time.perf_counter()
+    chroma = Chroma(persist_directory=DB_DIR, embedding_function=embeddings)
+    chroma.similarity_search_by_vector_with_relevance_scores(query_vectors[0], k=args.k)
+    chroma_cold_ms = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    index = NumpyIndex(NUMPY_INDEX_DIR, embedding_function=embeddings)
+    index.search([query_vectors[0]], args.k)
+    numpy_cold_ms = (time.perf_counter() - started) * 1000
+
+    # ---- exact ground truth (float32, fully in memory) ----
+    exact_rows, _ = NumpyIndex(NUMPY_INDEX_DIR, mmap=False).search(query_vectors, args.k)
+    exact_ids = [[doc.id for doc in index.get_documents(rows)] for rows in exact_rows]
+
+    # ---- per-query latency ----
+    chroma_ms, chroma_ids = [], []
+    for vec in query_vectors:
+        started = time.perf_counter()
+        hits = chroma.similarity_search_by_vector_with_relevance_scores(vec, k=args.k)
+        chroma_ms.append((time.perf_counter() - started) * 1000)
+        chroma_ids.append([doc.id for doc, _ in hits])
+
+    numpy_ms, numpy_ids = [], []
+    for vec in query_vectors:
+        started = time.perf_counter()
+        rows, _ = index.search([vec], args.k)
+        docs = index.get_documents(rows[0])
+        numpy_ms.append((time.perf_counter() - started) * 1000)
+        numpy_ids.append([doc.id for doc in docs])
+
+    # ---- batched ----
+    started = time.perf_counter()
+    index.search(query_vectors, args.k)
+    numpy_batch_ms = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    chroma._collection.query(query_embeddings=query_vectors, n_results=args.k)
+    chroma_batch_ms = (time.perf_counter() - started) * 1000
+
+    def recall(found):
+        hits = sum(len(set(f) & set(e)) for f, e in zip(found, exact_ids))
+        total = sum(len(e) for e in exact_ids)
+        return round(hits / total, 4) if total else 0.0
+
+    results = {
+        "k": args.k,
+        "queries": len(query_vectors),
+        "chunks": len(index),
+        "numpy_dtype": str(index.vectors.dtype),
+        "numpy_index_mib": round(index.nbytes / (1024 * 1024), 2),
+        "chroma": {
+            "cold_start_ms": round(chroma_cold_ms, 2),
+            "query_latency_ms": percentiles(chroma_ms),
+            "batch_total_ms": round(chroma_batch_ms, 2),
+            "recall_at_k": recall(chroma_ids),
+        },
+        "numpy": {
+            "cold_start_ms": round(numpy_cold_ms, 2),
+            "query_latency_ms": percentiles(numpy_ms),
+            "batch_total_ms": round(numpy_batch_ms, 2),
+            "recall_at_k": recall(numpy_ids),
+        },
+    }
+
+    print(json.dumps(results, indent=2))
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""
+Model-free embeddings for the offline benchmarks
+
+bench_suite.py selects them with EMBEDDING_BACKEND=hashing_embeddings:HashingEmbeddings,
+an environment setting rather than a monkeypatch so that ingest worker
+processes load them too (they inherit sys.path, which includes this directory).
+"""
+import hashlib
+from typing import List
+
+from langchain_core.embeddings import Embeddings
+
+from rag.embeddings import normalize_text
+
+DIMENSIONS = 384
+BACKEND = f"{__name__}:HashingEmbeddings"
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Deterministic bag-of-words vectors via signed feature hashing.
+
+    Needs no model download, so ingestion and retrieval can be exercised (and
+    timed) offline; texts sharing words get similar vectors, but there is no
+    semantic matching beyond that. Output has the MiniLM dimensionality.
+    """
+
+    def __init__(self, dimensions: int = DIMENSIONS):
+        self.dimensions = dimensions
+
+    def _embed(self, text: str) -> List[float]:
+        vector = [0.0] * self.dimensions
+        for word in normalize_text(text).lower().split():
+            digest = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+            vector[digest % self.dimensions] += 1.0 if digest >> 63 else -1.0
+        norm = sum(v * v for v in vector) ** 0.5 or 1.0
+        return [v / norm for v in vector]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
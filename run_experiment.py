@@ -3,6 +3,10 @@
 RAG vs Pure Agent 实验主程序
 用于 Crypto 场景下比较两种 AI 系统的表现
 """
+import time
+
+_SCRIPT_START = time.perf_counter()
+
 import os
 import sys
 import json
@@ -14,7 +18,9 @@ sys.path.insert(0, os.path.join(PROJECT_ROOT, "src"))
 
 from agents.pure_agent import PureAgent
 from agents.rag_agent import RAGAgent
-from eval.evaluator import run_experiment
+from eval.evaluator import Evaluator, run_experiment, run_trials
+import resources
+from llm.streaming import BackgroundStream
 
 
 def main():
@@ -23,16 +29,62 @@ def main():
     parser.add_argument("--questions", type=str, help="自定义问题文件路径")
     parser.add_argument("--output", type=str, default="results/experiment_results.json", help="结果输出路径")
     parser.add_argument("--interactive", action="store_true", help="交互模式")
+    parser.add_argument("--corpus", type=str, help="与 --ingest 一起使用：摄入该目录下的所有 PDF/Markdown/HTML/文本文件")
+    parser.add_argument("--concurrency", type=int, default=1,
+                        help="同时处理的问题数（>1 时使用调度模式：异步接口并发调用、每题 Pure 与 RAG 并行，结果顺序不变）")
+    parser.add_argument("--serial", action="store_true", default=None,
+                        help="与 --concurrency 一起使用时仍用串行流程（每题 Pure -> RAG -> 评判），作为关键路径的对照基线")
+    parser.add_argument("--judge-batch", type=int, default=1,
+                        help="每次评判调用包含的题数（>1 时批量评判，回复中无效的题单独重评）")
+    parser.add_argument("--prejudge", type=float, metavar="THRESHOLD",
+                        help="启用本地预评判（与参考答案的语义相似度 + 词元 F1）：两者分差不小于阈值时不调用 LLM 评判")
+    parser.add_argument("--prejudge-calibrate", action="store_true",
+                        help="记录本地预评判指标但全部交给 LLM 评判，之后用 src/eval/prejudge.py 校准阈值")
+    parser.add_argument("--resume", action="store_true",
+                        help="断点续跑：跳过结果日志（--output 旁的 .jsonl）中已完成的题目 ID")
+    parser.add_argument("--log", type=str, help="逐题追加写入的 JSONL 结果日志路径（默认与 --output 同名的 .jsonl）")
+    parser.add_argument("--trials", type=int, default=1,
+                        help="多轮试验：每题最多重复运行的轮数（>1 时输出 bootstrap 置信区间）")
+    parser.add_argument("--min-trials", type=int, default=2, help="多轮试验至少运行的轮数，之后才检查是否提前停止")
+    parser.add_argument("--ci-tolerance", type=float, default=0.5,
+                        help="多轮试验提前停止的条件：平均得分与配对得分差的置信区间半宽（分）都不超过该值")
+    parser.add_argument("--resample-questions", action="store_true",
+                        help="bootstrap 时同时对题目重抽样（区间包含题目抽样的不确定性）")
+    parser.add_argument("--shard", type=str, metavar="i/N",
+                        help="只运行问题集的第 i 个分片（共 N 片，i 从 0 开始），之后用 src/eval/sharding.py merge 合并")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="在本机启动 N 个分片进程并行运行，完成后自动合并结果")
+    parser.add_argument("--metrics-file", type=str,
+                        help="各阶段耗时与 token 直方图的 Prometheus 文本文件（默认与 --output 同名的 .prom）")
+    parser.add_argument("--llm-cache", action="store_true",
+                        help="启用 LLM 响应磁盘缓存（等同 LLM_CACHE=1）：相同请求直接复用已保存的回答与评判")
+    parser.add_argument("--llm-backend", choices=["gemini", "stub"],
+                        help="LLM 后端（等同 LLM_BACKEND）：stub 为离线模拟后端，延迟与错误率由 LLM_STUB_* 环境变量配置")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="初始化模型、向量库并做一次检索后，打印导入与初始化耗时明细")
     
     args = parser.parse_args()
+
+    if args.llm_cache:
+        os.environ["LLM_CACHE"] = "1"
+    if args.llm_backend:
+        os.environ["LLM_BACKEND"] = args.llm_backend
     
     # 数据摄入
     if args.ingest:
         print("正在执行数据摄入...")
-        from rag.ingest import ingest_data
-        ingest_data()
+        if args.corpus:
+            from rag.ingest import ingest_corpus
+            ingest_corpus(args.corpus)
+        else:
+            from rag.ingest import ingest_data
+            ingest_data()
         print("数据摄入完成！")
     
+    if args.profile_startup:
+        profile_startup()
+        return
+
     # 交互模式
     if args.interactive:
         interactive_mode()
@@ -55,7 +107,65 @@ def main():
         os.makedirs(output_dir)
     
     # 运行实验
-    run_experiment(questions, args.output)
+    if args.workers > 1:
+        if args.shard or args.trials > 1:
+            parser.error("--workers 不能与 --shard、--trials 同时使用")
+        from eval.sharding import launch_local
+        try:
+            launch_local(args.workers, args.output, sys.argv[1:])
+        except RuntimeError as e:
+            print(f"分片运行失败: {e}（修复后加 --resume 重新运行可续跑）")
+            sys.exit(1)
+        return
+
+    shard = None
+    if args.shard:
+        from eval.sharding import parse_shard, shard_questions
+        try:
+            questions, shard = shard_questions(questions, *parse_shard(args.shard))
+        except ValueError as e:
+            parser.error(str(e))
+        print(f"分片 {args.shard}：{len(questions)} / {shard['total_questions']} 题")
+
+    if args.trials > 1:
+        if args.resume or args.prejudge_calibrate or shard:
+            parser.error("--trials 不支持 --resume、--prejudge-calibrate 与 --shard")
+        run_trials(questions, args.output, trials=args.trials, min_trials=args.min_trials,
+                   ci_tolerance=args.ci_tolerance, concurrency=args.concurrency, serial=args.serial,
+                   judge_batch_size=args.judge_batch, log_file=args.log, prejudge_threshold=args.prejudge,
+                   resample_questions=args.resample_questions, metrics_file=args.metrics_file)
+        return
+    run_experiment(questions, args.output, concurrency=args.concurrency, serial=args.serial,
+                   judge_batch_size=args.judge_batch, log_file=args.log, resume=args.resume,
+                   prejudge_threshold=args.prejudge, prejudge_calibrate=args.prejudge_calibrate, shard=shard,
+                   metrics_file=args.metrics_file, keep_questions=False)
+
+
+def profile_startup():
+    """构建所有共享资源（Gemini 模型、embedding 模型、向量库）并打印启动耗时明细"""
+    pure_agent = PureAgent()
+    rag_agent = RAGAgent()
+    evaluator = Evaluator()
+
+    # 三者共享同一个模型单例
+    pure_agent.model
+    rag_agent.model
+    evaluator.judge_model
+    # 触发 embedding 模型与向量库加载，并完成一次真实检索
+    rag_agent.retrieve_many(["What is Bitcoin's consensus mechanism?"])
+
+    resources.print_startup_report(time.perf_counter() - _SCRIPT_START)
+
+
+def print_stream(stream):
+    """边生成边打印流式回答，结束后打印首 token 延迟（TTFT）等指标"""
+    for chunk in stream:
+        print(chunk, end="", flush=True)
+    print()
+    if stream.error:
+        print(f"Error: {stream.error}")
+    metrics = stream.metrics
+    print(f"[TTFT {metrics['ttft_ms']} ms | 总耗时 {metrics['latency_ms']} ms | {metrics['chunks']} 个分块]")
 
 
 def interactive_mode():
@@ -78,18 +188,25 @@ def interactive_mode():
         if not question:
             continue
         
+        # 两个 Agent 同时开始生成（RAG 检索与 Pure 生成重叠），输出依次打印
+        started = time.perf_counter()
+        pure_stream = BackgroundStream(pure_agent.stream_query(question))
+        rag_stream = BackgroundStream(rag_agent.stream_query_with_reasoning(question))
+
         print("\n" + "-" * 40)
         print("【Pure Agent 回答】")
         print("-" * 40)
-        pure_answer = pure_agent.query(question)
-        print(pure_answer)
+        print_stream(pure_stream)
         
         print("\n" + "-" * 40)
         print("【RAG Agent 回答】")
         print("-" * 40)
-        rag_result = rag_agent.query_with_reasoning(question)
-        print(f"(检索到 {len(rag_result['retrieved_docs'])} 个相关片段)")
-        print(rag_result["full_response"])
+        print_stream(rag_stream)
+        print(f"(检索到 {len(rag_stream.result['retrieved_docs'])} 个相关片段，"
+              f"检索用时 {rag_stream.result['stream_metrics']['retrieval_ms']} ms)")
+        critical_ms = (time.perf_counter() - started) * 1000
+        serial_ms = pure_stream.metrics["latency_ms"] + rag_stream.metrics["latency_ms"]
+        print(f"[关键路径 {critical_ms:.0f} ms | 串行基线约 {serial_ms:.0f} ms]")
         
         print("\n")
 
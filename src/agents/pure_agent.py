@@ -3,27 +3,19 @@ Pure Agent - Relies entirely on model's own knowledge + reasoning chain
 Does not use any external knowledge base
 """
 import os
-import google.generativeai as genai
+import sys
 from dotenv import load_dotenv
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from llm import SAFETY_SETTINGS, agenerate, generate, reasoning_error
+from llm.streaming import TextStream, stream_generate
+from agents.singleflight import SingleFlight
+from instrumentation import component
+from resources import get_llm_client, require_api_key
+
 # Load environment variables
 load_dotenv()
 
-_CONFIGURED_API_KEY = None
-
-
-def _configure_genai() -> str:
-    api_key = os.getenv("GOOGLE_API_KEY")
-    if not api_key:
-        raise ValueError("GOOGLE_API_KEY environment variable not found. Please check your .env file")
-
-    global _CONFIGURED_API_KEY
-    if _CONFIGURED_API_KEY != api_key:
-        genai.configure(api_key=api_key)
-        _CONFIGURED_API_KEY = api_key
-
-    return api_key
-
 
 class PureAgent:
     """
@@ -31,13 +23,13 @@ class PureAgent:
     """
     
     def __init__(self, model_name: str = "gemini-2.5-flash"):
-        """Initialize the Pure Agent with Gemini model"""
-        _configure_genai()
-        try:
-            self.model = genai.GenerativeModel(model_name)
-        except Exception as e:
-            raise RuntimeError(f"Failed to initialize Gemini model: {e}")
-            
+        """Initialize the Pure Agent; the LLM client is shared and created on first use"""
+        require_api_key()
+        self.model_name = model_name
+        self._model = None
+        # Identical questions asked concurrently share one generate call
+        self.singleflight = SingleFlight()
+
         self.system_prompt = """You are an expert in cryptocurrency and blockchain technology.
 Please answer the following questions based on your knowledge.
 Requirements:
@@ -46,12 +38,25 @@ Requirements:
 3. Clearly state if you are uncertain
 """
     
+    @property
+    def model(self):
+        if self._model is None:
+            try:
+                self._model = get_llm_client(self.model_name)
+            except Exception as e:
+                raise RuntimeError(f"Failed to initialize Gemini model: {e}")
+        return self._model
+
+    @model.setter
+    def model(self, model):
+        self._model = model
+
     def query(self, question: str) -> str:
         """Query the model and return the answer"""
         full_prompt = f"{self.system_prompt}\n\nQuestion: {question}"
         
         try:
-            response = self.model.generate_content(full_prompt)
+            response = generate(self.model, full_prompt)
             return response.text
         except Exception as e:
             error_msg = str(e)
@@ -59,9 +64,14 @@ Requirements:
                 return f"Error: API key issue - {error_msg}. Please check your GOOGLE_API_KEY in .env file."
             return f"Error generating response: {error_msg}"
     
-    def query_with_reasoning(self, question: str) -> dict:
-        """Query with reasoning chain, returns detailed reasoning process"""
-        reasoning_prompt = f"""{self.system_prompt}
+    def stream_query(self, question: str) -> TextStream:
+        """Streaming variant of query: iterate for text chunks; stream.metrics holds TTFT/latency/chunks"""
+        full_prompt = f"{self.system_prompt}\n\nQuestion: {question}"
+        with component("pure_agent"):
+            return TextStream(stream_generate(self.model, full_prompt))
+
+    def _reasoning_prompt(self, question: str) -> str:
+        return f"""{self.system_prompt}
 
 Please answer the question following these steps:
 1. First analyze the key points of the question
@@ -84,29 +94,65 @@ Please respond in the following format:
 ## Final Answer
 [Your answer]
 """
-        # Safety settings to reduce blocking
-        safety_settings = [
-            {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
-            {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
-            {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
-            {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
-        ]
-        
-        try:
-            response = self.model.generate_content(reasoning_prompt, safety_settings=safety_settings)
-            full_response = response.text
-        except Exception as e:
-            error_msg = str(e)
-            if "API key" in error_msg or "PermissionDenied" in error_msg:
-                full_response = f"Error: API key issue - {error_msg}. Please update your GOOGLE_API_KEY."
-            else:
-                full_response = f"Error: Unable to generate response - {error_msg}"
-        
-        return {
+
+    @staticmethod
+    def _result(question: str, full_response: str, error: str = None) -> dict:
+        result = {
             "question": question,
             "full_response": full_response,
             "agent_type": "pure_agent"
         }
+        if error is not None:
+            # Failed calls are reported, not judged as answers
+            result["error"] = error
+        return result
+
+    def query_with_reasoning(self, question: str) -> dict:
+        """Query with reasoning chain, returns detailed reasoning process"""
+        with component("pure_agent"):
+            return self.singleflight.do(("reasoning", question), lambda: self._query_with_reasoning(question))
+
+    def _query_with_reasoning(self, question: str) -> dict:
+        try:
+            response = generate(self.model, self._reasoning_prompt(question), safety_settings=SAFETY_SETTINGS)
+            return self._result(question, response.text)
+        except Exception as e:
+            return self._result(question, reasoning_error(e), str(e))
+
+    async def aquery_with_reasoning(self, question: str) -> dict:
+        """Async variant of query_with_reasoning using the async generate API"""
+        with component("pure_agent"):
+            return await self.singleflight.ado(("reasoning", question), lambda: self._aquery_with_reasoning(question))
+
+    async def _aquery_with_reasoning(self, question: str) -> dict:
+        try:
+            response = await agenerate(self.model, self._reasoning_prompt(question), safety_settings=SAFETY_SETTINGS)
+            return self._result(question, response.text)
+        except Exception as e:
+            return self._result(question, reasoning_error(e), str(e))
+
+    def stream_query_with_reasoning(self, question: str) -> TextStream:
+        """
+        Streaming variant of query_with_reasoning.
+
+        Iterate the returned stream for text chunks; afterwards stream.result is
+        the usual result dict plus "stream_metrics" (TTFT, total latency, chunk
+        count, whether it was served from the response cache).
+        """
+        meta = {}
+
+        def finalize(stream: TextStream) -> dict:
+            if stream.error is not None:
+                result = self._result(question, reasoning_error(stream.error), stream.error)
+            else:
+                result = self._result(question, stream.text)
+            result["stream_metrics"] = {**stream.metrics, "cached": meta.get("cached", False)}
+            return result
+
+        chunks = stream_generate(self.model, self._reasoning_prompt(question), meta=meta,
+                                 safety_settings=SAFETY_SETTINGS)
+        with component("pure_agent"):
+            return TextStream(chunks, finalize)
 
 
 if __name__ == "__main__":
@@ -3,32 +3,46 @@ RAG Agent - Combines vector retrieval with Gemini model generation
 Uses local HuggingFace embeddings and Chroma vector database
 """
 import os
-import google.generativeai as genai
-from langchain_chroma import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
+import sys
+import time
+import asyncio
+import contextvars
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from llm import SAFETY_SETTINGS, agenerate, estimate_tokens, generate, reasoning_error
+from llm.streaming import TextStream, stream_generate
+from agents.singleflight import SingleFlight
+from instrumentation import component, span
+from resources import get_embeddings, get_llm_client, get_lexical_index, get_vectorstore, require_api_key
+from rag.context import ContextAssembler, DEFAULT_TOKEN_BUDGET
+
 # Load environment variables
 load_dotenv()
 
 # Path configuration - use abspath to ensure correct paths
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 DB_DIR = os.path.join(PROJECT_ROOT, "chroma_db")
+NUMPY_INDEX_DIR = os.path.join(DB_DIR, "numpy_index")
+BM25_DIR = os.path.join(DB_DIR, "bm25")
 
-_CONFIGURED_API_KEY = None
-
+# Vector store backends: "chroma" (default) or "numpy" (memory-mapped exact index)
+VECTOR_BACKENDS = ("chroma", "numpy")
 
-def _configure_genai() -> str:
-    api_key = os.getenv("GOOGLE_API_KEY")
-    if not api_key:
-        raise ValueError("GOOGLE_API_KEY environment variable not found. Please check your .env file")
+# Hybrid retrieval fuses this many candidates per list: max(k * factor, minimum)
+HYBRID_DEPTH_FACTOR = 5
+HYBRID_MIN_DEPTH = 20
 
-    global _CONFIGURED_API_KEY
-    if _CONFIGURED_API_KEY != api_key:
-        genai.configure(api_key=api_key)
-        _CONFIGURED_API_KEY = api_key
 
-    return api_key
+def _distance_to_similarity(distance: float, space: str) -> float:
+    """Convert a Chroma distance into cosine similarity (embeddings are unit length)"""
+    # "cosine" reports 1 - cos and "ip" reports 1 - dot, which is the same for unit vectors
+    if space in ("cosine", "ip"):
+        return 1.0 - distance
+    # Chroma's "l2" space reports squared euclidean distance
+    return 1.0 - distance / 2.0
 
 
 class RAGAgent:
@@ -36,31 +50,67 @@ class RAGAgent:
     RAG Agent: Combines vector retrieval + Gemini model for answer generation
     """
     
-    def __init__(self, model_name: str = "gemini-2.5-flash"):
-        """Initialize the RAG Agent with Gemini model and vector store"""
-        _configure_genai()
-        try:
-            self.model = genai.GenerativeModel(model_name)
-        except Exception as e:
-            raise RuntimeError(f"Failed to initialize Gemini model: {e}")
-
-        self.embeddings = None
-
-        # Load vector database
-        if os.path.exists(DB_DIR):
-            # Use local HuggingFace embeddings (same model as ingest)
-            self.embeddings = HuggingFaceEmbeddings(
-                model_name="sentence-transformers/all-MiniLM-L6-v2",
-                model_kwargs={'device': 'cpu'}
-            )
-            self.vectorstore = Chroma(
-                persist_directory=DB_DIR,
-                embedding_function=self.embeddings
-            )
+    def __init__(self, model_name: str = "gemini-2.5-flash", backend: str = None, hybrid: bool = None,
+                 context_token_budget: int = None, require_llm: bool = True):
+        """
+        Initialize the RAG Agent with Gemini model and vector store
+
+        Args:
+            model_name: Gemini model name
+            backend: Vector store backend, "chroma" or "numpy"
+                (defaults to the RAG_VECTOR_BACKEND environment variable, else "chroma")
+            hybrid: Fuse BM25 and dense results with reciprocal rank fusion
+                (defaults to the RAG_HYBRID environment variable)
+            context_token_budget: Maximum estimated tokens of retrieved context
+                (defaults to RAG_CONTEXT_TOKENS, else DEFAULT_TOKEN_BUDGET)
+            require_llm: Check for an API key up front; pass False for
+                retrieval-only use (e.g. eval/retrieval_eval.py)
+        """
+        if require_llm:
+            require_api_key()
+        self.model_name = model_name
+        self._model = None
+
+        self.backend = (backend or os.getenv("RAG_VECTOR_BACKEND") or "chroma").lower()
+        if self.backend not in VECTOR_BACKENDS:
+            raise ValueError(f"Unknown vector backend '{self.backend}', expected one of {VECTOR_BACKENDS}")
+
+        # The embedding model, vector store and BM25 index are shared across agents
+        # and only loaded on first retrieval; here we just check they exist on disk.
+        self._embeddings = None
+        self._vectorstore = None
+        self._lexical_index = None
+        self._executor = None
+        # Identical in-flight retrievals / questions share one embed, search and generate
+        self.singleflight = SingleFlight()
+
+        if self.backend == "numpy":
+            from rag.numpy_index import NumpyIndex
+            self.store_path = NUMPY_INDEX_DIR
+            self.store_available = NumpyIndex.exists(NUMPY_INDEX_DIR)
+            if not self.store_available:
+                print(f"Warning: NumPy index not found at {NUMPY_INDEX_DIR}. "
+                      f"Please run ingest.py --numpy-index first.")
         else:
-            self.vectorstore = None
-            print(f"Warning: Vector database not found at {DB_DIR}. Please run ingest.py first.")
-        
+            self.store_path = DB_DIR
+            self.store_available = os.path.exists(DB_DIR)
+            if not self.store_available:
+                print(f"Warning: Vector database not found at {DB_DIR}. Please run ingest.py first.")
+
+        if hybrid is None:
+            hybrid = os.getenv("RAG_HYBRID", "0").lower() in ("1", "true", "yes")
+        self.hybrid = bool(hybrid and self.store_available)
+        if self.hybrid:
+            from rag.bm25 import BM25Index
+            if not BM25Index.exists(BM25_DIR):
+                print(f"Warning: BM25 index not found at {BM25_DIR}; using dense retrieval only. "
+                      f"Re-run ingest.py to build it.")
+                self.hybrid = False
+
+        if context_token_budget is None:
+            context_token_budget = int(os.getenv("RAG_CONTEXT_TOKENS", DEFAULT_TOKEN_BUDGET))
+        self.context_assembler = ContextAssembler(token_budget=context_token_budget)
+
         self.system_prompt = """You are an expert in cryptocurrency and blockchain technology.
 Please answer questions based on the provided reference materials.
 Requirements:
@@ -70,27 +120,165 @@ Requirements:
 4. Clearly distinguish between information from references and your inferences
 """
     
+    @property
+    def model(self):
+        if self._model is None:
+            try:
+                self._model = get_llm_client(self.model_name)
+            except Exception as e:
+                raise RuntimeError(f"Failed to initialize Gemini model: {e}")
+        return self._model
+
+    @model.setter
+    def model(self, model):
+        self._model = model
+
+    @property
+    def embeddings(self):
+        if self._embeddings is None and self.store_available:
+            # Local HuggingFace embeddings (same model and cache as ingest)
+            self._embeddings = get_embeddings()
+        return self._embeddings
+
+    @property
+    def vectorstore(self):
+        if self._vectorstore is None and self.store_available:
+            self._vectorstore = get_vectorstore(self.backend, self.store_path, self.embeddings)
+        return self._vectorstore
+
+    @property
+    def lexical_index(self):
+        if self._lexical_index is None and self.hybrid:
+            self._lexical_index = get_lexical_index(BM25_DIR)
+            self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="rag-retrieve")
+        return self._lexical_index
+
     def retrieve(self, query: str, k: int = 4) -> list:
         """Retrieve relevant documents from vector database"""
+        with component("rag_agent"):
+            return self.singleflight.do(("retrieve", query, k), lambda: self._retrieve(query, k))
+
+    def _retrieve(self, query: str, k: int) -> list:
         if self.vectorstore is None:
             return []
-        
-        docs = self.vectorstore.similarity_search(query, k=k)
-        return docs
+
+        if self.lexical_index is not None:
+            return [doc for doc, _ in self._hybrid_search(query, k)]
+
+        with span("embed_query", queries=1):
+            vector = self.embeddings.embed_query(query)
+        with span("vector_search", queries=1, k=k):
+            return [doc for doc, _ in self._search_by_vectors([vector], k)[0]]
+
+    def _lexical_search(self, query: str, depth: int) -> list:
+        with span("lexical_search", k=depth):
+            return self.lexical_index.search(query, depth)
+
+    def _hybrid_search(self, query: str, k: int, dense: list = None) -> list:
+        """
+        BM25 + dense retrieval merged with reciprocal rank fusion.
+
+        Both searches run in parallel over a deeper candidate list than k.
+        Returns (Document, rrf_score) pairs, best first.
+        """
+        from rag.bm25 import reciprocal_rank_fusion
+
+        depth = max(k * HYBRID_DEPTH_FACTOR, HYBRID_MIN_DEPTH)
+        # copy_context keeps the worker's span in the caller's trace
+        lexical_future = self._executor.submit(contextvars.copy_context().run, self._lexical_search, query, depth)
+        if dense is None:
+            with span("embed_query", queries=1):
+                vector = self.embeddings.embed_query(query)
+            with span("vector_search", queries=1, k=depth):
+                dense = self._search_by_vectors([vector], depth)[0]
+        lexical = lexical_future.result()
+
+        docs_by_id = {}
+        dense_ids = []
+        for doc, _ in dense:
+            chunk_id = doc.id or doc.metadata.get("chunk_id")
+            docs_by_id[chunk_id] = doc
+            dense_ids.append(chunk_id)
+
+        fused = reciprocal_rank_fusion([dense_ids, [chunk_id for chunk_id, _ in lexical]])[:k]
+        missing = [chunk_id for chunk_id, _ in fused if chunk_id not in docs_by_id]
+        if missing:
+            for doc in self.vectorstore.get_by_ids(missing):
+                docs_by_id[doc.id or doc.metadata.get("chunk_id")] = doc
+        return [(docs_by_id[chunk_id], score) for chunk_id, score in fused if chunk_id in docs_by_id]
+
+    def retrieve_many(self, queries: list, k: int = 4) -> list:
+        """
+        Batched retrieval: embed all queries in one call and search them together
+
+        Returns:
+            One list of (Document, score) pairs per query, best first.
+            Scores are cosine similarities for both backends, or fused
+            reciprocal-rank scores in hybrid mode.
+        """
+        if self.vectorstore is None or not queries:
+            return [[] for _ in queries]
+
+        # Duplicate queries in the batch are embedded and searched once
+        unique = list(dict.fromkeys(queries))
+        self.singleflight.record(len(queries), len(queries) - len(unique))
+
+        with component("rag_agent"):
+            with span("embed_query", queries=len(unique)):
+                vectors = self.embeddings.embed_documents(unique)
+            if self.lexical_index is not None:
+                depth = max(k * HYBRID_DEPTH_FACTOR, HYBRID_MIN_DEPTH)
+                with span("vector_search", queries=len(unique), k=depth):
+                    dense = self._search_by_vectors(vectors, depth)
+                results = [self._hybrid_search(q, k, dense=d) for q, d in zip(unique, dense)]
+            else:
+                with span("vector_search", queries=len(unique), k=k):
+                    results = self._search_by_vectors(vectors, k)
+
+        by_query = dict(zip(unique, results))
+        return [list(by_query[q]) for q in queries]
+
+    def _search_by_vectors(self, vectors: list, k: int) -> list:
+        """Nearest-neighbour search for a batch of query vectors on either backend"""
+        if self.backend == "numpy":
+            rows, scores = self.vectorstore.search(vectors, k)
+            return [
+                list(zip(self.vectorstore.get_documents(row), score.tolist()))
+                for row, score in zip(rows, scores)
+            ]
+
+        from langchain_core.documents import Document
+
+        collection = self.vectorstore._collection
+        result = collection.query(
+            query_embeddings=vectors,
+            n_results=k,
+            include=["documents", "metadatas", "distances"],
+        )
+        space = (collection.metadata or {}).get("hnsw:space", "l2")
+        batches = []
+        for ids, texts, metadatas, distances in zip(
+            result["ids"], result["documents"], result["metadatas"], result["distances"]
+        ):
+            batches.append([
+                (Document(page_content=text, metadata=metadata or {}, id=chunk_id),
+                 _distance_to_similarity(distance, space))
+                for chunk_id, text, metadata, distance in zip(ids, texts, metadatas, distances)
+            ])
+        return batches
+
+    def embedding_cache_stats(self) -> dict:
+        """Hit/miss counts of the embedding cache, or None when it is not in use"""
+        if self._embeddings is None or not hasattr(self._embeddings, "stats"):
+            return None
+        return self._embeddings.stats()
     
-    def query(self, question: str) -> str:
-        """RAG query: retrieve + generate"""
-        # 1. Retrieve relevant documents
-        retrieved_docs = self.retrieve(question)
-        
-        # 2. Build context
-        context = "\n\n".join([
-            f"[Source: {doc.metadata.get('source', 'unknown')}]\n{doc.page_content}"
-            for doc in retrieved_docs
-        ])
-        
-        # 3. Build prompt
-        full_prompt = f"""{self.system_prompt}
+    def build_context(self, retrieved_docs: list, scores: list = None):
+        """Merge overlapping chunks, drop near-duplicates and fit the token budget"""
+        return self.context_assembler.assemble(retrieved_docs, scores)
+
+    def _query_prompt(self, question: str, context: str) -> str:
+        return f"""{self.system_prompt}
 
 ## Reference Materials
 {context if context else "No reference materials available"}
@@ -99,9 +287,34 @@ Requirements:
 {question}
 
 Please answer based on the above reference materials:"""
-        
+
+    @staticmethod
+    def _context_stats(current, packed, prompt: str) -> dict:
+        """Packing stats plus the prompt's token estimate, also set on the context_build span"""
+        context_stats = dict(packed.stats)
+        context_stats["prompt_tokens_estimated"] = estimate_tokens(prompt)
+        current.set(
+            prompt_chars=len(prompt),
+            prompt_tokens_estimated=context_stats["prompt_tokens_estimated"],
+            tokens_saved=context_stats["tokens_saved"],
+        )
+        return context_stats
+
+    def _prepare_query(self, question: str) -> str:
+        """Retrieve, pack the context and build the plain query prompt"""
+        retrieved_docs = self.retrieve(question)
+        with component("rag_agent"), span("context_build", docs=len(retrieved_docs)) as current:
+            packed = self.build_context(retrieved_docs)
+            prompt = self._query_prompt(question, packed.text)
+            self._context_stats(current, packed, prompt)
+        return prompt
+
+    def query(self, question: str) -> str:
+        """RAG query: retrieve + generate"""
+        full_prompt = self._prepare_query(question)
+
         try:
-            response = self.model.generate_content(full_prompt)
+            response = generate(self.model, full_prompt)
             return response.text
         except Exception as e:
             error_msg = str(e)
@@ -109,19 +322,21 @@ Please answer based on the above reference materials:"""
                 return f"Error: API key issue - {error_msg}. Please check your GOOGLE_API_KEY in .env file."
             return f"Error generating response: {error_msg}"
     
-    def query_with_reasoning(self, question: str) -> dict:
-        """RAG query with reasoning chain, returns detailed information"""
-        # 1. Retrieve
-        retrieved_docs = self.retrieve(question)
-        
-        # 2. Build context
-        context = "\n\n".join([
-            f"[Source: {doc.metadata.get('source', 'unknown')}]\n{doc.page_content}"
-            for doc in retrieved_docs
-        ])
-        
-        # 3. Prompt with reasoning
-        reasoning_prompt = f"""{self.system_prompt}
+    def stream_query(self, question: str) -> TextStream:
+        """
+        Streaming variant of query: iterate for text chunks as they arrive.
+
+        Retrieval runs when iteration starts, so stream.metrics["ttft_ms"]
+        includes it, as a user would experience.
+        """
+        def chunks():
+            yield from stream_generate(self.model, self._prepare_query(question))
+
+        with component("rag_agent"):
+            return TextStream(chunks())
+
+    def _reasoning_prompt(self, question: str, context: str) -> str:
+        return f"""{self.system_prompt}
 
 ## Reference Materials
 {context if context else "No reference materials available"}
@@ -147,36 +362,126 @@ Please respond in the following format:
 ## Final Answer
 [Your answer]
 """
-        # Safety settings to reduce blocking
-        safety_settings = [
-            {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
-            {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
-            {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
-            {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
-        ]
-
-        full_response = ""
-        try:
-            response = self.model.generate_content(reasoning_prompt, safety_settings=safety_settings)
-            full_response = response.text
-        except Exception as e:
-            error_msg = str(e)
-            if "API key" in error_msg or "PermissionDenied" in error_msg:
-                full_response = f"Error: API key issue - {error_msg}. Please update your GOOGLE_API_KEY."
-            else:
-                full_response = f"Error: Unable to generate response - {error_msg}"
 
-        return {
+    def _prepare(self, question: str, prefetched: list = None) -> tuple:
+        """Retrieve (unless prefetched), pack the context and build the reasoning prompt"""
+        if prefetched is not None:
+            retrieved_docs = [doc for doc, _ in prefetched]
+            scores = [score for _, score in prefetched]
+        else:
+            retrieved_docs = self.retrieve(question)
+            scores = [None] * len(retrieved_docs)
+
+        with span("context_build", docs=len(retrieved_docs)) as current:
+            packed = self.build_context(retrieved_docs, scores)
+            prompt = self._reasoning_prompt(question, packed.text)
+            context_stats = self._context_stats(current, packed, prompt)
+        return retrieved_docs, scores, context_stats, prompt
+
+    @staticmethod
+    def _result(question: str, retrieved_docs: list, scores: list, context_stats: dict,
+                full_response: str, response=None, error: str = None) -> dict:
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None and getattr(usage, "prompt_token_count", None):
+            context_stats["prompt_tokens"] = usage.prompt_token_count
+
+        result = {
             "question": question,
             "retrieved_docs": [
                 {
                     "content": doc.page_content[:500],
-                    "source": doc.metadata.get("source", "unknown")
-                } for doc in retrieved_docs
+                    "source": doc.metadata.get("source", "unknown"),
+                    **({"score": round(score, 4)} if score is not None else {})
+                } for doc, score in zip(retrieved_docs, scores)
             ],
+            "context_stats": context_stats,
             "full_response": full_response,
             "agent_type": "rag_agent"
         }
+        if error is not None:
+            # Failed calls are reported, not judged as answers
+            result["error"] = error
+        return result
+
+    def query_with_reasoning(self, question: str, prefetched: list = None) -> dict:
+        """
+        RAG query with reasoning chain, returns detailed information
+
+        Args:
+            question: The question to answer
+            prefetched: (Document, score) pairs from retrieve_many; skips retrieval when given
+        """
+        key = ("reasoning", question, prefetched is not None)
+        with component("rag_agent"):
+            return self.singleflight.do(key, lambda: self._query_with_reasoning(question, prefetched))
+
+    def _query_with_reasoning(self, question: str, prefetched: list = None) -> dict:
+        retrieved_docs, scores, context_stats, prompt = self._prepare(question, prefetched)
+
+        try:
+            response = generate(self.model, prompt, safety_settings=SAFETY_SETTINGS)
+            return self._result(question, retrieved_docs, scores, context_stats, response.text, response)
+        except Exception as e:
+            return self._result(question, retrieved_docs, scores, context_stats, reasoning_error(e), error=str(e))
+
+    async def aquery_with_reasoning(self, question: str, prefetched: list = None) -> dict:
+        """
+        Async variant of query_with_reasoning using the async generate API.
+
+        Retrieval (local embedding + search) is CPU-bound and runs in a worker
+        thread when the documents are not prefetched.
+        """
+        key = ("reasoning", question, prefetched is not None)
+        with component("rag_agent"):
+            return await self.singleflight.ado(key, lambda: self._aquery_with_reasoning(question, prefetched))
+
+    async def _aquery_with_reasoning(self, question: str, prefetched: list = None) -> dict:
+        if prefetched is None:
+            retrieved_docs, scores, context_stats, prompt = await asyncio.to_thread(self._prepare, question)
+        else:
+            retrieved_docs, scores, context_stats, prompt = self._prepare(question, prefetched)
+
+        try:
+            response = await agenerate(self.model, prompt, safety_settings=SAFETY_SETTINGS)
+            return self._result(question, retrieved_docs, scores, context_stats, response.text, response)
+        except Exception as e:
+            return self._result(question, retrieved_docs, scores, context_stats, reasoning_error(e), error=str(e))
+
+    def stream_query_with_reasoning(self, question: str, prefetched: list = None) -> TextStream:
+        """
+        Streaming variant of query_with_reasoning.
+
+        Iterate the returned stream for text chunks; afterwards stream.result is
+        the usual result dict plus "stream_metrics" (TTFT, total latency, chunk
+        count, retrieval time, whether it was served from the response cache).
+        """
+        prepared = {}
+        meta = {}
+
+        def chunks():
+            started = time.perf_counter()
+            prepared["values"] = self._prepare(question, prefetched)
+            prepared["retrieval_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            prompt = prepared["values"][3]
+            yield from stream_generate(self.model, prompt, meta=meta, safety_settings=SAFETY_SETTINGS)
+
+        def finalize(stream: TextStream) -> dict:
+            retrieved_docs, scores, context_stats, _ = prepared.get("values", ([], [], {}, None))
+            response = SimpleNamespace(usage_metadata=meta.get("usage_metadata"))
+            if stream.error is not None:
+                result = self._result(question, retrieved_docs, scores, context_stats,
+                                      reasoning_error(stream.error), error=stream.error)
+            else:
+                result = self._result(question, retrieved_docs, scores, context_stats, stream.text, response)
+            result["stream_metrics"] = {
+                **stream.metrics,
+                "retrieval_ms": prepared.get("retrieval_ms"),
+                "cached": meta.get("cached", False),
+            }
+            return result
+
+        with component("rag_agent"):
+            return TextStream(chunks(), finalize)
 
 
 if __name__ == "__main__":
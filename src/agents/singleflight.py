@@ -0,0 +1,130 @@
+"""
+Single-flight - coalesce identical in-flight requests
+
+When the same question arrives several times at once (repeated trials,
+duplicated dataset rows, two interactive callers), only the first caller
+runs the retrieval / generation; the others wait for it and receive a copy
+of its result. Once a call has finished the key is free again, so this is
+not a cache: a later identical request runs anew (the LLM response cache
+covers that case).
+
+Blocking callers coalesce across threads (do); async callers coalesce
+within one event loop (ado).
+"""
+import copy
+import asyncio
+import threading
+from typing import Awaitable, Callable, Hashable
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Args:
+        clone: Applied to the shared result for every coalesced caller, so
+            callers can mutate what they receive (deep copy by default)
+    """
+
+    def __init__(self, clone: Callable = copy.deepcopy):
+        self.clone = clone
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._futures = {}
+        self.counters = {"calls": 0, "coalesced": 0}
+
+    def record(self, calls: int, coalesced: int) -> None:
+        """Count requests that were de-duplicated outside do/ado (e.g. inside one batch)"""
+        with self._lock:
+            self.counters["calls"] += calls
+            self.counters["coalesced"] += coalesced
+
+    def do(self, key: Hashable, fn: Callable):
+        """Run fn() unless an identical call is in flight on another thread; then share its outcome"""
+        with self._lock:
+            self.counters["calls"] += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.counters["coalesced"] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return self.clone(call.result)
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    async def ado(self, key: Hashable, fn: Callable[[], Awaitable]):
+        """
+        Async variant of do: await fn() unless an identical call is in flight on this event loop
+
+        If the leading caller is cancelled, its waiters are not: one of them
+        takes over and runs fn() itself, the others wait for it.
+        """
+        loop = asyncio.get_running_loop()
+        slot = (loop, key)
+        retry = False
+        while True:
+            with self._lock:
+                future = self._futures.get(slot)
+                leader = future is None
+                if leader:
+                    future = self._futures[slot] = loop.create_future()
+                if not retry:
+                    self.counters["calls"] += 1
+                    if not leader:
+                        self.counters["coalesced"] += 1
+                elif leader:
+                    # A waiter taking over from a cancelled leader executes after all
+                    self.counters["coalesced"] -= 1
+
+            if leader:
+                break
+            try:
+                return self.clone(await asyncio.shield(future))
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    # This waiter itself was cancelled
+                    raise
+                retry = True
+
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved in case nobody else was waiting
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._futures[slot]
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.counters)
+        stats["executed"] = stats["calls"] - stats["coalesced"]
+        return stats
@@ -0,0 +1,111 @@
+"""
+多轮试验的 bootstrap 置信区间
+
+每题重复运行多轮后，得分组成 [题目, 轮次] 矩阵（未计分或未运行的轮次为 NaN）。
+统计量先按题对各轮取平均，再对题目取平均，使每题权重相同：
+    pure_score / rag_score   两个 Agent 的平均得分
+    score_diff               配对得分差（同一题同一轮的 rag - pure）
+    rag_win_rate / pure_win_rate  胜率（0-1，平局不计入任何一方）
+
+默认在每题内部对轮次有放回重抽样（题目集固定，区间反映 LLM 回答与评判的随机性，
+轮数越多区间越窄）；resample_questions=True 时同时对题目重抽样（两层 bootstrap，
+区间还包含题目抽样的不确定性，题目少时不会随轮数增加而明显收窄）。
+全部重抽样以 NumPy 花式索引一次完成（按块处理以限制内存），不逐次循环。
+"""
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+METRICS = ("pure_score", "rag_score", "score_diff", "rag_win_rate", "pure_win_rate")
+# 提前停止只看得分类区间（单位为分）；胜率区间仅报告
+STOP_METRICS = ("pure_score", "rag_score", "score_diff")
+DEFAULT_RESAMPLES = 2000
+DEFAULT_CONFIDENCE = 0.95
+# 单块重抽样张量的元素上限（约 64 MB float64）
+_MAX_BLOCK_ELEMENTS = 8_000_000
+
+
+def score_matrices(pure: np.ndarray, rag: np.ndarray, winners: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    由逐题逐轮的得分与胜者得到各统计量的 [题目, 轮次] 矩阵
+
+    Args:
+        pure, rag: 得分矩阵，缺失为 NaN
+        winners: 胜者矩阵（"pure_agent" / "rag_agent" / "tie"，缺失为空字符串）
+    """
+    missing = np.isnan(pure) | np.isnan(rag)
+    return {
+        "pure_score": pure,
+        "rag_score": rag,
+        "score_diff": rag - pure,
+        "rag_win_rate": np.where(missing, np.nan, (winners == "rag_agent").astype(np.float64)),
+        "pure_win_rate": np.where(missing, np.nan, (winners == "pure_agent").astype(np.float64)),
+    }
+
+
+def _grand_mean(values: np.ndarray) -> np.ndarray:
+    """[..., 题目, 轮次] -> [...]：先按题平均再对有数据的题平均（忽略 NaN）"""
+    valid = ~np.isnan(values)
+    per_question_n = valid.sum(axis=-1)
+    per_question = np.where(valid, values, 0.0).sum(axis=-1) / np.maximum(per_question_n, 1)
+    has_data = per_question_n > 0
+    return (per_question * has_data).sum(axis=-1) / np.maximum(has_data.sum(axis=-1), 1)
+
+
+def bootstrap_intervals(matrices: Dict[str, np.ndarray], n_resamples: int = DEFAULT_RESAMPLES,
+                        confidence: float = DEFAULT_CONFIDENCE, resample_questions: bool = False,
+                        seed: int = 0) -> Dict[str, Dict]:
+    """
+    Args:
+        matrices: {统计量: [题目, 轮次] 矩阵}，各矩阵形状相同
+        n_resamples: 重抽样次数
+        confidence: 置信水平（百分位区间）
+        resample_questions: 同时对题目重抽样
+        seed: 随机种子（结果可复现）
+
+    Returns:
+        {统计量: {"mean", "ci_low", "ci_high", "half_width"}}
+    """
+    names = list(matrices)
+    stacked = np.stack([np.asarray(matrices[name], dtype=np.float64) for name in names])
+    _, n_questions, n_trials = stacked.shape
+    rng = np.random.default_rng(seed)
+
+    estimates = []
+    block = max(1, _MAX_BLOCK_ELEMENTS // max(1, len(names) * n_questions * n_trials))
+    for start in range(0, n_resamples, block):
+        size = min(block, n_resamples - start)
+        if resample_questions:
+            question_idx = rng.integers(0, n_questions, size=(size, n_questions))
+        else:
+            question_idx = np.broadcast_to(np.arange(n_questions), (size, n_questions))
+        trial_idx = rng.integers(0, n_trials, size=(size, n_questions, n_trials))
+        # [统计量, 重抽样, 题目, 轮次]
+        resampled = stacked[:, question_idx[:, :, None], trial_idx]
+        estimates.append(_grand_mean(resampled))
+    estimates = np.concatenate(estimates, axis=1)
+
+    alpha = (1.0 - confidence) / 2
+    lows, highs = np.quantile(estimates, [alpha, 1.0 - alpha], axis=1)
+    means = _grand_mean(stacked)
+    return {
+        name: {
+            "mean": round(float(means[i]), 4),
+            "ci_low": round(float(lows[i]), 4),
+            "ci_high": round(float(highs[i]), 4),
+            "half_width": round(float(highs[i] - lows[i]) / 2, 4),
+        } for i, name in enumerate(names)
+    }
+
+
+def converged(intervals: Dict[str, Dict], tolerance: float, metrics: Sequence[str] = STOP_METRICS) -> bool:
+    """所有 metrics 的区间半宽都不超过 tolerance"""
+    return all(intervals[name]["half_width"] <= tolerance for name in metrics)
+
+
+def format_intervals(intervals: Dict[str, Dict], confidence: float = DEFAULT_CONFIDENCE) -> List[str]:
+    lines = []
+    for name, ci in intervals.items():
+        lines.append(f"  {name:<14} {ci['mean']:>8.3f}  {confidence:.0%} CI [{ci['ci_low']:.3f}, {ci['ci_high']:.3f}]"
+                     f"  ±{ci['half_width']:.3f}")
+    return lines
@@ -4,20 +4,42 @@
 import json
 import os
 import time
+import asyncio
 from datetime import datetime
-from typing import List, Dict
-import google.generativeai as genai
+from typing import Callable, List, Dict
+import numpy as np
 from dotenv import load_dotenv
 
 load_dotenv()
 
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
-
 # 导入 agents
 import sys
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 from agents.pure_agent import PureAgent
 from agents.rag_agent import RAGAgent
+from agents.singleflight import SingleFlight
+from llm import agenerate, cache_namespace, generate
+from instrumentation import component, current_trace, span, trace
+from resources import get_embeddings, get_llm_client, get_rate_limiter, get_response_cache, get_span_metrics
+from eval.scheduler import QuestionScheduler, timing_record
+from eval.bootstrap import (
+    DEFAULT_CONFIDENCE, DEFAULT_RESAMPLES, bootstrap_intervals, converged, format_intervals, score_matrices
+)
+from eval.results_log import (IncrementalSummary, ResultsLog, assign_ids, build_artifact, default_log_path,
+                              iter_ordered)
+
+WINNERS = ("pure_agent", "rag_agent", "tie")
+
+
+def _unscored(error: str) -> Dict:
+    """调用失败（重试后仍失败）的题目不计分，只记录错误"""
+    return {"scored": False, "winner": None, "error": error}
+
+
+def _agent_failure(pure_result: Dict, rag_result: Dict) -> Dict:
+    """任一 Agent 调用失败时返回不计分的比较结果，否则返回 None"""
+    errors = [f"{r['agent_type']}: {r['error']}" for r in (pure_result, rag_result) if r.get("error")]
+    return _unscored("; ".join(errors)) if errors else None
 
 
 class Evaluator:
@@ -25,8 +47,29 @@ class Evaluator:
     评测器：使用 LLM 作为评判来评估回答质量
     """
     
-    def __init__(self, model_name: str = "gemini-2.5-flash"):
-        self.judge_model = genai.GenerativeModel(model_name)
+    def __init__(self, model_name: str = "gemini-2.5-flash", prejudge=None):
+        """
+        Args:
+            prejudge: 可选的 eval.prejudge.PreJudge；有参考答案且本地分差足够大的题目不再调用 LLM 评判
+        """
+        self.model_name = model_name
+        self._judge_model = None
+        self.prejudge = prejudge
+        # 相同的评判请求（重复题目且回答相同）同时进行时只调用一次
+        self.singleflight = SingleFlight()
+        # 批量评判统计：批次数、批内题数、需要单独重新评判的题数
+        self.batch_stats = {"batches": 0, "batched_items": 0, "rejudged": 0}
+
+    @property
+    def judge_model(self):
+        # 与 Agent 共享同一个 LLM 客户端单例，首次评估时才创建
+        if self._judge_model is None:
+            self._judge_model = get_llm_client(self.model_name)
+        return self._judge_model
+
+    @judge_model.setter
+    def judge_model(self, model):
+        self._judge_model = model
     
     def evaluate_single(self, question: str, answer: str, reference: str = None) -> Dict:
         """
@@ -60,7 +103,7 @@ class Evaluator:
 """
         
         try:
-            response = self.judge_model.generate_content(eval_prompt)
+            response = generate(self.judge_model, eval_prompt)
             text = response.text
             
             # 解析 JSON
@@ -90,11 +133,8 @@ class Evaluator:
                 "reasoning": f"评估出错: {str(e)}"
             }
     
-    def compare_agents(self, question: str, pure_answer: str, rag_answer: str, reference: str = None) -> Dict:
-        """
-        比较两个 Agent 的回答
-        """
-        compare_prompt = f"""你是一位专业的评测专家。请比较以下两个 AI 系统对同一问题的回答。
+    def _compare_prompt(self, question: str, pure_answer: str, rag_answer: str, reference: str = None) -> str:
+        return f"""你是一位专业的评测专家。请比较以下两个 AI 系统对同一问题的回答。
 
 问题: {question}
 
@@ -128,35 +168,452 @@ class Evaluator:
     "analysis": "<详细分析>"
 }}
 """
+
+    def _batch_prompt(self, items: List[Dict]) -> str:
+        blocks = []
+        for i, item in enumerate(items, 1):
+            reference = item.get("reference")
+            blocks.append(f"""<item id="{i}">
+问题: {item["question"]}
+
+{f"参考标准: {reference}" if reference else ""}
+
+**Pure Agent 回答** (只依赖模型自身知识):
+{item["pure_answer"]}
+
+**RAG Agent 回答** (结合外部知识库):
+{item["rag_answer"]}
+</item>""")
+        items_text = "\n\n".join(blocks)
+        return f"""你是一位专业的评测专家。下面有 {len(items)} 道题，每道题给出两个 AI 系统对同一问题的回答：
+Pure Agent 只依赖模型自身知识，RAG Agent 结合外部知识库。请逐题独立比较，评判某题时不要参考其他题。
+
+{items_text}
+
+请用 JSON 数组返回（只返回 JSON，不要其他内容），每道题一个对象，id 与上面的 item id 对应：
+[
+    {{
+        "id": <题号>,
+        "pure_agent_score": <0-10>,
+        "rag_agent_score": <0-10>,
+        "winner": "<pure_agent/rag_agent/tie>",
+        "analysis": "<简要分析>"
+    }}
+]
+"""
+
+    @staticmethod
+    def _validate_comparison(result) -> Dict:
+        """分数须为 0-10 的数字、winner 须为合法取值，否则返回 None"""
+        if not isinstance(result, dict) or result.get("winner") not in WINNERS:
+            return None
+        for key in ("pure_agent_score", "rag_agent_score"):
+            score = result.get(key)
+            if isinstance(score, bool) or not isinstance(score, (int, float)) or not 0 <= score <= 10:
+                return None
+        return result
+
+    @staticmethod
+    def _json_slice(text: str, opening: str, closing: str):
+        start = text.find(opening)
+        end = text.rfind(closing) + 1
+        if start == -1 or end == 0:
+            return None
+        try:
+            return json.loads(text[start:end])
+        except json.JSONDecodeError:
+            return None
+
+    @classmethod
+    def _parse_comparison(cls, text: str) -> Dict:
+        return cls._validate_comparison(cls._json_slice(text, '{', '}'))
+
+    @classmethod
+    def _parse_batch(cls, text: str, size: int) -> Dict[int, Dict]:
+        """解析批量评判的 JSON 数组，返回 {题号: 比较结果}，只包含通过校验的条目"""
+        verdicts = cls._json_slice(text, '[', ']')
+        if not isinstance(verdicts, list):
+            return {}
+        parsed = {}
+        for verdict in verdicts:
+            if not isinstance(verdict, dict):
+                continue
+            item_id = verdict.pop("id", None)
+            if isinstance(item_id, int) and 1 <= item_id <= size and item_id not in parsed:
+                valid = cls._validate_comparison(verdict)
+                if valid is not None:
+                    parsed[item_id] = valid
+        return parsed
+
+    @staticmethod
+    def _fallback() -> Dict:
+        # 评判回复无法解析：与调用失败一样不计分，并标记出来，便于在汇总中统计
+        return {**_unscored("评判回复无法解析"), "parse_failed": True}
+
+    def compare_agents(self, question: str, pure_answer: str, rag_answer: str, reference: str = None) -> Dict:
+        """
+        比较两个 Agent 的回答
+        """
+        prompt = self._compare_prompt(question, pure_answer, rag_answer, reference)
+        with component("judge"):
+            return self.singleflight.do(prompt, lambda: self._judge(prompt))
+
+    def _judge(self, prompt: str) -> Dict:
+        try:
+            response = generate(self.judge_model, prompt)
+            with span("parse", items=1):
+                result = self._parse_comparison(response.text)
+            if result is not None:
+                return result
+        except Exception as e:
+            return _unscored(f"评判调用失败: {e}")
         
+        return self._fallback()
+
+    async def acompare_agents(self, question: str, pure_answer: str, rag_answer: str, reference: str = None) -> Dict:
+        """
+        compare_agents 的异步版本（使用异步生成接口）
+        """
+        prompt = self._compare_prompt(question, pure_answer, rag_answer, reference)
+        with component("judge"):
+            return await self.singleflight.ado(prompt, lambda: self._ajudge(prompt))
+
+    async def _ajudge(self, prompt: str) -> Dict:
         try:
-            response = self.judge_model.generate_content(compare_prompt)
-            text = response.text
-            
-            start = text.find('{')
-            end = text.rfind('}') + 1
-            if start != -1 and end != 0:
-                json_str = text[start:end]
-                result = json.loads(json_str)
+            response = await agenerate(self.judge_model, prompt)
+            with span("parse", items=1):
+                result = self._parse_comparison(response.text)
+            if result is not None:
                 return result
         except Exception as e:
-            pass
+            return _unscored(f"评判调用失败: {e}")
+
+        return self._fallback()
+
+    def _record_batch(self, size: int, rejudged: int) -> None:
+        self.batch_stats["batches"] += 1
+        self.batch_stats["batched_items"] += size
+        self.batch_stats["rejudged"] += rejudged
+
+    def compare_batch(self, items: List[Dict]) -> List[Dict]:
+        """
+        一次评判调用比较多道题
+
+        Args:
+            items: 每项包含 question、pure_answer、rag_answer 与可选的 reference
+                （即 compare_agents 的参数）
+
+        Returns:
+            与 items 顺序一致的比较结果；批量回复中缺失或未通过校验的条目
+            会单独重新评判
+        """
+        if len(items) == 1:
+            return [self.compare_agents(**items[0])]
+        try:
+            response = generate(self.judge_model, self._batch_prompt(items))
+            with span("parse", items=len(items)):
+                verdicts = self._parse_batch(response.text, len(items))
+        except Exception:
+            # 整批调用失败时逐题重新评判
+            verdicts = {}
+        results = [verdicts.get(i) or self.compare_agents(**item) for i, item in enumerate(items, 1)]
+        self._record_batch(len(items), len(items) - len(verdicts))
+        return results
+
+    def _split_prejudged(self, items: List[Dict]) -> tuple:
+        """本地预评判：返回 (本地指标列表, 已判定的结果 {下标: 比较结果}, 需要 LLM 评判的下标)"""
+        if self.prejudge is None:
+            return [None] * len(items), {}, list(range(len(items)))
+        with span("prejudge", items=len(items)):
+            metrics = self.prejudge.score_many(items)
+        decided = {i: self.prejudge.verdict(m) for i, m in enumerate(metrics) if m and m["decided_locally"]}
+        return metrics, decided, [i for i in range(len(items)) if i not in decided]
+
+    @staticmethod
+    def _merge_prejudged(metrics: List, decided: Dict, ambiguous: List[int], judged: List[Dict]) -> List[Dict]:
+        results = dict(decided)
+        results.update(zip(ambiguous, judged))
+        merged = []
+        for i in range(len(metrics)):
+            comparison = results[i]
+            if metrics[i] is not None:
+                # 本地指标与评判分数保存在一起，便于校准阈值
+                comparison = {**comparison, "local_metrics": metrics[i]}
+            merged.append(comparison)
+        return merged
+
+    def judge_items(self, items: List[Dict]) -> List[Dict]:
+        """
+        评判一组题目：先本地预评判（如已启用），其余的作为一批交给 LLM 评判（compare_batch）
+        """
+        with component("judge"):
+            metrics, decided, ambiguous = self._split_prejudged(items)
+            judged = self.compare_batch([items[i] for i in ambiguous]) if ambiguous else []
+        return self._merge_prejudged(metrics, decided, ambiguous, judged)
+
+    async def ajudge_items(self, items: List[Dict]) -> List[Dict]:
+        """
+        judge_items 的异步版本；本地 embedding 计算在线程中进行
+        """
+        with component("judge"):
+            if self.prejudge is not None:
+                metrics, decided, ambiguous = await asyncio.to_thread(self._split_prejudged, items)
+            else:
+                metrics, decided, ambiguous = self._split_prejudged(items)
+            judged = await self.acompare_batch([items[i] for i in ambiguous]) if ambiguous else []
+        return self._merge_prejudged(metrics, decided, ambiguous, judged)
+
+    async def acompare_batch(self, items: List[Dict]) -> List[Dict]:
+        """
+        compare_batch 的异步版本；需要重新评判的条目并发进行
+        """
+        if len(items) == 1:
+            return [await self.acompare_agents(**items[0])]
+        try:
+            response = await agenerate(self.judge_model, self._batch_prompt(items))
+            with span("parse", items=len(items)):
+                verdicts = self._parse_batch(response.text, len(items))
+        except Exception:
+            verdicts = {}
+
+        async def verdict(i: int, item: Dict) -> Dict:
+            return verdicts.get(i) or await self.acompare_agents(**item)
+
+        results = await asyncio.gather(*(verdict(i, item) for i, item in enumerate(items, 1)))
+        self._record_batch(len(items), len(items) - len(verdicts))
+        return list(results)
+
+
+def _judge_item(q_data: Dict, pure_result: Dict, rag_result: Dict) -> Dict:
+    """compare_agents / compare_batch 的一项参数"""
+    return {
+        "question": q_data["question"],
+        "pure_answer": pure_result["full_response"],
+        "rag_answer": rag_result["full_response"],
+        "reference": q_data.get("reference", None),
+    }
+
+
+class JudgeBatcher:
+    """
+    调度模式下的批量评判：攒满 batch_size 题（或所有剩余题都已就绪）后发出一次评判调用
+
+    Args:
+        evaluator: 提供 acompare_batch 的评测器
+        batch_size: 每次评判调用最多包含的题数
+        total: 本次实验的题数，用于判断最后一个不满的批次何时发出
+    """
+
+    def __init__(self, evaluator: "Evaluator", batch_size: int, total: int):
+        self.evaluator = evaluator
+        self.batch_size = max(1, batch_size)
+        self.remaining = total
+        self._pending = []
+
+    async def judge(self, q_data: Dict, pure_result: Dict, rag_result: Dict) -> Dict:
+        self.remaining -= 1
+        comparison = _agent_failure(pure_result, rag_result)
+        if comparison is None:
+            future = asyncio.get_running_loop().create_future()
+            self._pending.append((_judge_item(q_data, pure_result, rag_result), future))
+        if self._pending and (len(self._pending) >= self.batch_size or self.remaining == 0):
+            await self._flush()
+        return comparison if comparison is not None else await future
+
+    async def _flush(self) -> None:
+        batch, self._pending = self._pending, []
+        try:
+            results = await self.evaluator.ajudge_items([item for item, _ in batch])
+            if len(results) != len(batch):
+                raise ValueError(f"评判返回 {len(results)} 条结果，预期 {len(batch)} 条")
+        except asyncio.CancelledError:
+            for _, future in batch:
+                future.cancel()
+            raise
+        except Exception as e:
+            # 整批评判失败时这些题不计分，否则等待该批结果的题目会永远挂起
+            results = [_unscored(f"评判调用失败: {e}") for _ in batch]
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+
+def _question_record(q_data: Dict, pure_result: Dict, rag_result: Dict, comparison: Dict,
+                     timing: Dict = None, spans: List[Dict] = None) -> Dict:
+    record = {
+        "id": q_data.get("id"),
+        "question": q_data["question"],
+        "category": q_data.get("category", "general"),
+        "reference": q_data.get("reference", None),
+        "pure_agent_response": pure_result["full_response"],
+        "rag_agent_response": rag_result["full_response"],
+        "rag_retrieved_docs": rag_result.get("retrieved_docs", []),
+        "rag_context_stats": rag_result.get("context_stats"),
+        "comparison": comparison,
+        "scored": comparison.get("scored", True)
+    }
+    if timing is not None:
+        record["timing"] = timing
+    if spans is not None:
+        record["spans"] = spans
+    return record
+
+
+def _print_question_result(comparison: Dict) -> None:
+    if not comparison.get("scored", True):
+        print(f"  - 未计分: {comparison['error'][:120]}")
+        return
+    winner = comparison.get("winner", "tie")
+    print(f"  - 结果: Pure={comparison.get('pure_agent_score', 'N/A')}, RAG={comparison.get('rag_agent_score', 'N/A')}, Winner={winner}")
+
+
+def summarize(records: List[Dict]) -> Dict:
+    """根据每题的比较结果计算汇总统计"""
+    return IncrementalSummary().extend(records).summary()
+
+
+def summarize_timing(records: List[Dict]) -> Dict:
+    """每题关键路径与串行基线的平均值（秒）"""
+    return IncrementalSummary().extend(records).timing()
+
+
+def _run_sequential(questions: List[Dict], prefetched: List, pure_agent, rag_agent, evaluator,
+                    on_record: Callable[[int, Dict], None], judge_batch_size: int = 1) -> None:
+    """逐题串行执行；每题完成后调用 on_record(index, record)"""
+    answered = []
+
+    def judge_pending() -> None:
+        if not answered:
+            return
+        print(f"  - 批量评估 {len(answered)} 题...")
+        started = time.perf_counter()
+        # 批量评判的 span 记入触发这一批的题目
+        with span("judge", items=len(answered)):
+            comparisons = evaluator.judge_items([_judge_item(q, p, r) for _, q, p, r, *_ in answered])
+        # 一次调用评判整批，耗时按题均摊
+        judge_s = (time.perf_counter() - started) / len(answered)
+        for (j, q_data, pure_result, rag_result, pure_s, rag_s, question_trace), comparison in zip(
+                answered, comparisons):
+            print(f"  [#{j+1}] {q_data['question'][:50]}")
+            _print_question_result(comparison)
+            timing = timing_record(pure_s, 0.0, rag_s, judge_s, pure_s + rag_s + judge_s)
+            on_record(j, _question_record(q_data, pure_result, rag_result, comparison, timing,
+                                          question_trace.records()))
+        answered.clear()
+
+    for i, q_data in enumerate(questions):
+        question = q_data["question"]
+        
+        print(f"\n[{i+1}/{len(questions)}] {question[:50]}...")
         
-        return {
-            "pure_agent_score": 5,
-            "rag_agent_score": 5,
-            "winner": "tie",
-            "analysis": "无法完成比较"
-        }
+        with trace() as question_trace:
+            # 获取两个 Agent 的回答
+            print("  - Pure Agent 思考中...")
+            started = time.perf_counter()
+            pure_result = pure_agent.query_with_reasoning(question)
+            pure_s = time.perf_counter() - started
+            
+            print("  - RAG Agent 思考中...")
+            started = time.perf_counter()
+            rag_result = rag_agent.query_with_reasoning(question, prefetched=prefetched[i])
+            rag_s = time.perf_counter() - started
+            
+            # 评估（调用失败的回答不交给评判）
+            comparison = _agent_failure(pure_result, rag_result)
+            if comparison is None and judge_batch_size > 1:
+                # 批量评判：先收集，攒满一批后统一评判
+                answered.append((i, q_data, pure_result, rag_result, pure_s, rag_s, question_trace))
+                if len(answered) >= judge_batch_size:
+                    judge_pending()
+                continue
+            started = time.perf_counter()
+            if comparison is None:
+                print("  - 评估中...")
+                with span("judge"):
+                    comparison = evaluator.judge_items([_judge_item(q_data, pure_result, rag_result)])[0]
+            judge_s = time.perf_counter() - started
+        _print_question_result(comparison)
+        # 串行执行时关键路径即各阶段之和（检索已批量预取，不计入）
+        timing = timing_record(pure_s, 0.0, rag_s, judge_s, pure_s + rag_s + judge_s)
+        on_record(i, _question_record(q_data, pure_result, rag_result, comparison, timing,
+                                      question_trace.records()))
+    judge_pending()
 
 
-def run_experiment(questions: List[Dict], output_file: str = None) -> Dict:
+def _run_scheduled(questions: List[Dict], pure_agent, rag_agent, evaluator, concurrency: int,
+                   on_record: Callable[[int, Dict], None], judge_batch_size: int = 1,
+                   prefetched: List = None) -> float:
+    """
+    每题 Pure 与 RAG 并行、两者完成即评判（或攒批评判）；最多 concurrency 个问题同时进行。
+    每题完成后调用 on_record(index, record)，返回批量检索耗时（提供 prefetched 时不检索）
+    """
+    async def judge(q_data: Dict, pure_result: Dict, rag_result: Dict) -> Dict:
+        comparison = _agent_failure(pure_result, rag_result)
+        if comparison is not None:
+            return comparison
+        return (await evaluator.ajudge_items([_judge_item(q_data, pure_result, rag_result)]))[0]
+
+    done = 0
+
+    def on_done(i: int, outcome: tuple) -> None:
+        nonlocal done
+        done += 1
+        timing = outcome[3]
+        print(f"\n[{done}/{len(questions)}] (#{i+1}) {questions[i]['question'][:50]}...")
+        _print_question_result(outcome[2])
+        print(f"  - 关键路径 {timing['critical_path_s']}s（串行基线 {timing['serial_baseline_s']}s）")
+        # on_done 在该题的 trace 中调用
+        on_record(i, _question_record(questions[i], *outcome, spans=current_trace().records()))
+
+    if judge_batch_size > 1:
+        judge = JudgeBatcher(evaluator, judge_batch_size, len(questions)).judge
+
+    scheduler = QuestionScheduler(pure_agent, rag_agent, judge, concurrency)
+    asyncio.run(scheduler.run(questions, on_done, prefetched))
+    return scheduler.retrieval_seconds
+
+
+def _export_metrics(output_file: str, metrics_file: str = None) -> str:
+    """把各阶段直方图写入 Prometheus 文本文件，返回其路径（没有输出路径时不写）"""
+    if metrics_file is None and output_file:
+        metrics_file = os.path.splitext(output_file)[0] + ".prom"
+    if metrics_file:
+        get_span_metrics().write_prometheus(metrics_file)
+    return metrics_file
+
+
+def _build_evaluator(prejudge_threshold: float = None, prejudge_calibrate: bool = False) -> "Evaluator":
+    prejudge = None
+    if prejudge_threshold is not None or prejudge_calibrate:
+        from eval.prejudge import PreJudge
+        # 与检索共用同一个 embedding 模型单例，首次预评判时才加载
+        prejudge = PreJudge(get_embeddings, threshold=None if prejudge_calibrate else prejudge_threshold)
+    return Evaluator(prejudge=prejudge)
+
+
+def run_experiment(questions: List[Dict], output_file: str = None, concurrency: int = 1,
+                   serial: bool = None, judge_batch_size: int = 1, log_file: str = None,
+                   resume: bool = False, prejudge_threshold: float = None,
+                   prejudge_calibrate: bool = False, shard: Dict = None, metrics_file: str = None,
+                   keep_questions: bool = True) -> Dict:
     """
     运行完整实验
     
     Args:
-        questions: 问题列表，每个问题包含 question 和可选的 reference
+        questions: 问题列表，每个问题包含 question 和可选的 id、reference
         output_file: 结果输出文件路径
+        concurrency: 同时处理的问题数（异步接口并发执行）
+        serial: 使用串行流程（Pure -> RAG -> 评判，逐题执行）；默认仅在 concurrency > 1 时
+            使用调度模式（每题 Pure 与 RAG 并行），显式传入 False 可在 concurrency=1 时启用
+        judge_batch_size: 每次评判调用包含的题数（>1 时批量评判，解析失败的题单独重评）
+        log_file: 逐题追加写入的 JSONL 日志（默认为 output_file 旁的同名 .jsonl）
+        resume: 跳过日志中已完成的题目 ID，在原日志上继续
+        prejudge_threshold: 启用本地预评判，本地分差不小于该值的题目不调用 LLM 评判
+        prejudge_calibrate: 计算本地预评判指标但全部交给 LLM 评判（用于校准阈值）
+        shard: 分片信息（见 eval.sharding.shard_questions），写入结果供合并时使用
+        metrics_file: 各阶段耗时与 token 直方图的 Prometheus 文本文件（默认为 output_file 旁的同名 .prom）
+        keep_questions: 返回值中包含逐题记录 "questions"（使用日志时运行结束后按题目顺序从日志读回）；
+            为 False 时运行期间与结束后都不在内存中保留逐题记录，只以 "log_file" 指向日志
     
     Returns:
         完整的实验结果
@@ -168,8 +625,36 @@ def run_experiment(questions: List[Dict], output_file: str = None) -> Dict:
     # 初始化
     pure_agent = PureAgent()
     rag_agent = RAGAgent()
-    evaluator = Evaluator()
+    evaluator = _build_evaluator(prejudge_threshold, prejudge_calibrate)
+    prejudge = evaluator.prejudge
     
+    if serial is None:
+        serial = concurrency <= 1
+    ids = assign_ids(questions)
+    if log_file is None and output_file:
+        log_file = default_log_path(output_file)
+    log = ResultsLog(log_file, resume=resume) if log_file else None
+
+    # 汇总随每题完成增量更新；续跑时先计入日志中已有的记录
+    tally = IncrementalSummary()
+    completed = set()
+    if log is not None and resume:
+        for record in log.records():
+            tally.add(record)
+            completed.add(record.get("id"))
+    pending = [dict(q_data, id=qid) for qid, q_data in zip(ids, questions) if qid not in completed]
+    if resume:
+        print(f"断点续跑：跳过日志中已完成的 {len(questions) - len(pending)} 题，剩余 {len(pending)} 题")
+
+    records = [None] * len(pending) if log is None else None
+
+    def on_record(i: int, record: Dict) -> None:
+        tally.add(record)
+        if log is not None:
+            log.append(record)
+        else:
+            records[i] = record
+
     results = {
         "timestamp": datetime.now().isoformat(),
         "num_questions": len(questions),
@@ -177,91 +662,247 @@ def run_experiment(questions: List[Dict], output_file: str = None) -> Dict:
         "summary": {}
     }
     
-    pure_total = 0
-    rag_total = 0
-    rag_wins = 0
-    pure_wins = 0
-    ties = 0
-    
-    for i, q_data in enumerate(questions):
-        question = q_data["question"]
-        reference = q_data.get("reference", None)
-        category = q_data.get("category", "general")
-        
-        print(f"\n[{i+1}/{len(questions)}] {question[:50]}...")
-        
-        # 获取两个 Agent 的回答
-        print("  - Pure Agent 思考中...")
-        pure_result = pure_agent.query_with_reasoning(question)
-        time.sleep(1)  # 避免 API 限流
-        
-        print("  - RAG Agent 思考中...")
-        rag_result = rag_agent.query_with_reasoning(question)
-        time.sleep(1)
-        
-        # 评估
-        print("  - 评估中...")
-        comparison = evaluator.compare_agents(
-            question, 
-            pure_result["full_response"], 
-            rag_result["full_response"],
-            reference
-        )
-        
-        # 统计
-        pure_total += comparison.get("pure_agent_score", 5)
-        rag_total += comparison.get("rag_agent_score", 5)
-        
-        winner = comparison.get("winner", "tie")
-        if winner == "rag_agent":
-            rag_wins += 1
-        elif winner == "pure_agent":
-            pure_wins += 1
+    run_start = time.perf_counter()
+    try:
+        if serial:
+            # 批量预取所有问题的检索结果（一次 embedding 调用 + 一次批量检索）
+            print("批量检索所有问题的相关文档...")
+            prefetched = rag_agent.retrieve_many([q["question"] for q in pending])
+            results["retrieval_seconds"] = round(time.perf_counter() - run_start, 3)
+            print(f"检索完成，用时 {results['retrieval_seconds']:.2f}s")
+            _run_sequential(pending, prefetched, pure_agent, rag_agent, evaluator, on_record, judge_batch_size)
         else:
-            ties += 1
-        
-        print(f"  - 结果: Pure={comparison.get('pure_agent_score', 'N/A')}, RAG={comparison.get('rag_agent_score', 'N/A')}, Winner={winner}")
-        
-        # 记录结果
-        results["questions"].append({
-            "question": question,
-            "category": category,
-            "reference": reference,
-            "pure_agent_response": pure_result["full_response"],
-            "rag_agent_response": rag_result["full_response"],
-            "rag_retrieved_docs": rag_result.get("retrieved_docs", []),
-            "comparison": comparison
-        })
+            print(f"调度模式：每题 Pure 与 RAG 并行，最多同时处理 {concurrency} 个问题")
+            results["retrieval_seconds"] = _run_scheduled(
+                pending, pure_agent, rag_agent, evaluator, concurrency, on_record, judge_batch_size
+            )
+    finally:
+        if log is not None:
+            log.close()
+
+    if log is None:
+        results["questions"] = records
+    else:
+        del results["questions"]
+        results["log_file"] = log_file
+    results["mode"] = "serial" if serial else "scheduled"
+    results["concurrency"] = concurrency
+    results["judge_batch_size"] = judge_batch_size
+    if shard is not None:
+        results["shard"] = dict(shard, ids=ids)
+    results["wall_time_seconds"] = round(time.perf_counter() - run_start, 2)
     
     # 汇总
-    n = len(questions)
-    results["summary"] = {
-        "pure_agent_avg_score": round(pure_total / n, 2) if n > 0 else 0,
-        "rag_agent_avg_score": round(rag_total / n, 2) if n > 0 else 0,
-        "rag_wins": rag_wins,
-        "pure_wins": pure_wins,
-        "ties": ties,
-        "rag_win_rate": round(rag_wins / n * 100, 1) if n > 0 else 0,
-        "pure_win_rate": round(pure_wins / n * 100, 1) if n > 0 else 0
+    results["summary"] = tally.summary()
+    results["timing"] = tally.timing()
+    results["embedding_cache"] = rag_agent.embedding_cache_stats()
+    results["rate_limiter"] = get_rate_limiter().stats()
+    response_cache = get_response_cache()
+    results["llm_cache"] = response_cache.stats() if response_cache is not None else None
+    results["judge"] = dict(evaluator.batch_stats)
+    results["prejudge"] = dict(prejudge.stats, threshold=prejudge.threshold) if prejudge is not None else None
+    results["coalescing"] = {
+        "pure_agent": pure_agent.singleflight.stats(),
+        "rag_agent": rag_agent.singleflight.stats(),
+        "judge": evaluator.singleflight.stats(),
     }
+    results["stages"] = get_span_metrics().summary()
+    results["metrics_file"] = _export_metrics(output_file, metrics_file)
+    summary = results["summary"]
     
     print("\n" + "=" * 60)
     print("实验总结")
     print("=" * 60)
-    print(f"Pure Agent 平均得分: {results['summary']['pure_agent_avg_score']}")
-    print(f"RAG Agent 平均得分: {results['summary']['rag_agent_avg_score']}")
-    print(f"RAG 获胜: {rag_wins} 次 ({results['summary']['rag_win_rate']}%)")
-    print(f"Pure 获胜: {pure_wins} 次 ({results['summary']['pure_win_rate']}%)")
-    print(f"平局: {ties} 次")
+    print(f"Pure Agent 平均得分: {summary['pure_agent_avg_score']}")
+    print(f"RAG Agent 平均得分: {summary['rag_agent_avg_score']}")
+    print(f"RAG 获胜: {summary['rag_wins']} 次 ({summary['rag_win_rate']}%)")
+    print(f"Pure 获胜: {summary['pure_wins']} 次 ({summary['pure_win_rate']}%)")
+    print(f"平局: {summary['ties']} 次")
+    if summary["unscored"]:
+        print(f"未计分（调用失败）: {summary['unscored']} 题")
+    print(f"总用时: {results['wall_time_seconds']}s")
+    if results["timing"]:
+        timing = results["timing"]
+        print(f"每题平均关键路径: {timing['avg_critical_path_s']}s（串行基线 {timing['avg_serial_baseline_s']}s，"
+              f"加速 {timing['critical_path_speedup']}x）")
+    if results["judge"]["batches"]:
+        judge = results["judge"]
+        print(f"批量评判: {judge['batches']} 批共 {judge['batched_items']} 题，单独重评 {judge['rejudged']} 题")
+    if results["prejudge"]:
+        stats = results["prejudge"]
+        print(f"本地预评判: {stats['scored']} 题有参考答案，其中 {stats['decided_locally']} 题未调用 LLM 评判")
+    if summary["judge_parse_failures"]:
+        print(f"评判回复无法解析（不计分）: {summary['judge_parse_failures']} 题")
+    if results["llm_cache"]:
+        print(f"LLM 响应缓存: 命中 {results['llm_cache']['hits']} / 未命中 {results['llm_cache']['misses']}")
+    coalesced = sum(stats["coalesced"] for stats in results["coalescing"].values())
+    if coalesced:
+        print(f"合并的重复请求: {coalesced} 次（" + ", ".join(
+            f"{name} {stats['coalesced']}" for name, stats in results["coalescing"].items()) + "）")
+    if results["embedding_cache"]:
+        print(f"Embedding 缓存命中率: {results['embedding_cache']['hit_rate']:.1%}")
+    if results["stages"]:
+        print("各阶段耗时（组件/阶段: 次数, 平均）:")
+        for name, stats in results["stages"].items():
+            print(f"  {name:<28} {stats['count']:>5} 次  平均 {stats['mean_ms']:.1f} ms")
     
-    # 保存结果
+    # 保存结果（紧凑格式；使用日志时由日志按题目顺序流式生成）
     if output_file:
-        with open(output_file, "w", encoding="utf-8") as f:
-            json.dump(results, f, ensure_ascii=False, indent=2)
+        if log is not None:
+            build_artifact(log_file, output_file, results, ids)
+        else:
+            with open(output_file, "w", encoding="utf-8") as f:
+                json.dump(results, f, ensure_ascii=False, separators=(",", ":"))
         print(f"\n结果已保存到: {output_file}")
-    
+
+    if log is not None and keep_questions:
+        results["questions"] = list(iter_ordered(log_file, ids))
     return results
 
+def run_trials(questions: List[Dict], output_file: str = None, trials: int = 5, min_trials: int = 2,
+               ci_tolerance: float = 0.5, concurrency: int = 1, serial: bool = None,
+               judge_batch_size: int = 1, log_file: str = None, prejudge_threshold: float = None,
+               n_resamples: int = DEFAULT_RESAMPLES, confidence: float = DEFAULT_CONFIDENCE,
+               resample_questions: bool = False, seed: int = 0, metrics_file: str = None) -> Dict:
+    """
+    多轮试验：每题重复运行最多 trials 轮，用 bootstrap 置信区间汇总
+
+    检索只在开始时批量做一次，各轮复用。第 1 轮之后的每一轮使用独立的 LLM 响应缓存
+    命名空间（启用 LLM_CACHE 时各轮不会重放第 1 轮的回答，重新运行整个多轮实验仍可复现）。
+    至少运行 min_trials 轮后，若得分与配对得分差的区间半宽都不超过 ci_tolerance（分）
+    则提前停止。
+
+    Args:
+        questions: 问题列表
+        output_file: 结果输出文件路径（逐题逐轮的记录写入同名 .jsonl 日志，带 "trial" 字段）
+        trials: 最多运行的轮数
+        min_trials: 检查是否提前停止前至少运行的轮数（不少于 2）
+        ci_tolerance: 提前停止的区间半宽（分）
+        resample_questions: 同时对题目重抽样（见 eval.bootstrap）
+        其余参数同 run_experiment 与 eval.bootstrap.bootstrap_intervals
+
+    Returns:
+        各轮汇总、bootstrap 区间与逐题逐轮得分
+    """
+    print("=" * 60)
+    print(f"RAG vs Pure Agent 多轮实验（最多 {trials} 轮）")
+    print("=" * 60)
+
+    pure_agent = PureAgent()
+    rag_agent = RAGAgent()
+    evaluator = _build_evaluator(prejudge_threshold)
+    min_trials = min(max(min_trials, 2), trials)
+    if serial is None:
+        serial = concurrency <= 1
+
+    questions = [dict(q_data, id=qid) for qid, q_data in zip(assign_ids(questions), questions)]
+    if log_file is None and output_file:
+        log_file = default_log_path(output_file)
+    log = ResultsLog(log_file) if log_file else None
+
+    # [题目, 轮次]；未计分或未运行为 NaN
+    pure_scores = np.full((len(questions), trials), np.nan)
+    rag_scores = np.full((len(questions), trials), np.nan)
+    winners = np.full((len(questions), trials), "", dtype=object)
+    trial_summaries = []
+    intervals = None
+    completed = 0
+
+    run_start = time.perf_counter()
+    print("批量检索所有问题的相关文档（各轮复用）...")
+    prefetched = rag_agent.retrieve_many([q["question"] for q in questions])
+    retrieval_seconds = round(time.perf_counter() - run_start, 3)
+    try:
+        for t in range(trials):
+            print(f"\n{'=' * 20} 第 {t + 1}/{trials} 轮 {'=' * 20}")
+            tally = IncrementalSummary()
+
+            def on_record(i: int, record: Dict, t: int = t, tally: IncrementalSummary = tally) -> None:
+                record["trial"] = t + 1
+                tally.add(record)
+                if record.get("scored", True):
+                    comparison = record["comparison"]
+                    pure_scores[i, t] = comparison.get("pure_agent_score", 5)
+                    rag_scores[i, t] = comparison.get("rag_agent_score", 5)
+                    winners[i, t] = comparison.get("winner", "tie")
+                if log is not None:
+                    log.append(record)
+
+            # 第 1 轮沿用普通运行的缓存条目，之后每轮使用各自的命名空间
+            with cache_namespace(None if t == 0 else f"trial-{t + 1}"):
+                if serial:
+                    _run_sequential(questions, prefetched, pure_agent, rag_agent, evaluator, on_record,
+                                    judge_batch_size)
+                else:
+                    _run_scheduled(questions, pure_agent, rag_agent, evaluator, concurrency, on_record,
+                                   judge_batch_size, prefetched=prefetched)
+            completed = t + 1
+            trial_summaries.append(dict(tally.summary(), trial=completed))
+
+            intervals = bootstrap_intervals(
+                score_matrices(pure_scores[:, :completed], rag_scores[:, :completed], winners[:, :completed]),
+                n_resamples=n_resamples, confidence=confidence, resample_questions=resample_questions, seed=seed,
+            )
+            print(f"\n前 {completed} 轮的 bootstrap 区间:")
+            print("\n".join(format_intervals(intervals, confidence)))
+            if completed >= min_trials and converged(intervals, ci_tolerance):
+                if completed < trials:
+                    print(f"区间半宽均不超过 {ci_tolerance}，提前停止")
+                break
+    finally:
+        if log is not None:
+            log.close()
+
+    response_cache = get_response_cache()
+    results = {
+        "timestamp": datetime.now().isoformat(),
+        "mode": "trials",
+        "num_questions": len(questions),
+        "max_trials": trials,
+        "min_trials": min_trials,
+        "trials_run": completed,
+        "stopped_early": completed < trials,
+        "ci_tolerance": ci_tolerance,
+        "confidence": confidence,
+        "n_resamples": n_resamples,
+        "resample_questions": resample_questions,
+        "retrieval_seconds": retrieval_seconds,
+        "wall_time_seconds": round(time.perf_counter() - run_start, 2),
+        "bootstrap": intervals,
+        "trial_summaries": trial_summaries,
+        "per_question": [
+            {
+                "id": q_data["id"],
+                "question": q_data["question"],
+                "pure_scores": [None if np.isnan(v) else float(v) for v in pure_scores[i, :completed]],
+                "rag_scores": [None if np.isnan(v) else float(v) for v in rag_scores[i, :completed]],
+                "winners": [w or None for w in winners[i, :completed]],
+            } for i, q_data in enumerate(questions)
+        ],
+        "rate_limiter": get_rate_limiter().stats(),
+        "llm_cache": response_cache.stats() if response_cache is not None else None,
+        "coalescing": {
+            "pure_agent": pure_agent.singleflight.stats(),
+            "rag_agent": rag_agent.singleflight.stats(),
+            "judge": evaluator.singleflight.stats(),
+        },
+        "stages": get_span_metrics().summary(),
+        "metrics_file": _export_metrics(output_file, metrics_file),
+        "log_file": log_file,
+    }
+
+    print("\n" + "=" * 60)
+    print(f"多轮实验总结（{completed} 轮，{confidence:.0%} bootstrap 区间）")
+    print("=" * 60)
+    print("\n".join(format_intervals(intervals, confidence)))
+    print(f"总用时: {results['wall_time_seconds']}s")
+
+    if output_file:
+        with open(output_file, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, separators=(",", ":"))
+        print(f"\n结果已保存到: {output_file}")
+
+    return results
 
 if __name__ == "__main__":
     # 加载测试问题
@@ -0,0 +1,231 @@
+"""
+本地预评判 - 用参考答案对两个回答做廉价的本地打分，只有分不出高下时才调用 LLM 评判
+
+每个回答的本地得分 = COSINE_WEIGHT * 语义相似度 + (1 - COSINE_WEIGHT) * 词元 F1：
+    语义相似度  回答与参考答案的 MiniLM 向量余弦（与检索共用已加载的 embedding 模型）
+    词元 F1     与 BM25 相同的分词（英文单词 + 单个汉字），回答优先取 "Final Answer" 部分
+
+一批题目的全部回答与参考答案在一次 embedding 调用中完成，余弦相似度以矩阵运算得到。
+两个回答的本地得分之差（margin = rag - pure）的绝对值不小于阈值时直接判定胜负，
+否则交给 LLM 评判。没有参考答案的题目总是交给 LLM。
+
+阈值校准：以 --prejudge-calibrate 运行一次（计算本地指标但全部交给 LLM 评判），
+再运行 `python src/eval/prejudge.py results/experiment_results.jsonl`，
+输出各阈值下的跳过比例与本地判定和 LLM 判定的一致率，并给出建议阈值。
+"""
+import os
+import re
+import sys
+import json
+import argparse
+from collections import Counter
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from rag.bm25 import tokenize
+
+COSINE_WEIGHT = 0.5
+DEFAULT_THRESHOLD = 0.15
+DEFAULT_MIN_AGREEMENT = 0.9
+# |margin| 不超过该值视为平局（margin 保留 4 位小数）
+TIE_EPSILON = 1e-4
+
+_FINAL_ANSWER_RE = re.compile(r"##\s*Final Answer\s*\n(.*)", re.IGNORECASE | re.DOTALL)
+
+
+def final_answer(text: str) -> str:
+    """推理格式回答中的 "## Final Answer" 部分；没有该标题时返回全文"""
+    match = _FINAL_ANSWER_RE.search(text or "")
+    return match.group(1).strip() if match else (text or "")
+
+
+def token_f1(answer: str, reference: str) -> float:
+    """词元重叠 F1（按词频计重叠）"""
+    answer_tokens = Counter(tokenize(answer))
+    reference_tokens = Counter(tokenize(reference))
+    overlap = sum((answer_tokens & reference_tokens).values())
+    if overlap == 0:
+        return 0.0
+    precision = overlap / sum(answer_tokens.values())
+    recall = overlap / sum(reference_tokens.values())
+    return 2 * precision * recall / (precision + recall)
+
+
+def local_winner(margin: float) -> str:
+    """由 margin 得出的本地胜者；|margin| 不超过 TIE_EPSILON 时为平局（"tie"）"""
+    if abs(margin) <= TIE_EPSILON:
+        return "tie"
+    return "rag_agent" if margin > 0 else "pure_agent"
+
+
+def _normalized(vectors) -> np.ndarray:
+    matrix = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+class PreJudge:
+    """
+    Args:
+        embeddings: 提供 embed_documents 的 embedding 模型，或返回它的无参函数（首次使用时才加载）
+        threshold: |margin| 不小于该值时跳过 LLM 评判；None 表示只计算本地指标、全部交给 LLM（校准模式）
+    """
+
+    def __init__(self, embeddings, threshold: float = DEFAULT_THRESHOLD):
+        self._embeddings = embeddings
+        self.threshold = threshold
+        self.stats = {"scored": 0, "decided_locally": 0, "sent_to_llm": 0}
+
+    @property
+    def embeddings(self):
+        if callable(self._embeddings) and not hasattr(self._embeddings, "embed_documents"):
+            self._embeddings = self._embeddings()
+        return self._embeddings
+
+    def score_many(self, items: Sequence[Dict]) -> List[Dict]:
+        """
+        对一批评判项（question / pure_answer / rag_answer / reference）计算本地指标
+
+        Returns:
+            与 items 顺序一致；没有参考答案的项为 None
+        """
+        indexed = [(i, item) for i, item in enumerate(items) if item.get("reference")]
+        metrics = [None] * len(items)
+        if not indexed:
+            return metrics
+
+        pure = [final_answer(item["pure_answer"]) for _, item in indexed]
+        rag = [final_answer(item["rag_answer"]) for _, item in indexed]
+        references = [item["reference"] for _, item in indexed]
+        n = len(indexed)
+
+        # 一次 embedding 调用，按 [pure..., rag..., reference...] 排列
+        vectors = _normalized(self.embeddings.embed_documents(pure + rag + references))
+        reference_vectors = vectors[2 * n:]
+        pure_cosine = np.einsum("ij,ij->i", vectors[:n], reference_vectors)
+        rag_cosine = np.einsum("ij,ij->i", vectors[n:2 * n], reference_vectors)
+        pure_f1 = np.array([token_f1(a, r) for a, r in zip(pure, references)])
+        rag_f1 = np.array([token_f1(a, r) for a, r in zip(rag, references)])
+
+        pure_score = COSINE_WEIGHT * pure_cosine + (1 - COSINE_WEIGHT) * pure_f1
+        rag_score = COSINE_WEIGHT * rag_cosine + (1 - COSINE_WEIGHT) * rag_f1
+        margin = rag_score - pure_score
+        decided = np.abs(margin) >= self.threshold if self.threshold is not None else np.zeros(n, dtype=bool)
+
+        for row, (i, _) in enumerate(indexed):
+            metrics[i] = {
+                "pure_cosine": round(float(pure_cosine[row]), 4),
+                "rag_cosine": round(float(rag_cosine[row]), 4),
+                "pure_f1": round(float(pure_f1[row]), 4),
+                "rag_f1": round(float(rag_f1[row]), 4),
+                "pure_score": round(float(pure_score[row]), 4),
+                "rag_score": round(float(rag_score[row]), 4),
+                "margin": round(float(margin[row]), 4),
+                "decided_locally": bool(decided[row]),
+            }
+        self.stats["scored"] += n
+        self.stats["decided_locally"] += int(decided.sum())
+        self.stats["sent_to_llm"] += len(items) - int(decided.sum())
+        return metrics
+
+    @staticmethod
+    def verdict(metrics: Dict) -> Dict:
+        """由本地指标得出的比较结果（分数换算到 0-10）"""
+        return {
+            "pure_agent_score": round(10 * max(metrics["pure_score"], 0.0), 1),
+            "rag_agent_score": round(10 * max(metrics["rag_score"], 0.0), 1),
+            "winner": local_winner(metrics["margin"]),
+            "analysis": "本地预评判：与参考答案的相似度差距足够大，未调用 LLM 评判",
+            "judged_by": "prejudge",
+        }
+
+
+def calibrate(margins: Sequence[float], llm_winners: Sequence[str], thresholds: Sequence[float] = None,
+              min_agreement: float = DEFAULT_MIN_AGREEMENT) -> Dict:
+    """
+    在有 LLM 评判结果的题目上评估各阈值
+
+    Args:
+        margins: 每题的本地 margin（rag_score - pure_score）
+        llm_winners: 同一题的 LLM 评判胜者
+        thresholds: 候选阈值（默认 0.00 到 0.50，步长 0.01）
+        min_agreement: 建议阈值须达到的一致率
+
+    Returns:
+        {"rows": [{threshold, skip_rate, agreement, skipped}], "recommended": 阈值或 None}
+        recommended 为一致率达标时跳过最多题目的（即最小的）阈值
+    """
+    margins = np.asarray(margins, dtype=np.float64)
+    if thresholds is None:
+        thresholds = np.round(np.arange(0.0, 0.51, 0.01), 2)
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+
+    local = np.array([local_winner(margin) for margin in margins], dtype=object)
+    agrees = local == np.asarray(llm_winners)
+    # skipped[t, q]：阈值 t 下第 q 题是否由本地判定
+    skipped = np.abs(margins)[None, :] >= thresholds[:, None]
+    skipped_counts = skipped.sum(axis=1)
+    agree_counts = (skipped & agrees[None, :]).sum(axis=1)
+
+    rows = []
+    recommended = None
+    for threshold, count, agree in zip(thresholds, skipped_counts, agree_counts):
+        agreement = agree / count if count else None
+        rows.append({
+            "threshold": float(threshold),
+            "skipped": int(count),
+            "skip_rate": round(count / len(margins), 4) if len(margins) else 0.0,
+            "agreement": round(float(agreement), 4) if agreement is not None else None,
+        })
+        if recommended is None and count and agreement >= min_agreement:
+            recommended = float(threshold)
+    return {"rows": rows, "recommended": recommended}
+
+
+def load_calibration_records(path: str) -> tuple:
+    """从结果日志（.jsonl）或结果文件（.json）中取出有本地指标且经 LLM 评判的题目"""
+    if path.endswith(".jsonl"):
+        with open(path, "r", encoding="utf-8") as f:
+            records = [json.loads(line) for line in f if line.strip()]
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            records = json.load(f)["questions"]
+
+    margins, winners = [], []
+    for record in records:
+        comparison = record.get("comparison") or {}
+        metrics = comparison.get("local_metrics")
+        if not metrics or comparison.get("judged_by") == "prejudge" or not record.get("scored", True):
+            continue
+        margins.append(metrics["margin"])
+        winners.append(comparison.get("winner"))
+    return margins, winners
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description="校准本地预评判的跳过阈值")
+    parser.add_argument("results", help="以 --prejudge-calibrate 运行得到的结果日志（.jsonl）或结果文件（.json）")
+    parser.add_argument("--min-agreement", type=float, default=DEFAULT_MIN_AGREEMENT,
+                        help="建议阈值须达到的本地判定与 LLM 判定一致率")
+    args = parser.parse_args(argv)
+
+    margins, winners = load_calibration_records(args.results)
+    if not margins:
+        print("没有可用于校准的题目（需要有参考答案、且经 LLM 评判的记录）")
+        return
+    report = calibrate(margins, winners, min_agreement=args.min_agreement)
+    print(f"校准题目数: {len(margins)}")
+    print(f"{'阈值':>6} {'跳过':>6} {'跳过比例':>8} {'一致率':>8}")
+    for row in report["rows"]:
+        agreement = f"{row['agreement']:.1%}" if row["agreement"] is not None else "-"
+        print(f"{row['threshold']:>6.2f} {row['skipped']:>6} {row['skip_rate']:>8.1%} {agreement:>8}")
+    if report["recommended"] is None:
+        print(f"\n没有阈值能达到 {args.min_agreement:.0%} 的一致率，建议不启用预评判")
+    else:
+        print(f"\n建议阈值: --prejudge {report['recommended']:.2f}")
+
+
+if __name__ == "__main__":
+    main()
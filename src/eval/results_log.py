@@ -0,0 +1,212 @@
+"""
+结果日志 - 每题完成即追加写入 JSONL，支持断点续跑，并由日志流式生成最终结果文件
+
+    ResultsLog          追加写入（每行一题，写完立即 flush），进程崩溃最多丢失正在写的那一行
+    IncrementalSummary  逐题累加的汇总统计，与一次性汇总全部记录的结果一致
+    build_artifact      从日志按题目顺序流式写出紧凑的最终 JSON（不把所有记录读入内存）
+
+续跑时（--resume）日志中已有 ID 的题目会被跳过；末尾被截断的半行会被丢弃。
+"""
+import os
+import json
+import hashlib
+import threading
+from typing import Dict, Iterable, Iterator, List
+
+
+def assign_ids(questions: List[Dict]) -> List:
+    """
+    每题的 ID：优先使用数据集中的 id 字段，否则由问题文本生成；
+    重复的问题文本依次加 #2、#3 后缀，保证续跑时能一一对应
+    """
+    ids = []
+    seen = {}
+    for q_data in questions:
+        if q_data.get("id") is not None:
+            ids.append(q_data["id"])
+            continue
+        base = "q-" + hashlib.sha1(q_data["question"].encode("utf-8")).hexdigest()[:12]
+        seen[base] = seen.get(base, 0) + 1
+        ids.append(base if seen[base] == 1 else f"{base}#{seen[base]}")
+    return ids
+
+
+def default_log_path(output_file: str) -> str:
+    """结果文件旁的同名 .jsonl 日志"""
+    return os.path.splitext(output_file)[0] + ".jsonl"
+
+
+def _dumps(record: Dict) -> str:
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+
+
+def iter_log(path: str) -> Iterator[tuple]:
+    """逐行读取日志，产出 (行起始偏移, 记录)；无法解析的行（如崩溃时写了一半）被跳过"""
+    if not os.path.exists(path):
+        return
+    with open(path, "rb") as f:
+        offset = 0
+        for line in f:
+            start = offset
+            offset += len(line)
+            if not line.strip():
+                continue
+            try:
+                yield start, json.loads(line)
+            except json.JSONDecodeError:
+                print(f"警告: 跳过日志中无法解析的一行（偏移 {start}）")
+
+
+class ResultsLog:
+    """
+    追加写入的 JSONL 结果日志
+
+    Args:
+        path: 日志路径
+        resume: True 时保留已有内容继续追加，否则清空重写
+    """
+
+    def __init__(self, path: str, resume: bool = False):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        if resume:
+            self._drop_partial_line()
+        else:
+            open(path, "w", encoding="utf-8").close()
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def _drop_partial_line(self) -> None:
+        # 崩溃时最后一行可能只写了一半；截断到最后一个换行，避免与新记录粘连
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb+") as f:
+            data = f.read()
+            if data and not data.endswith(b"\n"):
+                f.truncate(data.rfind(b"\n") + 1)
+
+    def records(self) -> Iterator[Dict]:
+        for _, record in iter_log(self.path):
+            yield record
+
+    def append(self, record: Dict) -> None:
+        line = _dumps(record) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+class IncrementalSummary:
+    """逐题累加的汇总统计；summary() / timing() 与 summarize / summarize_timing 的结果相同"""
+
+    def __init__(self):
+        self.records = 0
+        self.scored = 0
+        self.pure_total = 0
+        self.rag_total = 0
+        self.wins = {"rag_agent": 0, "pure_agent": 0, "tie": 0}
+        self.parse_failures = 0
+        self.context_records = 0
+        self.prompt_tokens = 0
+        self.tokens_saved = 0
+        self.timed = 0
+        self.critical_path = 0.0
+        self.serial_baseline = 0.0
+
+    def add(self, record: Dict) -> None:
+        self.records += 1
+        if record.get("scored", True):
+            comparison = record["comparison"]
+            self.scored += 1
+            self.pure_total += comparison.get("pure_agent_score", 5)
+            self.rag_total += comparison.get("rag_agent_score", 5)
+            winner = comparison.get("winner", "tie")
+            self.wins[winner if winner in ("rag_agent", "pure_agent") else "tie"] += 1
+        elif record["comparison"].get("parse_failed"):
+            self.parse_failures += 1
+
+        context = record.get("rag_context_stats")
+        if context:
+            self.context_records += 1
+            self.prompt_tokens += context.get("prompt_tokens", context["prompt_tokens_estimated"])
+            self.tokens_saved += context["tokens_saved"]
+
+        timing = record.get("timing")
+        if timing:
+            self.timed += 1
+            self.critical_path += timing["critical_path_s"]
+            self.serial_baseline += timing["serial_baseline_s"]
+
+    def extend(self, records: Iterable[Dict]) -> "IncrementalSummary":
+        for record in records:
+            self.add(record)
+        return self
+
+    def summary(self) -> Dict:
+        n = self.scored
+        summary = {
+            "pure_agent_avg_score": round(self.pure_total / n, 2) if n > 0 else 0,
+            "rag_agent_avg_score": round(self.rag_total / n, 2) if n > 0 else 0,
+            "rag_wins": self.wins["rag_agent"],
+            "pure_wins": self.wins["pure_agent"],
+            "ties": self.wins["tie"],
+            "rag_win_rate": round(self.wins["rag_agent"] / n * 100, 1) if n > 0 else 0,
+            "pure_win_rate": round(self.wins["pure_agent"] / n * 100, 1) if n > 0 else 0,
+            "unscored": self.records - n,
+            "judge_parse_failures": self.parse_failures
+        }
+        if self.context_records:
+            summary["rag_avg_prompt_tokens"] = round(self.prompt_tokens / self.context_records, 1)
+            summary["rag_context_tokens_saved"] = self.tokens_saved
+        return summary
+
+    def timing(self) -> Dict:
+        if not self.timed:
+            return None
+        return {
+            "avg_critical_path_s": round(self.critical_path / self.timed, 3),
+            "avg_serial_baseline_s": round(self.serial_baseline / self.timed, 3),
+            "critical_path_speedup": round(self.serial_baseline / self.critical_path, 2)
+            if self.critical_path > 0 else None,
+        }
+
+
+def iter_ordered(path: str, order: List) -> Iterator[Dict]:
+    """
+    按 order 中的 ID 顺序读取日志记录（同一 ID 以最后一次写入为准），
+    日志中其余 ID 的记录按写入顺序排在后面。只在内存中保留 ID -> 偏移。
+    """
+    offsets = {}
+    for offset, record in iter_log(path):
+        offsets.pop(record.get("id"), None)
+        offsets[record.get("id")] = offset
+
+    ordered = [offsets.pop(qid) for qid in order if qid in offsets]
+    ordered.extend(offsets.values())
+    with open(path, "rb") as f:
+        for offset in ordered:
+            f.seek(offset)
+            yield json.loads(f.readline())
+
+
+def build_artifact(log_path: str, output_file: str, meta: Dict, order: List) -> None:
+    """
+    由日志流式写出最终结果文件：meta 中的字段 + 按 order 排列的 "questions"
+
+    先写入临时文件再替换，中途失败不会留下损坏的结果文件。
+    """
+    tmp_path = output_file + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write("{")
+        for key, value in meta.items():
+            f.write(f"{json.dumps(key)}:{_dumps(value)},")
+        f.write('"questions":[')
+        for i, record in enumerate(iter_ordered(log_path, order)):
+            f.write(("," if i else "") + _dumps(record))
+        f.write("]}")
+    os.replace(tmp_path, output_file)
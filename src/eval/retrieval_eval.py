@@ -0,0 +1,256 @@
+"""
+检索质量评测 - 不调用 LLM，直接评估 RAGAgent 的检索结果
+
+每个基准问题在标注文件（默认 src/eval/retrieval_gold.json）中对应若干"黄金片段"：
+
+    {"questions": [{"id": 1, "spans": [{"text": "timestamp server works by taking a hash"}]}]}
+
+一个片段可以用以下条件的任意组合描述，检索到的文档满足全部条件即视为命中该片段：
+    chunk_id   文档的 chunk ID（与切分方式绑定，修改 chunk_size 后失效）
+    source     来源文件名（只比较文件名，不比较目录）
+    pages      页码列表（PyPDFLoader 的 page 元数据，从 0 开始）
+    text       文档内容中包含的原文（忽略大小写与空白差异；不受切分方式影响）
+
+所有问题通过 RAGAgent.retrieve_many 批量检索一次，指标以 NumPy 矩阵运算得到：
+    recall@k   前 k 个结果覆盖的黄金片段比例
+    MRR        第一个命中文档排名的倒数的平均值
+    nDCG@k     每个结果首次覆盖新片段时记增益 1，理想排序为前 min(片段数, k) 个结果各覆盖一个片段
+另外逐题调用 RAGAgent.retrieve 测量单次检索延迟的 p50/p95/p99。该计时在批量检索之前进行，
+并绕过磁盘 embedding 缓存，因此延迟包含查询向量化，而不只是缓存命中后的向量检索。
+
+用法（可作为检索改动的离线回归检查）:
+    python src/eval/retrieval_eval.py --k 1,3,5,10 --fail-under recall@5=0.8
+"""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import contextlib
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+EVAL_DIR = os.path.dirname(os.path.abspath(__file__))
+GOLD_PATH = os.path.join(EVAL_DIR, "retrieval_gold.json")
+QUESTIONS_PATH = os.path.join(EVAL_DIR, "test_questions.json")
+DEFAULT_KS = (1, 3, 5, 10)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def _normalize(text: str) -> str:
+    return _WHITESPACE_RE.sub(" ", text or "").strip().lower()
+
+
+def load_gold(path: str = GOLD_PATH) -> Dict:
+    """{问题 ID: 黄金片段列表}"""
+    with open(path, "r", encoding="utf-8") as f:
+        return {entry["id"]: entry["spans"] for entry in json.load(f)["questions"]}
+
+
+def span_matches(span: Dict, doc) -> bool:
+    """文档是否满足片段的全部条件"""
+    metadata = doc.metadata or {}
+    if "chunk_id" in span and span["chunk_id"] not in (doc.id, metadata.get("chunk_id")):
+        return False
+    if "source" in span and os.path.basename(str(metadata.get("source", ""))) != span["source"]:
+        return False
+    if "pages" in span and metadata.get("page") not in span["pages"]:
+        return False
+    if "text" in span and _normalize(span["text"]) not in _normalize(doc.page_content):
+        return False
+    return True
+
+
+def coverage_tensor(retrieved: Sequence[Sequence], spans: Sequence[Sequence[Dict]], k: int) -> tuple:
+    """
+    Returns:
+        covers: bool [问题, 片段, 排名]，第 r 个结果是否命中第 s 个片段
+        span_mask: bool [问题, 片段]，标记有效片段（各题片段数不同，按最多的补齐）
+    """
+    max_spans = max((len(s) for s in spans), default=0)
+    covers = np.zeros((len(retrieved), max_spans, k), dtype=bool)
+    span_mask = np.zeros((len(retrieved), max_spans), dtype=bool)
+    for q, (docs, gold) in enumerate(zip(retrieved, spans)):
+        span_mask[q, :len(gold)] = True
+        for s, span in enumerate(gold):
+            for r, doc in enumerate(docs[:k]):
+                covers[q, s, r] = span_matches(span, doc)
+    return covers, span_mask
+
+
+def retrieval_metrics(covers: np.ndarray, span_mask: np.ndarray, ks: Sequence[int]) -> Dict:
+    """
+    由覆盖矩阵计算各题的 recall@k、倒数排名与 nDCG@k
+
+    Returns:
+        {"recall@k": [各题], "ndcg@k": [各题], "reciprocal_rank": [各题], "first_hit_rank": [各题，未命中为 None]}
+    """
+    n_questions, _, depth = covers.shape
+    covers = covers & span_mask[:, :, None]
+    n_spans = span_mask.sum(axis=1)
+
+    # 命中任一片段的结果
+    hits = covers.any(axis=1)
+    has_hit = hits.any(axis=1)
+    first_hit = hits.argmax(axis=1)
+    reciprocal_rank = np.where(has_hit, 1.0 / (first_hit + 1), 0.0)
+
+    # 每个片段首次被覆盖的排名（未覆盖为 depth）；某排名覆盖了新片段则增益为 1
+    first_cover = np.where(covers.any(axis=2), covers.argmax(axis=2), depth)
+    ranks = np.arange(depth)
+    gains = ((first_cover[:, :, None] == ranks[None, None, :]) & span_mask[:, :, None]).any(axis=1)
+    discounts = 1.0 / np.log2(ranks + 2)
+
+    metrics = {
+        "reciprocal_rank": reciprocal_rank,
+        "first_hit_rank": [int(r) + 1 if h else None for r, h in zip(first_hit, has_hit)],
+    }
+    safe_spans = np.maximum(n_spans, 1)
+    for k in ks:
+        covered = (first_cover < k) & span_mask
+        metrics[f"recall@{k}"] = np.where(n_spans > 0, covered.sum(axis=1) / safe_spans, 0.0)
+        dcg = (gains[:, :k] * discounts[:k]).sum(axis=1)
+        ideal = np.cumsum(discounts[:k])[np.clip(np.minimum(n_spans, k) - 1, 0, k - 1)]
+        metrics[f"ndcg@{k}"] = np.where(n_spans > 0, dcg / ideal, 0.0)
+    return metrics
+
+
+def percentiles(samples_ms: Sequence[float]) -> Dict:
+    arr = np.asarray(samples_ms, dtype=np.float64)
+    if arr.size == 0:
+        return {"p50": None, "p95": None, "p99": None}
+    return {f"p{p}": round(float(np.percentile(arr, p)), 3) for p in (50, 95, 99)}
+
+
+@contextlib.contextmanager
+def _embedding_cache_bypassed(agent):
+    """计时期间让 agent 直接使用底层 embedding 模型（CachedEmbeddings.inner）"""
+    cached = getattr(agent, "embeddings", None)
+    inner = getattr(cached, "inner", None)
+    if inner is None:
+        yield
+        return
+    agent._embeddings = inner
+    try:
+        yield
+    finally:
+        agent._embeddings = cached
+
+
+def evaluate_retrieval(agent, questions: List[Dict], gold: Dict, ks: Sequence[int] = DEFAULT_KS,
+                       measure_latency: bool = True) -> Dict:
+    """
+    Args:
+        agent: RAGAgent（或提供 retrieve_many / retrieve 的对象）
+        questions: 问题列表（需有 id 与 question）
+        gold: load_gold 的结果；没有标注的问题不参与评测
+        ks: 计算 recall@k / nDCG@k 的截断位置
+
+    Returns:
+        汇总指标、延迟分位数与逐题结果
+    """
+    ks = sorted(set(ks))
+    depth = ks[-1]
+    labeled = [q for q in questions if gold.get(q.get("id"))]
+    queries = [q["question"] for q in labeled]
+
+    # 单次检索先于批量检索计时，且不走 embedding 缓存，否则只测到缓存命中后的检索
+    latencies_ms = []
+    if measure_latency:
+        with _embedding_cache_bypassed(agent):
+            for query in queries:
+                started = time.perf_counter()
+                agent.retrieve(query, k=depth)
+                latencies_ms.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    batches = agent.retrieve_many(queries, k=depth)
+    batch_seconds = time.perf_counter() - started
+    retrieved = [[doc for doc, _ in batch] for batch in batches]
+
+    covers, span_mask = coverage_tensor(retrieved, [gold[q["id"]] for q in labeled], depth)
+    per_question = retrieval_metrics(covers, span_mask, ks)
+
+    summary = {"mrr": round(float(np.mean(per_question["reciprocal_rank"])), 4) if labeled else 0.0}
+    for k in ks:
+        for name in ("recall", "ndcg"):
+            values = per_question[f"{name}@{k}"]
+            summary[f"{name}@{k}"] = round(float(np.mean(values)), 4) if labeled else 0.0
+
+    return {
+        "num_questions": len(labeled),
+        "ks": ks,
+        "metrics": summary,
+        "latency_ms": percentiles(latencies_ms),
+        "batch_seconds": round(batch_seconds, 4),
+        "questions": [
+            {
+                "id": q["id"],
+                "question": q["question"],
+                "first_hit_rank": per_question["first_hit_rank"][i],
+                **{f"recall@{k}": round(float(per_question[f"recall@{k}"][i]), 4) for k in ks},
+            } for i, q in enumerate(labeled)
+        ],
+    }
+
+
+def check_thresholds(metrics: Dict, fail_under: Sequence[str]) -> List[str]:
+    """检查 "指标=最小值" 形式的门槛，返回未达标的描述"""
+    failures = []
+    for rule in fail_under:
+        name, _, minimum = rule.partition("=")
+        if name not in metrics:
+            raise ValueError(f"Unknown metric '{name}', expected one of {', '.join(metrics)}")
+        if metrics[name] < float(minimum):
+            failures.append(f"{name} = {metrics[name]} < {minimum}")
+    return failures
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="检索质量评测（recall@k / MRR / nDCG / 延迟），不调用 LLM")
+    parser.add_argument("--questions", default=QUESTIONS_PATH, help="问题文件")
+    parser.add_argument("--gold", default=GOLD_PATH, help="黄金片段标注文件")
+    parser.add_argument("--k", default=",".join(map(str, DEFAULT_KS)), help="截断位置，逗号分隔")
+    parser.add_argument("--backend", choices=["chroma", "numpy"], help="向量库后端（默认 RAG_VECTOR_BACKEND）")
+    parser.add_argument("--hybrid", action="store_true", help="BM25 + 向量混合检索")
+    parser.add_argument("--output", help="评测结果 JSON 输出路径")
+    parser.add_argument("--fail-under", action="append", default=[], metavar="METRIC=MIN",
+                        help="回归门槛，如 recall@5=0.8（可重复）；未达标时以退出码 1 结束")
+    args = parser.parse_args(argv)
+
+    from agents.rag_agent import RAGAgent
+
+    with open(args.questions, "r", encoding="utf-8") as f:
+        questions = json.load(f)["questions"]
+    agent = RAGAgent(backend=args.backend, hybrid=args.hybrid or None, require_llm=False)
+    if not agent.store_available:
+        print("向量库不存在，请先运行 ingest")
+        return 1
+
+    report = evaluate_retrieval(agent, questions, load_gold(args.gold),
+                                ks=[int(k) for k in args.k.split(",")])
+    print(f"评测问题数: {report['num_questions']}（后端 {agent.backend}{'，混合检索' if agent.hybrid else ''}）")
+    for name, value in report["metrics"].items():
+        print(f"  {name:<10} {value:.4f}")
+    latency = report["latency_ms"]
+    print(f"  单次检索延迟 p50={latency['p50']}ms p95={latency['p95']}ms p99={latency['p99']}ms，"
+          f"批量检索 {report['batch_seconds']}s")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存到: {args.output}")
+
+    failures = check_thresholds(report["metrics"], args.fail_under)
+    for failure in failures:
+        print(f"未达标: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+"""
+题目调度器 - 每个问题内并行运行 Pure Agent 与 RAG Agent，两者完成后立即评判
+
+旧流程按 Pure 生成 -> RAG 检索 -> RAG 生成 -> 评判 串行执行。Pure Agent 与
+RAG Agent 互不依赖，因此这里：
+    1. 所有问题的批量检索在后台线程运行，同时各题的 Pure Agent 生成已经开始；
+    2. 每题的 RAG 生成在其检索结果就绪后立即开始；
+    3. 两个回答都就绪后立即启动评判（或交给批量评判器攒批）。
+
+每题记录关键路径耗时（实际墙钟时间）与串行基线（各阶段耗时之和，即旧流程
+所需时间），二者之差即并行节省的时间。每题在自己的 instrumentation trace 中运行，
+on_done 回调时 current_trace() 即该题记录到的各阶段 span。
+"""
+import time
+import asyncio
+from typing import Awaitable, Callable, Dict, List
+
+from instrumentation import span, trace
+
+
+async def _timed(awaitable: Awaitable) -> tuple:
+    started = time.perf_counter()
+    result = await awaitable
+    return result, time.perf_counter() - started
+
+
+def timing_record(pure_s: float, retrieval_s: float, rag_s: float, judge_s: float,
+                  critical_path_s: float) -> Dict:
+    """单题各阶段耗时、关键路径与串行基线（秒）"""
+    serial = pure_s + retrieval_s + rag_s + judge_s
+    return {
+        "pure_s": round(pure_s, 3),
+        "retrieval_s": round(retrieval_s, 3),
+        "rag_generation_s": round(rag_s, 3),
+        "judge_s": round(judge_s, 3),
+        "critical_path_s": round(critical_path_s, 3),
+        "serial_baseline_s": round(serial, 3),
+        "saved_s": round(serial - critical_path_s, 3),
+    }
+
+
+class QuestionScheduler:
+    """
+    Args:
+        pure_agent: 提供 aquery_with_reasoning(question)
+        rag_agent: 提供 aquery_with_reasoning(question, prefetched) 与 retrieve_many(questions)
+        judge: async judge(q_data, pure_result, rag_result) -> comparison
+        concurrency: 同时处理的问题数
+    """
+
+    def __init__(self, pure_agent, rag_agent, judge: Callable[..., Awaitable[Dict]], concurrency: int = 1):
+        self.pure_agent = pure_agent
+        self.rag_agent = rag_agent
+        self.judge = judge
+        self.concurrency = max(1, concurrency)
+        self.retrieval_seconds = None
+
+    async def answer_question(self, q_data: Dict, retrieval: Awaitable) -> tuple:
+        """
+        运行单个问题的两个 Agent
+
+        Args:
+            retrieval: 可 await 的检索结果（(Document, score) 列表）
+
+        Returns:
+            (pure_result, rag_result, (pure_s, retrieval_s, rag_s), started)
+        """
+        question = q_data["question"]
+        started = time.perf_counter()
+
+        # Pure Agent 生成立即开始，与检索及 RAG 生成重叠
+        pure_task = asyncio.ensure_future(_timed(self.pure_agent.aquery_with_reasoning(question)))
+
+        docs, retrieval_s = await _timed(retrieval)
+        rag_result, rag_s = await _timed(self.rag_agent.aquery_with_reasoning(question, prefetched=docs))
+        pure_result, pure_s = await pure_task
+        return pure_result, rag_result, (pure_s, retrieval_s, rag_s), started
+
+    async def judge_question(self, q_data: Dict, answered: tuple) -> tuple:
+        """评判 answer_question 的结果，返回 (pure_result, rag_result, comparison, timing)"""
+        pure_result, rag_result, (pure_s, retrieval_s, rag_s), started = answered
+        with span("judge"):
+            comparison, judge_s = await _timed(self.judge(q_data, pure_result, rag_result))
+        timing = timing_record(pure_s, retrieval_s, rag_s, judge_s, time.perf_counter() - started)
+        return pure_result, rag_result, comparison, timing
+
+    async def run_question(self, q_data: Dict, retrieval: Awaitable) -> tuple:
+        """
+        处理单个问题
+
+        Returns:
+            (pure_result, rag_result, comparison, timing)
+        """
+        return await self.judge_question(q_data, await self.answer_question(q_data, retrieval))
+
+    async def run(self, questions: List[Dict], on_done: Callable = None, prefetched: List = None) -> List[tuple]:
+        """
+        处理全部问题，按输入顺序返回 run_question 的结果
+
+        Args:
+            on_done: 可选回调 on_done(index, outcome)，每题完成时调用（用于打印进度）
+            prefetched: 已有的各题检索结果（多轮试验复用），提供时不再检索
+        """
+        async def retrieve_all():
+            if prefetched is not None:
+                self.retrieval_seconds = 0.0
+                return prefetched
+            started = time.perf_counter()
+            batches = await asyncio.to_thread(self.rag_agent.retrieve_many, [q["question"] for q in questions])
+            self.retrieval_seconds = round(time.perf_counter() - started, 3)
+            return batches
+
+        # 批量检索（一次 embedding + 一次批量搜索）在后台线程进行
+        batches = asyncio.ensure_future(retrieve_all())
+
+        async def retrieval_for(i: int):
+            return (await batches)[i]
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def process(i: int, q_data: Dict) -> tuple:
+            # 并发名额只限制 Agent 调用；评判在释放名额后进行，批量评判因此可以攒满一批
+            with trace():
+                async with semaphore:
+                    answered = await self.answer_question(q_data, retrieval_for(i))
+                outcome = await self.judge_question(q_data, answered)
+                if on_done is not None:
+                    on_done(i, outcome)
+            return outcome
+
+        return await asyncio.gather(*(process(i, q_data) for i, q_data in enumerate(questions)))
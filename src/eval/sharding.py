@@ -0,0 +1,280 @@
+"""
+分片执行 - 把问题集拆给多个进程 / 多台机器并行运行，再合并结果
+
+    run_experiment.py --shard i/N   只运行第 i 个分片（i 从 0 开始）；第 i 片为第 i、i+N、i+2N... 题，
+                                    划分只取决于问题文件，各机器独立运行结果一致
+    run_experiment.py --workers N   在本机启动 N 个分片进程（每个进程只加载一次 embedding 模型与向量库），
+                                    全部完成后自动合并
+    python src/eval/sharding.py merge 分片结果... --output 结果文件
+                                    合并各分片的结果文件（多机运行后把分片结果收集到一起再合并）
+
+每个分片的结果文件带有 "shard" 字段（分片序号、分片数、总题数与本片的题目 ID），
+合并时据此恢复原始题目顺序并检查分片是否齐全。合并结果的逐题记录写入同名 .jsonl 日志，
+再由日志流式生成最终结果文件，汇总由全部记录重新计算。
+
+本机启动时 Gemini 配额（LLM_RPM / LLM_TPM）按进程数均分，每个进程的数值计算线程数
+（OMP_NUM_THREADS / MKL_NUM_THREADS）为 CPU 核数 / N，避免超额调用与线程争抢。
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+from datetime import datetime
+from typing import Dict, List, Sequence
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from resources import DEFAULT_LLM_RPM, DEFAULT_LLM_TPM
+from eval.results_log import IncrementalSummary, ResultsLog, assign_ids, build_artifact, default_log_path
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+RUN_SCRIPT = os.path.join(PROJECT_ROOT, "run_experiment.py")
+
+# 本机启动时不转发给分片进程的选项（值个数）：由启动器决定或只应执行一次
+_LAUNCHER_OPTIONS = {"--workers": 1, "--shard": 1, "--output": 1, "--log": 1, "--metrics-file": 1,
+                     "--ingest": 0, "--corpus": 1}
+
+
+def parse_shard(spec: str) -> tuple:
+    """"i/N" -> (i, N)，要求 0 <= i < N"""
+    try:
+        index, count = (int(part) for part in spec.split("/"))
+    except ValueError:
+        raise ValueError(f"Invalid shard '{spec}', expected i/N such as 0/4")
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Invalid shard '{spec}': need 0 <= i < N")
+    return index, count
+
+
+def shard_questions(questions: List[Dict], index: int, count: int) -> tuple:
+    """
+    Returns:
+        (本片的问题列表（带全局题目 ID）, 分片信息)
+    """
+    ids = assign_ids(questions)
+    subset = [dict(q_data, id=qid) for qid, q_data in zip(ids[index::count], questions[index::count])]
+    return subset, {"index": index, "count": count, "total_questions": len(questions)}
+
+
+def shard_output_path(output_file: str, index: int, count: int) -> str:
+    root, ext = os.path.splitext(output_file)
+    return f"{root}.shard-{index}-of-{count}{ext or '.json'}"
+
+
+def _combine_stats(stats: Sequence[Dict]) -> Dict:
+    """逐字段累加各分片的计数类统计；比例类字段由累加后的计数重新计算"""
+    stats = [s for s in stats if s]
+    if not stats:
+        return None
+    combined = {}
+    for entry in stats:
+        for key, value in entry.items():
+            if "rate" in key:
+                continue
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                combined[key] = combined.get(key, 0) + value
+            else:
+                combined.setdefault(key, value)
+    if "hits" in combined and "misses" in combined:
+        total = combined["hits"] + combined["misses"]
+        combined["hit_rate"] = round(combined["hits"] / total, 4) if total else 0.0
+    return {key: round(value, 3) if isinstance(value, float) else value for key, value in combined.items()}
+
+
+def _combine_stages(stages: Sequence[Dict]) -> Dict:
+    """合并各分片的阶段耗时汇总（次数与总耗时相加，平均值重新计算）"""
+    combined = {}
+    for entry in stages:
+        for name, stats in (entry or {}).items():
+            total = combined.setdefault(name, {"count": 0, "total_ms": 0.0})
+            total["count"] += stats["count"]
+            total["total_ms"] += stats["total_ms"]
+    return {
+        name: {"count": t["count"], "total_ms": round(t["total_ms"], 1),
+               "mean_ms": round(t["total_ms"] / t["count"], 3) if t["count"] else 0.0}
+        for name, t in combined.items()
+    }
+
+
+def merge_shards(shard_files: Sequence[str], output_file: str, log_file: str = None) -> Dict:
+    """
+    合并各分片的结果文件
+
+    Args:
+        shard_files: 各分片的结果文件（顺序不限，须为同一次划分的全部分片）
+        output_file: 合并后的结果文件
+        log_file: 合并后的逐题日志（默认为 output_file 旁的同名 .jsonl）
+
+    Returns:
+        合并结果（不含逐题记录，逐题记录见 log_file 与 output_file）
+    """
+    if log_file is None:
+        log_file = default_log_path(output_file)
+    log = ResultsLog(log_file)
+    tally = IncrementalSummary()
+    shards = {}
+    try:
+        # 逐个读取分片，内存中只保留一个分片的记录
+        for path in shard_files:
+            with open(path, "r", encoding="utf-8") as f:
+                result = json.load(f)
+            info = result.get("shard")
+            if not info:
+                raise ValueError(f"{path} is not a shard result (no 'shard' field)")
+            if info["index"] in shards:
+                raise ValueError(f"Shard {info['index']} given twice ({shards[info['index']]['file']} and {path})")
+            records = result.pop("questions", [])
+            for record in records:
+                tally.add(record)
+                log.append(record)
+            shards[info["index"]] = dict(result, file=path)
+    finally:
+        log.close()
+
+    counts = {s["shard"]["count"] for s in shards.values()}
+    totals = {s["shard"]["total_questions"] for s in shards.values()}
+    if len(counts) != 1 or len(totals) != 1:
+        raise ValueError("Shard results come from different partitions (shard counts or question totals differ)")
+    count, total = counts.pop(), totals.pop()
+    missing = sorted(set(range(count)) - set(shards))
+    if missing:
+        raise ValueError(f"Missing shard(s) {', '.join(map(str, missing))} of {count}")
+
+    # 第 i 片的第 j 题是原问题集的第 i + j * N 题
+    ids_by_shard = [shards[i]["shard"]["ids"] for i in range(count)]
+    order = [ids_by_shard[p % count][p // count] for p in range(total) if p // count < len(ids_by_shard[p % count])]
+
+    ordered = [shards[i] for i in range(count)]
+    merged = {
+        "timestamp": datetime.now().isoformat(),
+        "num_questions": total,
+        "mode": ordered[0].get("mode"),
+        "concurrency": ordered[0].get("concurrency"),
+        "judge_batch_size": ordered[0].get("judge_batch_size"),
+        # 各分片并行运行，总用时取最慢的分片
+        "wall_time_seconds": max(s.get("wall_time_seconds", 0) for s in ordered),
+        "summary": tally.summary(),
+        "timing": tally.timing(),
+        "embedding_cache": _combine_stats([s.get("embedding_cache") for s in ordered]),
+        "rate_limiter": _combine_stats([s.get("rate_limiter") for s in ordered]),
+        "llm_cache": _combine_stats([s.get("llm_cache") for s in ordered]),
+        "judge": _combine_stats([s.get("judge") for s in ordered]),
+        "prejudge": _combine_stats([s.get("prejudge") for s in ordered]),
+        "coalescing": {
+            name: _combine_stats([s["coalescing"][name] for s in ordered if s.get("coalescing")])
+            for name in ("pure_agent", "rag_agent", "judge")
+        },
+        "stages": _combine_stages([s.get("stages") for s in ordered]),
+        "shards": [
+            {
+                "index": i,
+                "file": s["file"],
+                "num_questions": len(s["shard"]["ids"]),
+                "wall_time_seconds": s.get("wall_time_seconds"),
+                "summary": s.get("summary"),
+            } for i, s in enumerate(ordered)
+        ],
+    }
+    build_artifact(log_file, output_file, merged, order)
+    merged["log_file"] = log_file
+    return merged
+
+
+def _forwarded_args(argv: Sequence[str]) -> List[str]:
+    """去掉由启动器决定的选项，其余原样转发给分片进程"""
+    forwarded = []
+    skip = 0
+    for arg in argv:
+        if skip:
+            skip -= 1
+            continue
+        name = arg.split("=", 1)[0]
+        if name in _LAUNCHER_OPTIONS:
+            skip = _LAUNCHER_OPTIONS[name] if "=" not in arg else 0
+            continue
+        forwarded.append(arg)
+    return forwarded
+
+
+def worker_env(count: int, base: Dict = None) -> Dict:
+    """分片进程的环境变量：均分 Gemini 配额，限制每个进程的数值计算线程数"""
+    env = dict(os.environ if base is None else base)
+    env["LLM_RPM"] = str(float(env.get("LLM_RPM", DEFAULT_LLM_RPM)) / count)
+    env["LLM_TPM"] = str(float(env.get("LLM_TPM", DEFAULT_LLM_TPM)) / count)
+    threads = str(max(1, (os.cpu_count() or 1) // count))
+    env.setdefault("OMP_NUM_THREADS", threads)
+    env.setdefault("MKL_NUM_THREADS", threads)
+    return env
+
+
+def launch_local(workers: int, output_file: str, argv: Sequence[str] = (), script: str = RUN_SCRIPT) -> Dict:
+    """
+    在本机启动 workers 个分片进程，全部成功后合并结果
+
+    Args:
+        workers: 进程数（即分片数）
+        output_file: 合并后的结果文件；各分片写入旁边的 .shard-i-of-N.json，输出重定向到 .out 文件
+        argv: run_experiment.py 的其余命令行参数（原样转发，如 --concurrency、--resume）
+
+    Returns:
+        合并结果；有分片失败时抛出 RuntimeError（修复后加 --resume 重新启动即可续跑）
+    """
+    forwarded = _forwarded_args(argv)
+    env = worker_env(workers)
+    processes = []
+    for index in range(workers):
+        shard_file = shard_output_path(output_file, index, workers)
+        out_path = os.path.splitext(shard_file)[0] + ".out"
+        out = open(out_path, "w", encoding="utf-8")
+        command = [sys.executable, script, "--shard", f"{index}/{workers}", "--output", shard_file, *forwarded]
+        processes.append((index, shard_file, out_path, out, subprocess.Popen(
+            command, stdout=out, stderr=subprocess.STDOUT, env=env, cwd=PROJECT_ROOT)))
+        print(f"分片 {index}/{workers} 已启动（输出: {out_path}）")
+
+    failed = []
+    for index, shard_file, out_path, out, process in processes:
+        code = process.wait()
+        out.close()
+        if code != 0:
+            failed.append(f"{index}（退出码 {code}，见 {out_path}）")
+        print(f"分片 {index}/{workers} {'完成' if code == 0 else '失败'}")
+    if failed:
+        raise RuntimeError(f"Shard(s) failed: {', '.join(failed)}")
+
+    merged = merge_shards([shard_file for _, shard_file, *_ in processes], output_file)
+    print_merged(merged)
+    print(f"\n合并结果已保存到: {output_file}")
+    return merged
+
+
+def print_merged(merged: Dict) -> None:
+    summary = merged["summary"]
+    print("\n" + "=" * 60)
+    print(f"合并 {len(merged['shards'])} 个分片（共 {merged['num_questions']} 题）")
+    print("=" * 60)
+    print(f"Pure Agent 平均得分: {summary['pure_agent_avg_score']}")
+    print(f"RAG Agent 平均得分: {summary['rag_agent_avg_score']}")
+    print(f"RAG 获胜: {summary['rag_wins']} 次 ({summary['rag_win_rate']}%)")
+    print(f"Pure 获胜: {summary['pure_wins']} 次 ({summary['pure_win_rate']}%)")
+    print(f"平局: {summary['ties']} 次")
+    if summary["unscored"]:
+        print(f"未计分（调用失败）: {summary['unscored']} 题")
+    print(f"总用时（最慢分片）: {merged['wall_time_seconds']}s")
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description="分片实验结果合并")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    merge = subparsers.add_parser("merge", help="合并各分片的结果文件")
+    merge.add_argument("shards", nargs="+", help="分片结果文件（run_experiment.py --shard i/N 的输出）")
+    merge.add_argument("--output", required=True, help="合并后的结果文件")
+    merge.add_argument("--log", help="合并后的逐题 JSONL 日志（默认与 --output 同名的 .jsonl）")
+    args = parser.parse_args(argv)
+
+    merged = merge_shards(args.shards, args.output, args.log)
+    print_merged(merged)
+    print(f"\n合并结果已保存到: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+"""
+Instrumentation - lightweight spans for per-stage latency, size and token accounting
+
+Wrap a pipeline stage in span() to time it:
+
+    with span("vector_search", k=4) as s:
+        hits = search(...)
+        s.set(hits=len(hits))
+
+Every span is added to the process-wide SpanMetrics histograms (see
+resources.get_span_metrics) and, when a trace is active, to that trace.
+run_experiment opens one trace per question, so each record in the results
+file carries the spans of its own question under "spans". Traces and the
+component label ("pure_agent", "rag_agent", "judge") live in context
+variables, so they follow asyncio tasks and asyncio.to_thread; work handed
+to a plain thread pool has to be submitted through contextvars.copy_context().
+
+Stages recorded by the pipeline:
+    embed_query     query embedding (single or batched)
+    vector_search   nearest-neighbour search
+    lexical_search  BM25 search (hybrid mode)
+    context_build   chunk merging, budget packing and prompt construction
+    generation      one LLM call (prompt/response chars, prompt/output tokens, cached;
+                    streamed calls run until the stream is exhausted or closed)
+    judge           one question's judgement, including time waiting for a batch
+    parse           parsing the judge's JSON
+
+SpanMetrics.to_prometheus() renders the histograms in the Prometheus text
+exposition format, so the file can be served by a node_exporter textfile
+collector or loaded with any Prometheus client parser.
+"""
+import os
+import time
+import bisect
+import threading
+import contextlib
+import contextvars
+from typing import Dict, List
+
+# Seconds; roughly Prometheus' default buckets extended for slow LLM calls
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TOKEN_BUCKETS = (16, 64, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+
+METRIC_PREFIX = "rag_benchmark"
+
+_trace = contextvars.ContextVar("trace", default=None)
+_component = contextvars.ContextVar("component", default=None)
+
+
+class Span:
+    """One timed stage; attributes can be added while it runs with set()"""
+
+    __slots__ = ("stage", "component", "attrs", "duration")
+
+    def __init__(self, stage: str, component: str = None, attrs: Dict = None):
+        self.stage = stage
+        self.component = component
+        self.attrs = attrs or {}
+        self.duration = None
+
+    def set(self, **attrs) -> None:
+        self.attrs.update(attrs)
+
+    def to_dict(self) -> Dict:
+        record = {"stage": self.stage}
+        if self.component is not None:
+            record["component"] = self.component
+        record["ms"] = round(self.duration * 1000, 3)
+        record.update(self.attrs)
+        return record
+
+
+class Trace:
+    """The spans recorded while this trace was current (thread-safe)"""
+
+    def __init__(self):
+        self._spans = []
+        self._lock = threading.Lock()
+
+    def add(self, span: Span) -> None:
+        with self._lock:
+            self._spans.append(span)
+
+    def records(self) -> List[Dict]:
+        with self._lock:
+            return [span.to_dict() for span in self._spans]
+
+
+class _Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, buckets: tuple):
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float, buckets: tuple) -> None:
+        self.counts[bisect.bisect_left(buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class SpanMetrics:
+    """
+    Aggregated histograms over all spans, keyed by (stage, component):
+        <prefix>_stage_duration_seconds     every span
+        <prefix>_stage_tokens{kind=...}     spans reporting prompt_tokens / output_tokens
+        <prefix>_stage_chars_total{kind=}   prompt / response characters
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._durations = {}
+        self._tokens = {}
+        self._chars = {}
+
+    def observe(self, span: Span) -> None:
+        labels = (span.stage, span.component or "")
+        with self._lock:
+            durations = self._durations.setdefault(labels, _Histogram(DURATION_BUCKETS))
+            durations.observe(span.duration, DURATION_BUCKETS)
+            for kind in ("prompt", "output"):
+                tokens = span.attrs.get(f"{kind}_tokens")
+                if tokens is not None:
+                    histogram = self._tokens.setdefault(labels + (kind,), _Histogram(TOKEN_BUCKETS))
+                    histogram.observe(tokens, TOKEN_BUCKETS)
+            for kind in ("prompt", "response"):
+                chars = span.attrs.get(f"{kind}_chars")
+                if chars is not None:
+                    self._chars[labels + (kind,)] = self._chars.get(labels + (kind,), 0) + chars
+
+    def summary(self) -> Dict:
+        """{"component/stage": {count, total_ms, mean_ms}} for the results file"""
+        with self._lock:
+            items = sorted(self._durations.items())
+        return {
+            (f"{component}/{stage}" if component else stage): {
+                "count": h.count,
+                "total_ms": round(h.sum * 1000, 1),
+                "mean_ms": round(h.sum * 1000 / h.count, 3) if h.count else 0.0,
+            } for (stage, component), h in items
+        }
+
+    @staticmethod
+    def _labels(**labels) -> str:
+        """'{a="x",b="y"}' without empty labels ("" when none are left)"""
+        pairs = ",".join(f'{key}="{value}"' for key, value in labels.items() if value != "")
+        return "{" + pairs + "}" if pairs else ""
+
+    def _histogram_lines(self, name: str, help_text: str, histograms: Dict, buckets: tuple,
+                         label_names: tuple) -> List[str]:
+        lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+        for key, h in sorted(histograms.items()):
+            labels = dict(zip(label_names, key))
+            cumulative = 0
+            for bound, count in zip(buckets + (float("inf"),), h.counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{name}_bucket{self._labels(**labels, le=le)} {cumulative}")
+            lines.append(f"{name}_sum{self._labels(**labels)} {h.sum!r}")
+            lines.append(f"{name}_count{self._labels(**labels)} {h.count}")
+        return lines
+
+    def to_prometheus(self) -> str:
+        with self._lock:
+            durations = dict(self._durations)
+            tokens = dict(self._tokens)
+            chars = dict(self._chars)
+        lines = self._histogram_lines(f"{METRIC_PREFIX}_stage_duration_seconds",
+                                      "Duration of RAG pipeline stages", durations, DURATION_BUCKETS,
+                                      ("stage", "component"))
+        lines += self._histogram_lines(f"{METRIC_PREFIX}_stage_tokens",
+                                       "Prompt and output tokens per LLM call", tokens, TOKEN_BUCKETS,
+                                       ("stage", "component", "kind"))
+        name = f"{METRIC_PREFIX}_stage_chars_total"
+        lines += [f"# HELP {name} Prompt and response characters", f"# TYPE {name} counter"]
+        for (stage, component, kind), total in sorted(chars.items()):
+            lines.append(f"{name}{self._labels(stage=stage, component=component, kind=kind)} {total}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str) -> None:
+        """Write to path atomically (a textfile collector never sees a partial file)"""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp_path, path)
+
+
+@contextlib.contextmanager
+def span(stage: str, **attrs):
+    """Time the enclosed block as one stage"""
+    current = Span(stage, _component.get(), attrs)
+    started = time.perf_counter()
+    try:
+        yield current
+    except GeneratorExit:
+        # A generator (e.g. a text stream) closed before it was exhausted
+        current.set(closed=True)
+        raise
+    except BaseException as e:
+        current.set(error=type(e).__name__)
+        raise
+    finally:
+        current.duration = time.perf_counter() - started
+        trace = _trace.get()
+        if trace is not None:
+            trace.add(current)
+        from resources import get_span_metrics
+        get_span_metrics().observe(current)
+
+
+@contextlib.contextmanager
+def component(name: str):
+    """Label spans recorded inside the block (and in tasks/threads started from it) with name"""
+    token = _component.set(name)
+    try:
+        yield
+    finally:
+        _component.reset(token)
+
+
+@contextlib.contextmanager
+def trace():
+    """Collect the spans recorded inside the block into a new Trace"""
+    current = Trace()
+    token = _trace.set(current)
+    try:
+        yield current
+    finally:
+        _trace.reset(token)
+
+
+def current_trace() -> Trace:
+    return _trace.get()
+
+
+def usage_attrs(prompt: str, response) -> Dict:
+    """Size and token attributes of one LLM call for a generation span"""
+    try:
+        text = response.text or ""
+    except (AttributeError, ValueError):
+        # Blocked Gemini responses raise on .text
+        text = ""
+    usage = getattr(response, "usage_metadata", None)
+    return {
+        "prompt_chars": len(prompt) if isinstance(prompt, str) else len(str(prompt)),
+        "response_chars": len(text),
+        "prompt_tokens": getattr(usage, "prompt_token_count", None),
+        "output_tokens": getattr(usage, "candidates_token_count", None),
+        "cached": bool(getattr(response, "cached", False)),
+    }
@@ -0,0 +1,9 @@
+from .tokens import estimate_tokens
+from .rate_limiter import RateLimiter, TokenBucket, classify_error
+from .response_cache import ResponseCache, cache_key, cache_namespace
+from .generation import SAFETY_SETTINGS, agenerate, generate, reasoning_error
+from .clients import GeminiClient, LatencyModel, LLMClient, StubClient
+
+__all__ = ["RateLimiter", "TokenBucket", "classify_error", "ResponseCache", "cache_key", "cache_namespace",
+           "generate", "agenerate", "SAFETY_SETTINGS", "reasoning_error", "LLMClient", "GeminiClient", "StubClient",
+           "LatencyModel", "estimate_tokens"]
@@ -0,0 +1,330 @@
+"""
+LLM Clients - the model interface used by both agents and the evaluator
+
+Everything above this layer (llm.generation, llm.streaming, the agents and
+the Evaluator) only calls
+    generate_content(prompt, safety_settings=..., generation_config=..., stream=False)
+    generate_content_async(prompt, ...)
+and reads .text / .usage_metadata from the result (or iterates it when
+streaming). Two implementations:
+    GeminiClient   google.generativeai.GenerativeModel (the default)
+    StubClient     offline, deterministic answers and judge JSON with
+                   configurable latency distributions and error rates
+
+Select with LLM_BACKEND=gemini|stub (see resources.get_llm_client). The stub
+is configured through LLM_STUB_* variables, see StubClient.from_env.
+"""
+import os
+import re
+import abc
+import json
+import math
+import time
+import random
+import asyncio
+import hashlib
+import threading
+from types import SimpleNamespace
+
+from llm.tokens import estimate_tokens
+
+LLM_BACKENDS = ("gemini", "stub")
+
+_QUESTION_RE = re.compile(r"(?:^|\n)(?:## Question\n|Question:|问题:)\s*(.+)")
+_ITEM_RE = re.compile(r'<item id="(\d+)">(.*?)</item>', re.DOTALL)
+# Prompts whose retry attempts StubClient tracks at once (oldest dropped first)
+_MAX_TRACKED_PROMPTS = 10_000
+
+
+class LLMClient(abc.ABC):
+    """Interface shared by all backends"""
+
+    model_name = None
+
+    @abc.abstractmethod
+    def generate_content(self, prompt, safety_settings=None, generation_config=None, stream=False):
+        """Response with .text and .usage_metadata, or an iterable of chunks when stream=True"""
+
+    @abc.abstractmethod
+    async def generate_content_async(self, prompt, safety_settings=None, generation_config=None, stream=False):
+        """Awaitable response, or an async iterable of chunks when stream=True"""
+
+
+class GeminiClient(LLMClient):
+    """
+    Thin wrapper over google.generativeai.GenerativeModel
+
+    Attributes the SDK model exposes (model_name, _generation_config, ...) are
+    forwarded, so response-cache keys stay the same as for the bare model.
+    """
+
+    def __init__(self, model_name: str, model=None):
+        if model is None:
+            from resources import genai
+            model = genai().GenerativeModel(model_name)
+        self._name = model_name
+        self._model = model
+
+    @property
+    def model_name(self) -> str:
+        return getattr(self._model, "model_name", None) or self._name
+
+    def generate_content(self, prompt, **kwargs):
+        return self._model.generate_content(prompt, **kwargs)
+
+    async def generate_content_async(self, prompt, **kwargs):
+        return await self._model.generate_content_async(prompt, **kwargs)
+
+    def __getattr__(self, name):
+        if name == "_model":
+            raise AttributeError(name)
+        return getattr(self._model, name)
+
+
+# ---- Stub backend ----
+
+class LatencyModel:
+    """
+    Latency distribution in seconds, parsed from a spec string:
+        "0.2" / "fixed:0.2"        constant
+        "uniform:0.1:0.5"          uniform between bounds
+        "lognormal:0.8:0.5"        median 0.8 s, sigma 0.5 (long right tail)
+        "exp:0.5"                  exponential with mean 0.5 s
+    """
+
+    KINDS = ("fixed", "uniform", "lognormal", "exp")
+
+    def __init__(self, kind: str = "fixed", *params: float):
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown latency distribution '{kind}', expected one of {', '.join(self.KINDS)}")
+        expected = {"fixed": 1, "uniform": 2, "lognormal": 2, "exp": 1}[kind]
+        if len(params) != expected:
+            raise ValueError(f"Latency distribution '{kind}' takes {expected} parameter(s), got {len(params)}")
+        self.kind = kind
+        self.params = params
+
+    @classmethod
+    def parse(cls, spec: str) -> "LatencyModel":
+        parts = str(spec).strip().split(":")
+        if len(parts) == 1:
+            return cls("fixed", float(parts[0]))
+        return cls(parts[0].lower(), *(float(p) for p in parts[1:]))
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "fixed":
+            return self.params[0]
+        if self.kind == "uniform":
+            return rng.uniform(*self.params)
+        if self.kind == "lognormal":
+            median, sigma = self.params
+            return rng.lognormvariate(math.log(median), sigma) if median > 0 else 0.0
+        mean = self.params[0]
+        return rng.expovariate(1.0 / mean) if mean > 0 else 0.0
+
+    def __repr__(self) -> str:
+        return ":".join([self.kind, *(f"{p:g}" for p in self.params)])
+
+
+class StubRateLimitError(Exception):
+    """Simulated 429 / quota exhaustion"""
+    code = 429
+
+
+class StubServiceUnavailable(Exception):
+    """Simulated transient 503"""
+    code = 503
+
+
+class _StubStream:
+    """Iterable (sync or async) of text chunks paced like a streaming response"""
+
+    def __init__(self, chunks: list, first_delay: float, chunk_delay: float, usage):
+        self._chunks = chunks
+        self._first_delay = first_delay
+        self._chunk_delay = chunk_delay
+        self.usage_metadata = usage
+
+    def __iter__(self):
+        for i, text in enumerate(self._chunks):
+            time.sleep(self._first_delay if i == 0 else self._chunk_delay)
+            yield SimpleNamespace(text=text)
+
+    async def __aiter__(self):
+        for i, text in enumerate(self._chunks):
+            await asyncio.sleep(self._first_delay if i == 0 else self._chunk_delay)
+            yield SimpleNamespace(text=text)
+
+
+def _digest(text: str) -> int:
+    return int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+
+
+class StubClient(LLMClient):
+    """
+    Offline stand-in for Gemini with deterministic output
+
+    Answers are canned (answers: question -> text) or templated from the
+    question; judge prompts (single or batched) get well-formed JSON whose
+    scores are derived from a hash of the question, so repeated runs give
+    identical results. Each call sleeps for a latency drawn from `latency`
+    (time to first chunk when streaming, plus `chunk_delay` per further chunk)
+    and fails with probability `error_rate` (503) or `rate_limit_rate` (429).
+    Draws are seeded per prompt and attempt, so they do not depend on
+    scheduling order.
+
+    Args:
+        model_name: Reported model name (part of the response-cache key)
+        latency: LatencyModel or spec string
+        error_rate: Probability of a retryable 503 per call
+        rate_limit_rate: Probability of a 429 per call
+        chunk_delay: Seconds between streamed chunks after the first
+        chunk_chars: Approximate characters per streamed chunk
+        answers: Optional canned answers keyed by question text
+        seed: Seed for latency and error draws
+    """
+
+    def __init__(self, model_name: str = "stub", latency="0", error_rate: float = 0.0,
+                 rate_limit_rate: float = 0.0, chunk_delay: float = 0.0, chunk_chars: int = 40,
+                 answers: dict = None, seed: int = 0):
+        if not 0.0 <= error_rate + rate_limit_rate <= 1.0:
+            raise ValueError("error_rate + rate_limit_rate must be between 0 and 1")
+        self.model_name = f"stub/{model_name}"
+        self.latency = latency if isinstance(latency, LatencyModel) else LatencyModel.parse(latency)
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.chunk_delay = chunk_delay
+        self.chunk_chars = max(1, chunk_chars)
+        self.answers = answers or {}
+        self.seed = seed
+        self._attempts = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    @classmethod
+    def from_env(cls, model_name: str = "stub") -> "StubClient":
+        """
+        Build from LLM_STUB_LATENCY, LLM_STUB_ERROR_RATE, LLM_STUB_RATE_LIMIT_RATE,
+        LLM_STUB_CHUNK_DELAY, LLM_STUB_SEED and LLM_STUB_ANSWERS (path to a JSON
+        object mapping questions to answers)
+        """
+        answers = None
+        answers_path = os.getenv("LLM_STUB_ANSWERS")
+        if answers_path:
+            with open(answers_path, "r", encoding="utf-8") as f:
+                answers = json.load(f)
+        return cls(
+            model_name,
+            latency=os.getenv("LLM_STUB_LATENCY", "0"),
+            error_rate=float(os.getenv("LLM_STUB_ERROR_RATE", 0)),
+            rate_limit_rate=float(os.getenv("LLM_STUB_RATE_LIMIT_RATE", 0)),
+            chunk_delay=float(os.getenv("LLM_STUB_CHUNK_DELAY", 0)),
+            answers=answers,
+            seed=int(os.getenv("LLM_STUB_SEED", 0)),
+        )
+
+    # ---- content ----
+
+    @staticmethod
+    def _question(prompt: str, first: bool = False) -> str:
+        matches = _QUESTION_RE.findall(prompt)
+        if not matches:
+            return prompt.strip().splitlines()[-1]
+        return (matches[0] if first else matches[-1]).strip()
+
+    def _verdict(self, text: str) -> dict:
+        # Keyed on the question only, so batched and single judging agree
+        h = _digest(self._question(text, first=True))
+        pure, rag = 4 + h % 6, 4 + (h >> 8) % 7
+        winner = "tie" if pure == rag else ("pure_agent" if pure > rag else "rag_agent")
+        return {"pure_agent_score": pure, "rag_agent_score": rag, "winner": winner, "analysis": "stub verdict"}
+
+    def respond(self, prompt: str) -> str:
+        """The deterministic response text for a prompt"""
+        h = _digest(prompt)
+        if "pure_agent_score" in prompt:
+            items = _ITEM_RE.findall(prompt)
+            if items:
+                return json.dumps([{"id": int(item_id), **self._verdict(body)} for item_id, body in items])
+            return json.dumps(self._verdict(prompt))
+        if '"accuracy"' in prompt:
+            scores = {name: 4 + (h >> (8 * i)) % 7
+                      for i, name in enumerate(("accuracy", "completeness", "relevance", "clarity"))}
+            scores["overall"] = round(sum(scores.values()) / len(scores), 1)
+            scores["reasoning"] = "stub evaluation"
+            return json.dumps(scores)
+
+        question = self._question(prompt)
+        if question in self.answers:
+            return self.answers[question]
+        grounded = "Reference Materials" in prompt and "No reference materials available" not in prompt
+        source = "the reference materials" if grounded else "general knowledge"
+        return (f"## Question Analysis\nThe question asks: {question}\n\n"
+                f"## Reasoning Process\nAnswer derived from {source}.\n\n"
+                f"## Final Answer\nStub answer #{h % 10000:04d} to: {question}")
+
+    def _usage(self, prompt: str, text: str):
+        prompt_tokens = estimate_tokens(prompt)
+        output_tokens = estimate_tokens(text)
+        return SimpleNamespace(prompt_token_count=prompt_tokens, candidates_token_count=output_tokens,
+                               total_token_count=prompt_tokens + output_tokens)
+
+    def _chunks(self, text: str) -> list:
+        return [text[i:i + self.chunk_chars] for i in range(0, len(text), self.chunk_chars)] or [""]
+
+    # ---- simulation ----
+
+    def _draw(self, prompt: str) -> tuple:
+        """
+        (latency, error or None) for this attempt at prompt
+
+        Attempts are counted per prompt until one succeeds, so retries draw
+        fresh outcomes while a repeated request replays the same sequence.
+        """
+        key = _digest(prompt)
+        with self._lock:
+            self.calls += 1
+            attempt = self._attempts.pop(key, 0)
+        rng = random.Random(f"{self.seed}:{key}:{attempt}")
+        latency = max(0.0, self.latency.sample(rng))
+        roll = rng.random()
+        if roll < self.rate_limit_rate:
+            error = StubRateLimitError("429 Resource has been exhausted (stub)")
+        elif roll < self.rate_limit_rate + self.error_rate:
+            error = StubServiceUnavailable("503 Service temporarily unavailable (stub)")
+        else:
+            return latency, None
+        with self._lock:
+            self._attempts[key] = attempt + 1
+            if len(self._attempts) > _MAX_TRACKED_PROMPTS:
+                del self._attempts[next(iter(self._attempts))]
+        return latency, error
+
+    def generate_content(self, prompt, safety_settings=None, generation_config=None, stream=False):
+        prompt = prompt if isinstance(prompt, str) else str(prompt)
+        latency, error = self._draw(prompt)
+        text = self.respond(prompt)
+        usage = self._usage(prompt, text)
+        if stream:
+            if error is not None:
+                time.sleep(latency)
+                raise error
+            return _StubStream(self._chunks(text), latency, self.chunk_delay, usage)
+        time.sleep(latency + self.chunk_delay * (len(self._chunks(text)) - 1))
+        if error is not None:
+            raise error
+        return SimpleNamespace(text=text, usage_metadata=usage)
+
+    async def generate_content_async(self, prompt, safety_settings=None, generation_config=None, stream=False):
+        prompt = prompt if isinstance(prompt, str) else str(prompt)
+        latency, error = self._draw(prompt)
+        text = self.respond(prompt)
+        if stream:
+            if error is not None:
+                await asyncio.sleep(latency)
+                raise error
+            # Consumed with "async for", like the Gemini SDK's async streaming response
+            return _StubStream(self._chunks(text), latency, self.chunk_delay, self._usage(prompt, text))
+        await asyncio.sleep(latency + self.chunk_delay * (len(self._chunks(text)) - 1))
+        if error is not None:
+            raise error
+        return SimpleNamespace(text=text, usage_metadata=self._usage(prompt, text))
@@ -0,0 +1,119 @@
+"""
+Generation helpers - every Gemini call goes through the shared rate limiter
+
+Token reservations are estimated before the call (prompt estimate plus a fixed
+allowance for the answer) and corrected from usage_metadata afterwards. When
+the response cache is enabled, hits are returned without touching the limiter
+or the network. Each call is recorded as an instrumentation "generation"
+span with the prompt/response sizes and token counts.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from llm.tokens import estimate_tokens
+from llm.response_cache import cache_key
+from instrumentation import span, usage_attrs
+
+# Output tokens reserved per call until the real usage is known
+OUTPUT_TOKENS_ESTIMATE = 1024
+
+# Safety settings the agents answer with, to reduce blocking
+SAFETY_SETTINGS = [
+    {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
+]
+
+
+def reasoning_error(e) -> str:
+    """Answer text recorded when a reasoning-format generation fails"""
+    error_msg = str(e)
+    if "API key" in error_msg or "PermissionDenied" in error_msg:
+        return f"Error: API key issue - {error_msg}. Please update your GOOGLE_API_KEY."
+    return f"Error: Unable to generate response - {error_msg}"
+
+
+def _reserved_tokens(prompt) -> int:
+    return estimate_tokens(prompt if isinstance(prompt, str) else str(prompt)) + OUTPUT_TOKENS_ESTIMATE
+
+
+def _used_tokens(response) -> int:
+    usage = getattr(response, "usage_metadata", None)
+    return getattr(usage, "total_token_count", None) or None
+
+
+def _limiter(limiter):
+    if limiter is not None:
+        return limiter
+    from resources import get_rate_limiter
+    return get_rate_limiter()
+
+
+def _cache(cache):
+    if cache is not None:
+        return cache
+    from resources import get_response_cache
+    return get_response_cache()
+
+
+def _lookup(cache, model, prompt, kwargs) -> tuple:
+    if cache is None:
+        return None, None
+    key = cache_key(model, prompt, kwargs.get("safety_settings"), kwargs.get("generation_config"))
+    return key, cache.get(key)
+
+
+def _store(cache, key, response) -> None:
+    if cache is None:
+        return
+    try:
+        cache.put(key, response)
+    except ValueError:
+        # Blocked / empty responses have no text; they are not cached
+        pass
+
+
+def generate(model, prompt, limiter=None, cache=None, **kwargs):
+    """model.generate_content under the shared RPM/TPM budgets, with retries"""
+    with span("generation") as current:
+        response = _generate(model, prompt, limiter, cache, **kwargs)
+        current.set(**usage_attrs(prompt, response))
+        return response
+
+
+def _generate(model, prompt, limiter, cache, **kwargs):
+    cache = _cache(cache)
+    key, cached = _lookup(cache, model, prompt, kwargs)
+    if cached is not None:
+        return cached
+
+    limiter = _limiter(limiter)
+    reserved = _reserved_tokens(prompt)
+    response = limiter.call(model.generate_content, prompt, tokens=reserved, **kwargs)
+    limiter.adjust_tokens(reserved, _used_tokens(response))
+    _store(cache, key, response)
+    return response
+
+
+async def agenerate(model, prompt, limiter=None, cache=None, **kwargs):
+    """Async variant of generate using model.generate_content_async"""
+    with span("generation") as current:
+        response = await _agenerate(model, prompt, limiter, cache, **kwargs)
+        current.set(**usage_attrs(prompt, response))
+        return response
+
+
+async def _agenerate(model, prompt, limiter, cache, **kwargs):
+    cache = _cache(cache)
+    key, cached = _lookup(cache, model, prompt, kwargs)
+    if cached is not None:
+        return cached
+
+    limiter = _limiter(limiter)
+    reserved = _reserved_tokens(prompt)
+    response = await limiter.acall(model.generate_content_async, prompt, tokens=reserved, **kwargs)
+    limiter.adjust_tokens(reserved, _used_tokens(response))
+    _store(cache, key, response)
+    return response
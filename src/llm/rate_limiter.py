@@ -0,0 +1,225 @@
+"""
+Rate Limiter - shared request/token budgets with adaptive backoff and retries
+
+One RateLimiter is shared by PureAgent, RAGAgent and Evaluator (see
+resources.get_rate_limiter). Every call reserves one request from the
+requests-per-minute bucket and its estimated tokens from the tokens-per-minute
+bucket. Reservations may drive a bucket negative; the caller then waits until
+the deficit has refilled, so concurrent callers queue up fairly and the same
+logic serves blocking and async code.
+
+On a quota / 429 error all callers pause for the server's retry hint (or an
+exponential backoff with full jitter) and the refill rate is halved; it
+recovers additively with each success. Other transient errors (5xx, timeouts,
+dropped connections) are retried with backoff; anything else is raised at once.
+"""
+import re
+import time
+import random
+import asyncio
+import threading
+from typing import Callable
+
+# Status codes / exception names treated as retryable
+RATE_LIMIT_CODES = {429}
+TRANSIENT_CODES = {500, 502, 503, 504}
+RATE_LIMIT_NAMES = {"ResourceExhausted", "TooManyRequests"}
+TRANSIENT_NAMES = {
+    "ServiceUnavailable", "InternalServerError", "DeadlineExceeded", "GatewayTimeout", "BadGateway",
+    "ServerError", "ConnectionError", "TimeoutError", "RemoteDisconnected",
+}
+_RETRY_HINT_RE = re.compile(r"retry in ([0-9.]+)\s*s|retry_delay\s*\{\s*seconds:\s*(\d+)", re.IGNORECASE)
+
+# Adaptive rate bounds: the refill rate never drops below this fraction of the budget
+MIN_RATE_FACTOR = 0.1
+RATE_RECOVERY_STEP = 0.05
+
+
+def classify_error(error: Exception) -> str:
+    """"rate_limit", "transient", or None for errors that should not be retried"""
+    code = getattr(error, "code", None)
+    name = type(error).__name__
+    message = str(error).lower()
+    if code in RATE_LIMIT_CODES or name in RATE_LIMIT_NAMES or "429" in message \
+            or "quota" in message or "resource has been exhausted" in message:
+        return "rate_limit"
+    if code in TRANSIENT_CODES or name in TRANSIENT_NAMES or isinstance(error, (ConnectionError, TimeoutError)) \
+            or "503" in message or "deadline exceeded" in message or "temporarily unavailable" in message:
+        return "transient"
+    return None
+
+
+def retry_hint(error: Exception) -> float:
+    """Server-suggested retry delay in seconds, if the error carries one"""
+    match = _RETRY_HINT_RE.search(str(error))
+    if not match:
+        return None
+    return float(match.group(1) or match.group(2))
+
+
+class TokenBucket:
+    """
+    Token bucket that hands out reservations instead of blocking
+
+    Args:
+        capacity: Maximum burst (tokens held when full)
+        rate: Refill rate in tokens per second
+    """
+
+    def __init__(self, capacity: float, rate: float, clock: Callable[[], float] = time.monotonic):
+        self.capacity = float(capacity)
+        self.rate = float(rate)
+        self.tokens = float(capacity)
+        self._clock = clock
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount: float) -> float:
+        """Take amount tokens now; returns how long the caller must wait before using them"""
+        with self._lock:
+            self._refill(self._clock())
+            self.tokens -= min(amount, self.capacity)
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def refund(self, amount: float) -> None:
+        """Give back (or, if negative, additionally take) tokens after the fact"""
+        with self._lock:
+            self._refill(self._clock())
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+    def set_rate(self, rate: float) -> None:
+        with self._lock:
+            self._refill(self._clock())
+            self.rate = rate
+
+
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute limiter with adaptive backoff
+
+    Args:
+        rpm: Requests per minute budget
+        tpm: Tokens (prompt + output) per minute budget
+        max_retries: Retries after the first attempt for retryable errors
+        base_delay: First backoff step in seconds (doubles per attempt)
+        max_delay: Upper bound for a single backoff
+    """
+
+    def __init__(self, rpm: float = 60, tpm: float = 250_000, max_retries: int = 5, base_delay: float = 1.0,
+                 max_delay: float = 60.0, clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep, rng: random.Random = None):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._clock = clock
+        self._sleep = sleep
+        self._rng = rng or random.Random()
+        self._lock = threading.Lock()
+
+        self.requests = TokenBucket(rpm, rpm / 60.0, clock)
+        self.tokens = TokenBucket(tpm, tpm / 60.0, clock)
+        self.rate_factor = 1.0
+        self._blocked_until = 0.0
+        self.counters = {"calls": 0, "retries": 0, "rate_limited": 0, "transient_errors": 0,
+                         "failures": 0, "waited_seconds": 0.0}
+
+    # ---- budgets ----
+
+    def reserve(self, tokens: int = 0) -> float:
+        """Reserve one request and tokens; returns the wait before the call may start"""
+        wait = max(self.requests.reserve(1), self.tokens.reserve(tokens))
+        with self._lock:
+            wait = max(wait, self._blocked_until - self._clock())
+            self.counters["waited_seconds"] += max(wait, 0.0)
+        return max(wait, 0.0)
+
+    def adjust_tokens(self, reserved: int, actual: int) -> None:
+        """Correct a token reservation once the real usage is known"""
+        if actual is not None:
+            self.tokens.refund(reserved - actual)
+
+    def _apply_rate_factor(self) -> None:
+        self.requests.set_rate(self.rpm / 60.0 * self.rate_factor)
+        self.tokens.set_rate(self.tpm / 60.0 * self.rate_factor)
+
+    def on_success(self) -> None:
+        with self._lock:
+            if self.rate_factor < 1.0:
+                self.rate_factor = min(1.0, self.rate_factor + RATE_RECOVERY_STEP)
+                self._apply_rate_factor()
+
+    def backoff(self, attempt: int, error: Exception, kind: str) -> float:
+        """Delay before the next attempt; rate limits also pause every caller and slow the buckets"""
+        delay = self._rng.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        with self._lock:
+            if kind == "rate_limit":
+                self.counters["rate_limited"] += 1
+                hint = retry_hint(error)
+                if hint is not None:
+                    delay = min(self.max_delay, hint) + self._rng.uniform(0, self.base_delay)
+                self._blocked_until = max(self._blocked_until, self._clock() + delay)
+                self.rate_factor = max(MIN_RATE_FACTOR, self.rate_factor / 2)
+                self._apply_rate_factor()
+            else:
+                self.counters["transient_errors"] += 1
+            self.counters["retries"] += 1
+        return delay
+
+    # ---- calls ----
+
+    def _failed(self, attempt: int, error: Exception) -> str:
+        kind = classify_error(error)
+        if kind is None or attempt >= self.max_retries:
+            with self._lock:
+                self.counters["failures"] += 1
+            return None
+        return kind
+
+    def call(self, fn: Callable, *args, tokens: int = 0, **kwargs):
+        """Run fn under the budgets, retrying retryable errors; the last error is re-raised"""
+        with self._lock:
+            self.counters["calls"] += 1
+        for attempt in range(self.max_retries + 1):
+            self._sleep(self.reserve(tokens))
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                kind = self._failed(attempt, e)
+                if kind is None:
+                    raise
+                self._sleep(self.backoff(attempt, e, kind))
+                continue
+            self.on_success()
+            return result
+
+    async def acall(self, fn: Callable, *args, tokens: int = 0, **kwargs):
+        """Async variant of call; fn returns an awaitable"""
+        with self._lock:
+            self.counters["calls"] += 1
+        for attempt in range(self.max_retries + 1):
+            await asyncio.sleep(self.reserve(tokens))
+            try:
+                result = await fn(*args, **kwargs)
+            except Exception as e:
+                kind = self._failed(attempt, e)
+                if kind is None:
+                    raise
+                await asyncio.sleep(self.backoff(attempt, e, kind))
+                continue
+            self.on_success()
+            return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.counters)
+            stats["waited_seconds"] = round(stats["waited_seconds"], 3)
+            stats["rate_factor"] = round(self.rate_factor, 3)
+            stats["rpm"] = self.rpm
+            stats["tpm"] = self.tpm
+        return stats
@@ -0,0 +1,194 @@
+"""
+LLM Response Cache - content-addressed on-disk cache of generate_content results
+
+The key is a SHA-256 over the model name, the full prompt, the safety settings
+and the generation config (the model's defaults plus per-call overrides), so
+any change to what is sent to Gemini is a miss. Values are the response text
+and token usage. The SQLite file is bounded by total size and evicts
+least-recently-used entries.
+
+Enable with LLM_CACHE=1 (or run_experiment.py --llm-cache). Re-running an
+experiment then replays every agent answer and judge verdict without network
+access, and the results are identical.
+
+Repeated trials of the same experiment would otherwise replay trial 1
+verbatim; cache_namespace("trial-2") adds a namespace to every key made
+inside it, so each trial has its own (still replayable) entries.
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import contextlib
+import contextvars
+from types import SimpleNamespace
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+RESPONSE_CACHE_PATH = os.path.join(PROJECT_ROOT, ".cache", "llm_responses.sqlite3")
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+_USAGE_FIELDS = ("prompt_token_count", "candidates_token_count", "total_token_count")
+
+_namespace = contextvars.ContextVar("llm_cache_namespace", default=None)
+
+
+@contextlib.contextmanager
+def cache_namespace(name):
+    """Keys made inside this block (including tasks and threads started from it) include name"""
+    token = _namespace.set(name)
+    try:
+        yield
+    finally:
+        _namespace.reset(token)
+
+
+def _jsonable(value):
+    """Best-effort plain-data view of SDK config objects (dicts, protos, enums)"""
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, dict):
+        return {str(k): _jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    if hasattr(value, "to_dict"):
+        try:
+            return _jsonable(value.to_dict())
+        except TypeError:
+            # proto-plus messages expose to_dict on the class
+            return _jsonable(type(value).to_dict(value))
+    if hasattr(value, "__dict__"):
+        return _jsonable({k: v for k, v in vars(value).items() if not k.startswith("_")})
+    return str(value)
+
+
+def cache_key(model, prompt, safety_settings=None, generation_config=None) -> str:
+    """SHA-256 of everything that determines the response"""
+    parts = {
+        "model": getattr(model, "model_name", None) or type(model).__name__,
+        "system_instruction": _jsonable(getattr(model, "_system_instruction", None)),
+        "prompt": _jsonable(prompt),
+        "safety_settings": _jsonable(safety_settings if safety_settings is not None
+                                     else getattr(model, "_safety_settings", None)),
+        "generation_config": {
+            **(_jsonable(getattr(model, "_generation_config", None)) or {}),
+            **(_jsonable(generation_config) or {}),
+        },
+    }
+    namespace = _namespace.get()
+    if namespace is not None:
+        parts["namespace"] = namespace
+    canonical = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class CachedResponse:
+    """Stands in for a GenerateContentResponse replayed from the cache"""
+
+    cached = True
+
+    def __init__(self, text: str, usage: dict):
+        self.text = text
+        self.usage_metadata = SimpleNamespace(**{field: usage.get(field) for field in _USAGE_FIELDS})
+
+
+class ResponseCache:
+    """
+    SQLite-backed response cache with size-bounded LRU eviction.
+
+    Safe to share between threads and processes (WAL mode).
+    """
+
+    def __init__(self, path: str = RESPONSE_CACHE_PATH, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._last_stamp = 0.0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                text TEXT NOT NULL,
+                usage TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses(last_used)")
+        self._conn.commit()
+        # Running total of stored bytes (this connection's view), kept up to date by put/evict
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def _stamp(self) -> float:
+        # Strictly increasing, so LRU order holds even on coarse clocks
+        self._last_stamp = max(time.time(), self._last_stamp + 1e-6)
+        return self._last_stamp
+
+    def get(self, key: str) -> CachedResponse:
+        """The cached response for key, or None (counts a hit or a miss)"""
+        with self._lock:
+            row = self._conn.execute("SELECT text, usage FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (self._stamp(), key))
+            self._conn.commit()
+        return CachedResponse(row[0], json.loads(row[1]))
+
+    def put(self, key: str, response) -> None:
+        """Store a successful response (its text and token usage)"""
+        text = response.text
+        usage_metadata = getattr(response, "usage_metadata", None)
+        usage = {field: getattr(usage_metadata, field, None) for field in _USAGE_FIELDS}
+        usage_json = json.dumps(usage)
+        size = len(key) + len(text.encode("utf-8")) + len(usage_json)
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._total_bytes += size - (old[0] if old else 0)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, text, usage, size, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, text, usage_json, size, self._stamp()),
+            )
+            self._conn.commit()
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        # Other processes may have written too; re-read the real total before deleting
+        (self._total_bytes,) = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()
+        excess = self._total_bytes - self.max_bytes
+        if excess <= 0:
+            return
+        doomed = []
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY last_used"):
+            doomed.append((key,))
+            excess -= size
+            self._total_bytes -= size
+            if excess <= 0:
+                break
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", doomed)
+        self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "entries": len(self),
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,162 @@
+"""
+Streaming generation - yield text as Gemini produces it and time the stream
+
+stream_generate opens a streaming generate_content call under the shared rate
+limiter (connection errors are retried; a stream that fails midway is not)
+and yields text chunks. TextStream wraps any chunk iterator and records the
+user-facing latency numbers:
+    ttft_ms      time from the start of iteration to the first non-empty chunk
+    latency_ms   time until the stream is exhausted
+    chunks       number of non-empty chunks received
+"""
+import time
+import queue
+import threading
+import contextvars
+from types import SimpleNamespace
+from typing import Callable, Iterable, Iterator
+
+from llm.generation import _cache, _limiter, _lookup, _reserved_tokens, _store, _used_tokens
+from instrumentation import span, usage_attrs
+
+
+def stream_generate(model, prompt, limiter=None, cache=None, meta: dict = None, **kwargs) -> Iterator[str]:
+    """
+    Yield response text chunks from model.generate_content(..., stream=True)
+
+    Args:
+        meta: Optional dict filled in with "cached" and "usage_metadata" once known
+    """
+    meta = meta if meta is not None else {}
+    # One "generation" span from the call until the stream is exhausted or closed
+    with span("generation", streamed=True) as current:
+        cache = _cache(cache)
+        key, cached = _lookup(cache, model, prompt, kwargs)
+        if cached is not None:
+            meta.update(cached=True, usage_metadata=cached.usage_metadata)
+            current.set(**usage_attrs(prompt, cached))
+            yield cached.text
+            return
+
+        limiter = _limiter(limiter)
+        reserved = _reserved_tokens(prompt)
+        response = limiter.call(model.generate_content, prompt, tokens=reserved, stream=True, **kwargs)
+        parts = []
+        try:
+            for chunk in response:
+                text = chunk.text
+                if text:
+                    parts.append(text)
+                    yield text
+        finally:
+            # What was received so far, also when the consumer stops early
+            received = SimpleNamespace(text="".join(parts), usage_metadata=getattr(response, "usage_metadata", None))
+            current.set(**usage_attrs(prompt, received))
+
+        meta.update(cached=False, usage_metadata=received.usage_metadata)
+        limiter.adjust_tokens(reserved, _used_tokens(response))
+        _store(cache, key, received)
+
+
+class TextStream:
+    """
+    Single-use iterator over text chunks with timing metrics
+
+    Iterate to receive chunks as they arrive. Afterwards `text` holds the full
+    response, `metrics` the timings, `error` the failure message (if the stream
+    raised) and `result` whatever the finalize callback built from the stream.
+
+    Chunks are produced in the context the stream was created in, so spans
+    keep the caller's trace and component even when another thread iterates.
+    """
+
+    def __init__(self, chunks: Iterable[str], finalize: Callable[["TextStream"], dict] = None):
+        self._chunks = iter(chunks)
+        self._context = contextvars.copy_context()
+        self._finalize = finalize
+        self._started = False
+        self.parts = []
+        self.error = None
+        self.metrics = None
+        self.result = None
+
+    @property
+    def text(self) -> str:
+        return "".join(self.parts)
+
+    def __iter__(self) -> Iterator[str]:
+        if self._started:
+            raise RuntimeError("TextStream can only be iterated once")
+        self._started = True
+        started = time.perf_counter()
+        first = None
+        try:
+            while True:
+                try:
+                    text = self._context.run(next, self._chunks)
+                except StopIteration:
+                    break
+                if not text:
+                    continue
+                if first is None:
+                    first = time.perf_counter()
+                self.parts.append(text)
+                yield text
+        except Exception as e:
+            self.error = str(e)
+        finally:
+            close = getattr(self._chunks, "close", None)
+            if close is not None:
+                # Ends the generation span if the consumer stopped early
+                self._context.run(close)
+            finished = time.perf_counter()
+            self.metrics = {
+                "ttft_ms": round((first - started) * 1000, 1) if first is not None else None,
+                "latency_ms": round((finished - started) * 1000, 1),
+                "chunks": len(self.parts),
+                "chars": len(self.text),
+            }
+            if self._finalize is not None:
+                self.result = self._finalize(self)
+
+    def consume(self) -> dict:
+        """Drain the stream without printing; returns result (or metrics without a finalize callback)"""
+        for _ in self:
+            pass
+        return self.result if self._finalize is not None else self.metrics
+
+
+class BackgroundStream:
+    """
+    Consume a TextStream on a worker thread as soon as it is created
+
+    Chunks are buffered until the caller iterates, so two agents can generate
+    at the same time while their output is still printed one after the other.
+    error / metrics / result / text are forwarded once the stream is finished.
+    """
+
+    _DONE = object()
+
+    def __init__(self, stream: TextStream):
+        self.stream = stream
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._pump, daemon=True)
+        self._thread.start()
+
+    def _pump(self) -> None:
+        try:
+            for chunk in self.stream:
+                self._queue.put(chunk)
+        finally:
+            self._queue.put(self._DONE)
+
+    def __iter__(self) -> Iterator[str]:
+        while True:
+            chunk = self._queue.get()
+            if chunk is self._DONE:
+                self._thread.join()
+                return
+            yield chunk
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
@@ -0,0 +1,17 @@
+"""
+Token estimates shared by the LLM clients, the rate limiter and context packing
+"""
+import re
+
+_CJK_RE = re.compile(r"[\u3000-\u303f\u4e00-\u9fff\uff00-\uffef]")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap token estimate without a tokenizer round trip: one token per CJK
+    character and roughly four characters per token for everything else.
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
@@ -0,0 +1,155 @@
+"""
+BM25 Lexical Index - compact array-backed inverted index for exact-term retrieval
+
+Dense MiniLM retrieval is weak on exact terms (opcodes, constants, section
+names). This index is built at ingest time from the stored chunks and persisted
+next to chroma_db:
+    vocab.json     sorted list of terms; a term's id is its position
+    ids.json       chunk id of every document row
+    postings.npz   doc_ids (int32) and tfs (uint16) grouped by term,
+                   term_offsets (int64, len(vocab) + 1), doc_lens (int32)
+
+Postings for term t are doc_ids[term_offsets[t]:term_offsets[t + 1]].
+"""
+import os
+import re
+import json
+import math
+from collections import Counter
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DB_DIR = os.path.join(PROJECT_ROOT, "chroma_db")
+BM25_DIR = os.path.join(DB_DIR, "bm25")
+
+# Latin words/numbers, plus single CJK characters so Chinese questions still tokenize
+_TOKEN_RE = re.compile(r"[a-z0-9_]+|[\u4e00-\u9fff]")
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+class BM25Index:
+    """Okapi BM25 over an inverted index stored in flat NumPy arrays"""
+
+    def __init__(self, vocab: List[str], ids: List[str], doc_ids: np.ndarray, tfs: np.ndarray,
+                 term_offsets: np.ndarray, doc_lens: np.ndarray, k1: float = 1.5, b: float = 0.75):
+        self.vocab = vocab
+        self.term_to_id: Dict[str, int] = {term: i for i, term in enumerate(vocab)}
+        self.ids = ids
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        self.term_offsets = term_offsets
+        self.doc_lens = doc_lens
+        self.k1 = k1
+        self.b = b
+        self.avgdl = float(doc_lens.mean()) if len(doc_lens) else 0.0
+        # Per-document length normalization term of the BM25 denominator
+        self._norm = (k1 * (1.0 - b + b * doc_lens / max(self.avgdl, 1e-9))).astype(np.float32)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def build(cls, ids: Sequence[str], texts: Sequence[str]) -> "BM25Index":
+        """Build the index from chunk ids and their texts"""
+        term_ids: Dict[str, int] = {}
+        post_terms, post_docs, post_tfs = [], [], []
+        doc_lens = np.zeros(len(texts), dtype=np.int32)
+        for doc, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_lens[doc] = len(tokens)
+            for term, tf in Counter(tokens).items():
+                post_terms.append(term_ids.setdefault(term, len(term_ids)))
+                post_docs.append(doc)
+                post_tfs.append(min(tf, np.iinfo(np.uint16).max))
+
+        # Renumber terms alphabetically so vocab.json is stable across builds
+        vocab = sorted(term_ids)
+        remap = np.empty(len(term_ids), dtype=np.int64)
+        for new_id, term in enumerate(vocab):
+            remap[term_ids[term]] = new_id
+
+        terms = remap[np.asarray(post_terms, dtype=np.int64)] if post_terms else np.zeros(0, dtype=np.int64)
+        docs = np.asarray(post_docs, dtype=np.int32)
+        tfs = np.asarray(post_tfs, dtype=np.uint16)
+        order = np.lexsort((docs, terms))
+        counts = np.bincount(terms, minlength=len(vocab))
+        term_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        return cls(vocab, list(ids), docs[order], tfs[order], term_offsets, doc_lens)
+
+    @classmethod
+    def from_collection(cls, collection, batch_size: int = 5000) -> "BM25Index":
+        """Build the index from every chunk stored in a Chroma collection"""
+        ids, texts = [], []
+        total = collection.count()
+        for offset in range(0, total, batch_size):
+            batch = collection.get(include=["documents"], limit=batch_size, offset=offset)
+            ids.extend(batch["ids"])
+            texts.extend(batch["documents"])
+        return cls.build(ids, texts)
+
+    def save(self, index_dir: str = BM25_DIR) -> None:
+        os.makedirs(index_dir, exist_ok=True)
+        with open(os.path.join(index_dir, "vocab.json"), "w", encoding="utf-8") as f:
+            json.dump(self.vocab, f, ensure_ascii=False)
+        with open(os.path.join(index_dir, "ids.json"), "w", encoding="utf-8") as f:
+            json.dump(self.ids, f)
+        np.savez(
+            os.path.join(index_dir, "postings.npz"),
+            doc_ids=self.doc_ids, tfs=self.tfs, term_offsets=self.term_offsets, doc_lens=self.doc_lens,
+        )
+
+    @staticmethod
+    def exists(index_dir: str = BM25_DIR) -> bool:
+        return os.path.exists(os.path.join(index_dir, "postings.npz"))
+
+    @classmethod
+    def load(cls, index_dir: str = BM25_DIR) -> "BM25Index":
+        with open(os.path.join(index_dir, "vocab.json"), "r", encoding="utf-8") as f:
+            vocab = json.load(f)
+        with open(os.path.join(index_dir, "ids.json"), "r", encoding="utf-8") as f:
+            ids = json.load(f)
+        with np.load(os.path.join(index_dir, "postings.npz")) as data:
+            return cls(vocab, ids, data["doc_ids"], data["tfs"], data["term_offsets"], data["doc_lens"])
+
+    def search(self, query: str, k: int = 4) -> List[Tuple[str, float]]:
+        """Return up to k (chunk_id, bm25_score) pairs, best first; only documents sharing a term"""
+        n = len(self.ids)
+        if n == 0 or k <= 0:
+            return []
+        scores = np.zeros(n, dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = self.term_to_id.get(term)
+            if term_id is None:
+                continue
+            start, end = self.term_offsets[term_id], self.term_offsets[term_id + 1]
+            docs = self.doc_ids[start:end]
+            tf = self.tfs[start:end].astype(np.float32)
+            df = end - start
+            idf = math.log(1.0 + (n - df + 0.5) / (df + 0.5))
+            scores[docs] += idf * tf * (self.k1 + 1.0) / (tf + self._norm[docs])
+
+        matched = np.flatnonzero(scores)
+        if len(matched) == 0:
+            return []
+        if len(matched) > k:
+            matched = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        matched = matched[np.argsort(-scores[matched], kind="stable")]
+        return [(self.ids[i], float(scores[i])) for i in matched]
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """
+    Merge ranked id lists with reciprocal rank fusion: score = sum(1 / (k + rank)).
+
+    Returns (id, fused_score) pairs, best first.
+    """
+    fused: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            fused[item] = fused.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda pair: pair[1], reverse=True)
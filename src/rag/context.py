@@ -0,0 +1,202 @@
+"""
+Context Assembler - pack retrieved chunks into a token-budgeted prompt context
+
+Ingest splits with chunk_overlap=200, so neighbouring chunks from the same page
+repeat up to 200 characters. Before building the prompt, the assembler
+    1. merges overlapping (or, given start_index metadata, adjacent) chunks
+       from the same source and page into one segment,
+    2. drops near-duplicate segments (word-shingle Jaccard similarity),
+    3. fills the token budget in score order (retrieval order without scores).
+"""
+import re
+from typing import List, Sequence
+
+from llm.tokens import estimate_tokens
+
+DEFAULT_TOKEN_BUDGET = 1500
+# Shortest suffix/prefix match treated as chunk overlap rather than coincidence
+MIN_OVERLAP_CHARS = 20
+MAX_OVERLAP_CHARS = 400
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def _overlap(left: str, right: str) -> int:
+    """Length of the longest suffix of left that is a prefix of right"""
+    limit = min(len(left), len(right), MAX_OVERLAP_CHARS)
+    for size in range(limit, MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def _shingles(text: str, n: int = 3) -> set:
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < n:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + n]) for i in range(len(words) - n + 1)}
+
+
+class Segment:
+    """One or more merged chunks from the same source/page"""
+
+    def __init__(self, text: str, source: str, page, score, rank: int, start_index=None):
+        self.text = text
+        self.source = source
+        self.page = page
+        self.score = score
+        self.rank = rank
+        self.start_index = start_index
+        self.chunks = 1
+
+    def try_merge(self, other: "Segment") -> bool:
+        """Absorb other if the two overlap, are adjacent, or one contains the other"""
+        if other.text in self.text:
+            merged = self.text
+        elif self.text in other.text:
+            merged = other.text
+        elif self.start_index is not None and other.start_index is not None:
+            first, second = (self, other) if self.start_index <= other.start_index else (other, self)
+            gap = second.start_index - (first.start_index + len(first.text))
+            if gap > 0:
+                return False
+            merged = first.text + second.text[min(-gap, len(second.text)):]
+        else:
+            size = _overlap(self.text, other.text)
+            if size:
+                merged = self.text + other.text[size:]
+            else:
+                size = _overlap(other.text, self.text)
+                if not size:
+                    return False
+                merged = other.text + self.text[size:]
+
+        self.text = merged
+        self.chunks += other.chunks
+        self.rank = min(self.rank, other.rank)
+        if other.score is not None and (self.score is None or other.score > self.score):
+            self.score = other.score
+        if self.start_index is not None and other.start_index is not None:
+            self.start_index = min(self.start_index, other.start_index)
+        return True
+
+    def render(self) -> str:
+        return f"[Source: {self.source}]\n{self.text}"
+
+
+class PackedContext:
+    """The assembled context text and what packing did to it"""
+
+    def __init__(self, text: str, segments: List[Segment], stats: dict):
+        self.text = text
+        self.segments = segments
+        self.stats = stats
+
+
+class ContextAssembler:
+    """
+    Merge, de-duplicate and budget retrieved chunks.
+
+    Args:
+        token_budget: Maximum estimated tokens of context (None for unlimited)
+        dedup_threshold: Jaccard similarity at or above which a segment is a near-duplicate
+    """
+
+    def __init__(self, token_budget: int = DEFAULT_TOKEN_BUDGET, dedup_threshold: float = 0.8):
+        self.token_budget = token_budget
+        self.dedup_threshold = dedup_threshold
+
+    def assemble(self, docs: Sequence, scores: Sequence = None) -> PackedContext:
+        """
+        Args:
+            docs: Retrieved documents, best first
+            scores: Optional retrieval scores aligned with docs (higher is better)
+        """
+        if scores is None:
+            scores = [None] * len(docs)
+        raw_text = "\n\n".join(
+            f"[Source: {doc.metadata.get('source', 'unknown')}]\n{doc.page_content}" for doc in docs
+        )
+
+        # 1. Merge overlapping chunks within each (source, page)
+        segments: List[Segment] = []
+        for rank, (doc, score) in enumerate(zip(docs, scores)):
+            segment = Segment(
+                doc.page_content,
+                doc.metadata.get("source", "unknown"),
+                doc.metadata.get("page"),
+                score,
+                rank,
+                doc.metadata.get("start_index"),
+            )
+            merged = True
+            while merged:
+                merged = False
+                for existing in segments:
+                    if (existing.source, existing.page) == (segment.source, segment.page) \
+                            and existing.try_merge(segment):
+                        segments.remove(existing)
+                        segment = existing
+                        merged = True
+                        break
+            segments.append(segment)
+        segments.sort(key=lambda seg: seg.rank)
+        merged_count = len(docs) - len(segments)
+
+        # 2. Drop near-duplicates (e.g. the same passage in two files)
+        kept: List[Segment] = []
+        kept_shingles = []
+        for segment in segments:
+            shingles = _shingles(segment.text)
+            if any(shingles and other and len(shingles & other) / len(shingles | other) >= self.dedup_threshold
+                   for other in kept_shingles):
+                continue
+            kept.append(segment)
+            kept_shingles.append(shingles)
+        duplicates = len(segments) - len(kept)
+
+        # 3. Fill the budget in score order; rank (retrieval order, best first)
+        #    breaks ties and is the order when no scores were given
+        if kept and all(segment.score is not None for segment in kept):
+            kept.sort(key=lambda seg: (-seg.score, seg.rank))
+        packed: List[Segment] = []
+        used = 0
+        dropped = 0
+        truncated = False
+        for segment in kept:
+            tokens = estimate_tokens(segment.render()) + 1
+            if self.token_budget is None or used + tokens <= self.token_budget:
+                packed.append(segment)
+                used += tokens
+            elif not packed:
+                # Always include something: cut the best segment down to the budget
+                ratio = self.token_budget / tokens
+                segment.text = segment.text[:max(1, int(len(segment.text) * ratio) - 40)]
+                # The cut is a character estimate; trim until the rendered segment fits
+                # (a budget smaller than the source header itself still keeps one character)
+                excess = estimate_tokens(segment.render()) + 1 - self.token_budget
+                while excess > 0 and len(segment.text) > 1:
+                    segment.text = segment.text[:max(1, len(segment.text) - excess)]
+                    excess = estimate_tokens(segment.render()) + 1 - self.token_budget
+                packed.append(segment)
+                used += estimate_tokens(segment.render()) + 1
+                truncated = True
+            else:
+                dropped += 1
+
+        text = "\n\n".join(segment.render() for segment in packed)
+        raw_tokens = estimate_tokens(raw_text)
+        context_tokens = estimate_tokens(text)
+        stats = {
+            "chunks_in": len(docs),
+            "segments_out": len(packed),
+            "chunks_merged": merged_count,
+            "duplicates_dropped": duplicates,
+            "dropped_for_budget": dropped,
+            "truncated": truncated,
+            "token_budget": self.token_budget,
+            "raw_context_tokens": raw_tokens,
+            "context_tokens": context_tokens,
+            "tokens_saved": raw_tokens - context_tokens,
+        }
+        return PackedContext(text, packed, stats)
@@ -0,0 +1,253 @@
+"""
+Embedding model loading with a persistent on-disk cache
+
+Both ingestion and RAGAgent embed text with the same local model. Vectors are
+cached in SQLite keyed by (model name, hash of normalized text), so re-ingesting
+after a chunking change or re-asking a benchmark question reuses earlier work.
+The cache is bounded and evicts least-recently-used entries.
+"""
+import os
+import time
+import array
+import importlib
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from typing import Dict, List
+from langchain_core.embeddings import Embeddings
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+CACHE_DIR = os.path.join(PROJECT_ROOT, ".cache")
+EMBEDDING_CACHE_PATH = os.path.join(CACHE_DIR, "embeddings.sqlite3")
+
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+# "torch" (HuggingFaceEmbeddings), "onnx" (fp32 ONNX Runtime) or "onnx-int8".
+# A "module:factory" backend builds any other Embeddings (uncached), e.g. the
+# model-free one the offline benchmarks use.
+EMBEDDING_BACKENDS = ("torch", "onnx", "onnx-int8")
+DEFAULT_MAX_ENTRIES = 500_000
+# Cache hits queue their LRU timestamp; the queue is written with the next
+# put/evict, or once it holds this many entries
+TOUCH_BATCH = 1000
+
+
+def normalize_text(text: str) -> str:
+    """Normalize text before hashing: NFC unicode and collapsed whitespace"""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    SQLite-backed vector cache with LRU eviction.
+
+    Safe to share between threads; several processes may also open the same
+    file (WAL mode), e.g. ingestion workers.
+    """
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._puts_since_evict = 0
+        self._last_stamp = 0.0
+        self._touched = {}
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON embeddings(last_used)")
+        self._conn.commit()
+
+    def _stamp(self) -> float:
+        # Strictly increasing, so LRU order holds even on coarse clocks
+        self._last_stamp = max(time.time(), self._last_stamp + 1e-6)
+        return self._last_stamp
+
+    def _flush_touched(self) -> None:
+        """Write queued LRU timestamps (caller holds the lock and commits)"""
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+                [(stamp, model, h) for (model, h), stamp in self._touched.items()],
+            )
+            self._touched.clear()
+
+    def get_many(self, model: str, hashes: List[str]) -> Dict[str, List[float]]:
+        """Look up vectors by text hash, queueing a refresh of their LRU timestamp"""
+        found = {}
+        if not hashes:
+            return found
+        unique = list(dict.fromkeys(hashes))
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit
+            for i in range(0, len(unique), 500):
+                part = unique[i:i + 500]
+                placeholders = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *part],
+                ).fetchall()
+                for h, blob in rows:
+                    found[h] = array.array("f", blob).tolist()
+            if found:
+                now = self._stamp()
+                self._touched.update(((model, h), now) for h in found)
+                if len(self._touched) >= TOUCH_BATCH:
+                    self._flush_touched()
+                    self._conn.commit()
+        return found
+
+    def put_many(self, model: str, items: Dict[str, List[float]]) -> None:
+        if not items:
+            return
+        with self._lock:
+            now = self._stamp()
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector, last_used) VALUES (?, ?, ?, ?)",
+                [(model, h, array.array("f", vec).tobytes(), now) for h, vec in items.items()],
+            )
+            self._flush_touched()
+            self._conn.commit()
+            self._puts_since_evict += len(items)
+            if self._puts_since_evict >= 1000:
+                self._evict()
+
+    def _evict(self) -> None:
+        self._puts_since_evict = 0
+        self._flush_touched()
+        self._conn.commit()
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        excess = count - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE rowid IN "
+                "(SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+                (excess,),
+            )
+            self._conn.commit()
+
+    def evict(self) -> None:
+        """Trim the cache to max_entries now"""
+        with self._lock:
+            self._evict()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._flush_touched()
+            self._conn.commit()
+            self._conn.close()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that serves repeated texts from an EmbeddingCache.
+
+    Queries and documents share cache entries: for the sentence-transformers
+    models used here both are embedded identically.
+    """
+
+    def __init__(self, inner: Embeddings, model_name: str, cache: EmbeddingCache = None):
+        self.inner = inner
+        self.model_name = model_name
+        self.cache = cache if cache is not None else EmbeddingCache()
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    def _count(self, hits: int, misses: int) -> None:
+        with self._stats_lock:
+            self.hits += hits
+            self.misses += misses
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        hashes = [text_hash(t) for t in texts]
+        found = self.cache.get_many(self.model_name, hashes)
+
+        # Embed each distinct missing text once
+        missing = {}
+        for h, t in zip(hashes, texts):
+            if h not in found and h not in missing:
+                missing[h] = t
+        if missing:
+            vectors = self.inner.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            self.cache.put_many(self.model_name, computed)
+            found.update(computed)
+
+        self._count(len(texts) - len(missing), len(missing))
+        return [found[h] for h in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        h = text_hash(text)
+        found = self.cache.get_many(self.model_name, [h])
+        if h in found:
+            self._count(1, 0)
+            return found[h]
+        vector = self.inner.embed_query(text)
+        self.cache.put_many(self.model_name, {h: vector})
+        self._count(0, 1)
+        return vector
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "model": self.model_name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+def resolve_backend(backend: str = None) -> str:
+    """Embedding backend to use: the argument, else EMBEDDING_BACKEND, else torch"""
+    backend = backend or os.getenv("EMBEDDING_BACKEND") or "torch"
+    if ":" in backend:
+        return backend
+    backend = backend.lower()
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend '{backend}', expected one of {EMBEDDING_BACKENDS}")
+    return backend
+
+
+def load_embeddings(model_name: str = EMBEDDING_MODEL, use_cache: bool = True, backend: str = None) -> Embeddings:
+    """Build the local embedding model, wrapped in the on-disk cache"""
+    backend = resolve_backend(backend)
+    if ":" in backend:
+        module_name, _, factory = backend.partition(":")
+        return getattr(importlib.import_module(module_name), factory)()
+    if backend == "torch":
+        from langchain_huggingface import HuggingFaceEmbeddings
+
+        embeddings = HuggingFaceEmbeddings(
+            model_name=model_name,
+            model_kwargs={'device': 'cpu'}
+        )
+        cache_key = model_name
+    else:
+        from rag.onnx_embeddings import OnnxEmbeddings
+
+        embeddings = OnnxEmbeddings(model_name=model_name, quantized=backend == "onnx-int8")
+        # ONNX vectors match PyTorch only within tolerance, so they are cached separately
+        cache_key = f"{model_name}#{backend}"
+
+    if not use_cache or os.getenv("EMBEDDING_CACHE", "1") == "0":
+        return embeddings
+    return CachedEmbeddings(embeddings, cache_key)
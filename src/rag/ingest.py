@@ -1,66 +1,631 @@
 """
 Data Ingestion Script - Load PDF documents to vector database
 Uses local HuggingFace embeddings to avoid API quota limits
+
+Ingestion is incremental: every source file and every chunk is content-hashed,
+and a small manifest next to the vector database records what is already stored.
+Re-running on an unchanged corpus does no loading, splitting or embedding work.
+Changed files are streamed through overlapping parse/split/embed/write stages.
 """
 import os
-from langchain_community.document_loaders import PyPDFLoader, TextLoader
+import sys
+import glob
+import json
+import time
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Iterator
+from langchain_community.document_loaders import PyPDFLoader, TextLoader, BSHTMLLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_chroma import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
 from dotenv import load_dotenv
 
+# Allow running as a script (python src/rag/ingest.py) as well as rag.ingest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from rag.pipeline import Pipeline, Stage, StageStats, drain, peak_rss_mb
+from rag.embeddings import load_embeddings
+from rag.bm25 import BM25Index
+
 load_dotenv()
 
 # Get project root: src/rag -> src -> project_root
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
 DATA_DIR = os.path.join(PROJECT_ROOT, "data")
 DB_DIR = os.path.join(PROJECT_ROOT, "chroma_db")
+MANIFEST_NAME = "ingest_manifest.json"
+MANIFEST_VERSION = 1
+BM25_DIR_NAME = "bm25"
 
-def ingest_data():
-    documents = []
-    
-    # Load Bitcoin PDF
-    pdf_path = os.path.join(DATA_DIR, "bitcoin.pdf")
-    print(f"Looking for PDF at: {pdf_path}")
-    if os.path.exists(pdf_path):
-        print("Loading Bitcoin PDF...")
-        loader = PyPDFLoader(pdf_path)
-        documents.extend(loader.load())
-    
-    # Load Ethereum Whitepaper (Text)
-    eth_path = os.path.join(DATA_DIR, "ethereum.md")
-    if os.path.exists(eth_path):
-        print("Loading Ethereum Whitepaper...")
-        loader = TextLoader(eth_path, encoding="utf-8")
-        documents.extend(loader.load())
-
-    if not documents:
-        print("No documents found to ingest.")
-        return
+# Source files to ingest, relative to DATA_DIR
+SOURCES = ["bitcoin.pdf", "ethereum.md"]
+
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+EMBED_BATCH_SIZE = 64
+WRITE_BATCH_SIZE = 2048
+
+# File types picked up by corpus ingestion
+CORPUS_PATTERNS = ("**/*.pdf", "**/*.md", "**/*.markdown", "**/*.html", "**/*.htm", "**/*.txt")
+
+
+def _file_sha256(path: str) -> str:
+    """Hash a source file in 1 MiB blocks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _load_file(path: str) -> list:
+    """Load one source file into LangChain documents (one per PDF page)"""
+    lower = path.lower()
+    if lower.endswith(".pdf"):
+        return PyPDFLoader(path).load()
+    if lower.endswith((".html", ".htm")):
+        return BSHTMLLoader(path, open_encoding="utf-8", bs_kwargs={"features": "html.parser"}).load()
+    return TextLoader(path, encoding="utf-8").load()
+
+
+def _assign_chunk_ids(chunks: list) -> list:
+    """
+    Give every chunk a deterministic, content-derived ID.
 
-    print(f"Loaded {len(documents)} pages/documents.")
+    The ID hashes source, page and chunk text, so an unchanged chunk keeps its
+    ID across runs and only new or edited text needs embedding. Identical
+    chunks on the same page are disambiguated by their occurrence number.
+    """
+    seen = {}
+    ids = []
+    for chunk in chunks:
+        key = "\x00".join([
+            str(chunk.metadata.get("source", "")),
+            str(chunk.metadata.get("page", "")),
+            chunk.page_content,
+        ])
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        occurrence = seen.get(digest, 0)
+        seen[digest] = occurrence + 1
+        chunk_id = digest if occurrence == 0 else f"{digest}-{occurrence}"
+        chunk.metadata["chunk_id"] = chunk_id
+        ids.append(chunk_id)
+    return ids
 
-    # Split text
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-    chunks = text_splitter.split_documents(documents)
-    print(f"Split into {len(chunks)} chunks.")
 
-    # Use local HuggingFace embeddings (no API quota issues)
+def _manifest_path(db_dir: str) -> str:
+    return os.path.join(db_dir, MANIFEST_NAME)
+
+
+def load_manifest(db_dir: str = DB_DIR) -> dict:
+    """Load the ingest manifest, or an empty one if missing or unreadable"""
+    path = _manifest_path(db_dir)
+    if os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest.get("version") == MANIFEST_VERSION:
+                return manifest
+        except (OSError, ValueError):
+            pass
+        print(f"Ignoring unreadable manifest at {path}")
+    return {"version": MANIFEST_VERSION, "files": {}}
+
+
+def save_manifest(manifest: dict, db_dir: str = DB_DIR) -> None:
+    """Write the manifest atomically so a crash never leaves it half-written"""
+    os.makedirs(db_dir, exist_ok=True)
+    path = _manifest_path(db_dir)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _build_embeddings():
+    # Use local HuggingFace embeddings (no API quota issues), behind the embedding cache
     print("Using local HuggingFace embeddings...")
-    embeddings = HuggingFaceEmbeddings(
-        model_name="sentence-transformers/all-MiniLM-L6-v2",
-        model_kwargs={'device': 'cpu'}
-    )
-    
-    # Embed and store
-    print("Embedding and storing in ChromaDB...")
-    vectorstore = Chroma.from_documents(
-        documents=chunks, 
-        embedding=embeddings,
-        persist_directory=DB_DIR
-    )
+    return load_embeddings()
+
+
+def _open_vectorstore(db_dir: str, embeddings=None):
+    return Chroma(persist_directory=db_dir, embedding_function=embeddings)
+
+
+def _load_file_task(task: tuple) -> tuple:
+    """Process-pool entry point: load one file and pass its bookkeeping through"""
+    key, path, file_hash = task
+    return key, file_hash, _load_file(path)
+
+
+def _parse_files(tasks: list, workers: int) -> Iterator[tuple]:
+    """
+    Extract pages from changed files, yielding (key, file_hash, pages) per file.
+
+    With more than one worker, files are parsed in a process pool with at most
+    two files in flight per worker, so parsed pages never pile up in memory.
+    """
+    if workers <= 1 or len(tasks) <= 1:
+        for task in tasks:
+            yield _load_file_task(task)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        remaining = iter(tasks)
+        for task in remaining:
+            pending.add(pool.submit(_load_file_task, task))
+            if len(pending) >= workers * 2:
+                break
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+                task = next(remaining, None)
+                if task is not None:
+                    pending.add(pool.submit(_load_file_task, task))
+
+
+def _manifest_key(path: str) -> str:
+    """Manifest key: path relative to the project root, or absolute if outside it"""
+    path = os.path.abspath(path)
+    try:
+        rel = os.path.relpath(path, PROJECT_ROOT)
+    except ValueError:
+        # Different drive on Windows
+        rel = None
+    if rel is None or rel.startswith(".."):
+        return path.replace(os.sep, "/")
+    return rel.replace(os.sep, "/")
+
+
+def _reset_legacy_collection(db_dir: str, old_files: dict):
+    """
+    A collection built before the manifest existed holds chunks under random
+    IDs that we cannot diff against, so start that one over.
+    """
+    if old_files or not os.path.exists(db_dir):
+        return None
+    vectorstore = _open_vectorstore(db_dir)
+    if vectorstore._collection.count() > 0:
+        print("No ingest manifest found; rebuilding the existing collection.")
+        vectorstore.reset_collection()
+    return vectorstore
+
+
+def _plan(paths: list, old_files: dict, new_files: dict, stats: dict, verbose: bool = True):
+    """
+    Hash every source and keep only the files whose content changed.
+
+    Unchanged files are carried over into new_files. Returns the
+    (key, path, file_hash) tasks to process and the set of keys present.
+    """
+    tasks = []
+    present = set()
+    for path in paths:
+        if verbose:
+            print(f"Looking for source at: {path}")
+        if not os.path.exists(path):
+            continue
+
+        key = _manifest_key(path)
+        present.add(key)
+        file_hash = _file_sha256(path)
+        previous = old_files.get(key)
+        if previous and previous["sha256"] == file_hash:
+            new_files[key] = previous
+            stats["files_unchanged"] += 1
+            stats["chunks_kept"] += len(previous["chunk_ids"])
+        else:
+            tasks.append((key, path, file_hash))
+    return tasks, present
+
+
+def _managed_by_sources(key: str, entry: dict, source_dirs: set) -> bool:
+    """
+    Whether an ingest_data run owns this manifest entry: files in the same
+    directory as one of its sources that were not added by ingest_corpus
+    """
+    return "corpus" not in entry and key.rpartition("/")[0] in source_dirs
+
+
+def _delete_removed(vectorstore, old_files: dict, removed: list, stats: dict) -> None:
+    """Drop chunks of files that disappeared from the corpus"""
+    for key in removed:
+        chunk_ids = old_files[key]["chunk_ids"]
+        if chunk_ids:
+            vectorstore.delete(ids=chunk_ids)
+        stats["files_removed"] += 1
+        stats["chunks_deleted"] += len(chunk_ids)
+
+
+def _split_file(key: str, pages: list, old_ids: set, text_splitter) -> tuple:
+    """Split one file's pages and diff its chunk IDs against what is stored"""
+    chunks = text_splitter.split_documents(pages)
+    chunk_ids = _assign_chunk_ids(chunks)
+    fresh = [(cid, chunk) for cid, chunk in zip(chunk_ids, chunks) if cid not in old_ids]
+    stale_ids = sorted(old_ids - set(chunk_ids))
+    return chunk_ids, fresh, stale_ids
+
+
+def _rebuild_lexical_index(vectorstore, db_dir: str, stats: dict) -> None:
+    """Rebuild the BM25 index from the collection when its contents changed"""
+    index_dir = os.path.join(db_dir, BM25_DIR_NAME)
+    if not (stats["chunks_added"] or stats["chunks_deleted"]) and BM25Index.exists(index_dir):
+        return
+    started = time.perf_counter()
+    index = BM25Index.from_collection(vectorstore._collection)
+    index.save(index_dir)
+    print(f"BM25 index rebuilt: {len(index)} chunks, {len(index.vocab)} terms "
+          f"in {time.perf_counter() - started:.2f}s")
+
+
+def _new_stats() -> dict:
+    return {"files_changed": 0, "files_unchanged": 0, "files_removed": 0,
+            "chunks_added": 0, "chunks_deleted": 0, "chunks_kept": 0}
+
+
+def _print_summary(stats: dict, db_dir: str, report: dict = None) -> None:
     print("Ingestion complete!")
-    print(f"Vector database saved to: {DB_DIR}")
+    print(f"Files: {stats['files_changed']} changed, {stats['files_unchanged']} unchanged, "
+          f"{stats['files_removed']} removed")
+    print(f"Chunks: {stats['chunks_added']} embedded, {stats['chunks_deleted']} deleted, "
+          f"{stats['chunks_kept']} kept")
+    if report:
+        for stage in report.get("stages", []):
+            rate = stage[f"{stage['unit']}_per_sec"]
+            print(f"  {stage['stage']:<6} {stage['units']:>7} {stage['unit']:<6} "
+                  f"{stage['busy_seconds']:>8.2f}s busy  {rate:>9.1f} {stage['unit']}/sec")
+        print(f"  peak RSS: {report['peak_rss_mb']} MiB")
+        if "embedding_cache" in report:
+            cache_stats = report["embedding_cache"]
+            print(f"  embedding cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses "
+                  f"({cache_stats['hit_rate']:.1%} hit rate)")
+    print(f"Vector database saved to: {db_dir}")
+
+
+def ingest_data(sources: list = None, db_dir: str = DB_DIR, incremental: bool = True,
+                workers: int = None, batch_size: int = EMBED_BATCH_SIZE, queue_size: int = 8) -> dict:
+    """
+    Ingest source documents into the Chroma vector database.
+
+    Files are streamed through four overlapping stages - parse (process pool),
+    split, embed (batched) and write - connected by bounded queues, so peak
+    memory depends on batch and queue sizes rather than on corpus size.
+
+    Args:
+        sources: Absolute paths of files to ingest (defaults to SOURCES in DATA_DIR)
+        db_dir: Chroma persist directory; the manifest is stored inside it
+        incremental: Only embed new/changed chunks. When False, the collection
+            is rebuilt from scratch.
+        workers: Processes used for page extraction (defaults to min(4, CPUs))
+        batch_size: Chunks per embedding call / Chroma write
+        queue_size: Capacity of each queue between stages
+
+    Returns:
+        Counts of files and chunks that were added, deleted or skipped, plus
+        per-stage throughput and peak RSS under "pipeline"
+    """
+    if sources is None:
+        sources = [os.path.join(DATA_DIR, name) for name in SOURCES]
+    if workers is None:
+        workers = min(4, os.cpu_count() or 1)
+
+    stats = _new_stats()
+    manifest = load_manifest(db_dir) if incremental else {"version": MANIFEST_VERSION, "files": {}}
+    old_files = manifest["files"]
+    new_files = {}
+    vectorstore = _reset_legacy_collection(db_dir, old_files)
+
+    # Corpus files and sources kept elsewhere share the manifest; leave them alone
+    source_dirs = {_manifest_key(path).rpartition("/")[0] for path in sources}
+    others = {key: entry for key, entry in old_files.items()
+              if not _managed_by_sources(key, entry, source_dirs)}
+    tasks, present = _plan(sources, old_files, new_files, stats)
+    removed = [key for key in old_files if key not in present and key not in others]
+    if not tasks and not removed and not new_files:
+        print("No documents found to ingest.")
+        return stats
+
+    if vectorstore is None:
+        vectorstore = _open_vectorstore(db_dir)
+    _delete_removed(vectorstore, old_files, removed, stats)
+
+    report = None
+    if tasks:
+        embeddings = _build_embeddings()
+        text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+
+        def split(item):
+            key, file_hash, pages = item
+            previous = old_files.get(key)
+            old_ids = set(previous["chunk_ids"]) if previous else set()
+            chunk_ids, fresh, stale_ids = _split_file(key, pages, old_ids, text_splitter)
+            print(f"Loaded {key}: {len(pages)} pages/documents, {len(chunk_ids)} chunks, {len(fresh)} new.")
+            for i in range(0, len(fresh), batch_size):
+                yield ("chunks", fresh[i:i + batch_size])
+            yield ("file_done", key, file_hash, chunk_ids, stale_ids)
+
+        def embed(item):
+            if item[0] == "chunks":
+                batch = item[1]
+                vectors = embeddings.embed_documents([chunk.page_content for _, chunk in batch])
+                yield ("vectors", batch, vectors)
+            else:
+                yield item
+
+        def write(item):
+            if item[0] == "vectors":
+                _, batch, vectors = item
+                vectorstore._collection.upsert(
+                    ids=[cid for cid, _ in batch],
+                    embeddings=vectors,
+                    documents=[chunk.page_content for _, chunk in batch],
+                    metadatas=[chunk.metadata for _, chunk in batch],
+                )
+                stats["chunks_added"] += len(batch)
+                yield item
+            else:
+                _, key, file_hash, chunk_ids, stale_ids = item
+                if stale_ids:
+                    vectorstore.delete(ids=stale_ids)
+                new_files[key] = {"sha256": file_hash, "chunk_ids": chunk_ids}
+                stats["files_changed"] += 1
+                stats["chunks_deleted"] += len(stale_ids)
+                yield item
+
+        def count_chunks(item):
+            return len(item[1]) if item[0] in ("chunks", "vectors") else 0
+
+        pipeline = Pipeline(
+            Stage("parse", lambda: _parse_files(tasks, workers), unit="pages", count=lambda item: len(item[2])),
+            [
+                Stage("split", split, unit="chunks", count=count_chunks),
+                Stage("embed", embed, unit="chunks", count=count_chunks),
+                Stage("write", write, unit="chunks", count=count_chunks),
+            ],
+            queue_size=queue_size,
+        )
+        drain(pipeline.run())
+        report = pipeline.report()
+        if hasattr(embeddings, "stats"):
+            report["embedding_cache"] = embeddings.stats()
+        stats["pipeline"] = report
+
+    stats["chunks_kept"] += sum(len(new_files[key]["chunk_ids"]) for key, _, _ in tasks) - stats["chunks_added"]
+    manifest["files"] = {**others, **new_files}
+    save_manifest(manifest, db_dir)
+    _rebuild_lexical_index(vectorstore, db_dir, stats)
+    _print_summary(stats, db_dir, report)
+    return stats
+
+
+def discover_files(root: str, patterns=CORPUS_PATTERNS) -> list:
+    """Find corpus files under root matching any of the glob patterns, sorted"""
+    found = set()
+    for pattern in patterns:
+        for path in glob.glob(os.path.join(root, pattern), recursive=True):
+            if os.path.isfile(path):
+                found.add(os.path.abspath(path))
+    return sorted(found)
+
+
+# Per-process state of corpus workers, set once by _init_corpus_worker
+_WORKER_EMBEDDINGS = None
+_WORKER_SPLITTER = None
+
+
+def _init_corpus_worker() -> None:
+    """Load the embedding model once per worker process"""
+    global _WORKER_EMBEDDINGS, _WORKER_SPLITTER
+    _WORKER_EMBEDDINGS = _build_embeddings()
+    _WORKER_SPLITTER = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+
+
+def _process_corpus_file(task: tuple) -> dict:
+    """Worker entry point: load, split and embed the new chunks of one file"""
+    key, path, file_hash, old_ids = task
+    started = time.perf_counter()
+    try:
+        pages = _load_file(path)
+    except Exception as e:
+        return {"key": key, "error": f"{type(e).__name__}: {e}"}
+    parsed = time.perf_counter()
+    chunk_ids, fresh, stale_ids = _split_file(key, pages, set(old_ids), _WORKER_SPLITTER)
+    texts = [chunk.page_content for _, chunk in fresh]
+    split = time.perf_counter()
+    vectors = _WORKER_EMBEDDINGS.embed_documents(texts) if texts else []
+    return {
+        "key": key,
+        "sha256": file_hash,
+        "pages": len(pages),
+        "seconds": {"parse": parsed - started, "split": split - parsed, "embed": time.perf_counter() - split},
+        "chunk_ids": chunk_ids,
+        "stale_ids": stale_ids,
+        "ids": [cid for cid, _ in fresh],
+        "texts": texts,
+        "metadatas": [chunk.metadata for _, chunk in fresh],
+        "vectors": vectors,
+    }
+
+
+def ingest_corpus(root: str, patterns=CORPUS_PATTERNS, db_dir: str = DB_DIR, workers: int = None,
+                  write_batch_size: int = WRITE_BATCH_SIZE, checkpoint_seconds: float = 30.0,
+                  prune: bool = True) -> dict:
+    """
+    Ingest every matching file under a directory tree.
+
+    Files are processed in a pool of worker processes, each of which loads the
+    embedding model once and returns embedded chunks; the parent writes them to
+    Chroma in bulk batches. The manifest is checkpointed after writes, so a run
+    that is killed part-way resumes where it left off: committed files are
+    skipped, and chunk IDs are content-derived, so re-writing a partially
+    stored file is idempotent.
+
+    Args:
+        root: Corpus directory
+        patterns: Glob patterns relative to root (PDF, Markdown, HTML, text by default)
+        db_dir: Chroma persist directory
+        workers: Worker processes (defaults to CPU count)
+        write_batch_size: Chunks buffered before each bulk upsert
+        checkpoint_seconds: Minimum interval between manifest checkpoints
+        prune: Delete chunks of previously ingested files under root that no longer exist
+
+    The BM25 index is rebuilt once, at the end, from the whole collection
+    whenever anything changed, so finishing a resumed run over a large corpus
+    re-tokenizes every stored chunk, not only the newly written ones.
+
+    Returns:
+        Counts of files and chunks that were added, deleted, kept or failed, plus
+        per-stage throughput and peak RSS under "pipeline" (parse, split and
+        embed busy time is summed over the worker processes)
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    started = time.perf_counter()
+    stats = _new_stats()
+    stats["files_failed"] = 0
+    paths = discover_files(root, patterns)
+    print(f"Discovered {len(paths)} files under {root}")
+
+    manifest = load_manifest(db_dir)
+    old_files = manifest["files"]
+    vectorstore = _reset_legacy_collection(db_dir, old_files) or _open_vectorstore(db_dir)
+
+    # Files committed by earlier (possibly interrupted) runs are carried over
+    new_files = dict(old_files)
+    tasks, present = _plan(paths, old_files, {}, stats, verbose=False)
+    print(f"{len(tasks)} new or changed files to ingest, {stats['files_unchanged']} unchanged")
+
+    root_key = _manifest_key(root).rstrip("/") + "/"
+    if prune:
+        removed = [key for key in old_files if key.startswith(root_key) and key not in present]
+        _delete_removed(vectorstore, old_files, removed, stats)
+        for key in removed:
+            new_files.pop(key, None)
+
+    buffer = {"ids": [], "texts": [], "metadatas": [], "vectors": []}
+    written_files = []
+    pages_total = 0
+    last_checkpoint = time.perf_counter()
+    # Parse/split/embed busy time is summed over the worker processes
+    stages = {name: StageStats(name, unit) for name, unit in
+              (("parse", "pages"), ("split", "chunks"), ("embed", "chunks"), ("write", "chunks"))}
+
+    def checkpoint():
+        manifest["files"] = new_files
+        save_manifest(manifest, db_dir)
+
+    def flush():
+        started = time.perf_counter()
+        if buffer["ids"]:
+            vectorstore._collection.upsert(
+                ids=buffer["ids"],
+                embeddings=buffer["vectors"],
+                documents=buffer["texts"],
+                metadatas=buffer["metadatas"],
+            )
+            stats["chunks_added"] += len(buffer["ids"])
+            stages["write"].items += 1
+            stages["write"].units += len(buffer["ids"])
+            for values in buffer.values():
+                values.clear()
+        # Only now are these files fully stored; retire their stale chunks
+        for result in written_files:
+            if result["stale_ids"]:
+                vectorstore.delete(ids=result["stale_ids"])
+            new_files[result["key"]] = {"sha256": result["sha256"], "chunk_ids": result["chunk_ids"],
+                                        "corpus": root_key}
+            stats["files_changed"] += 1
+            stats["chunks_deleted"] += len(result["stale_ids"])
+            stats["chunks_kept"] += len(result["chunk_ids"]) - len(result["ids"])
+        written_files.clear()
+        stages["write"].busy_seconds += time.perf_counter() - started
+
+    def handle(result):
+        nonlocal pages_total, last_checkpoint
+        if "error" in result:
+            print(f"Failed to load {result['key']}: {result['error']}")
+            stats["files_failed"] += 1
+            return
+        pages_total += result["pages"]
+        for name, units in (("parse", result["pages"]), ("split", len(result["chunk_ids"])),
+                            ("embed", len(result["ids"]))):
+            stages[name].items += 1
+            stages[name].units += units
+            stages[name].busy_seconds += result["seconds"][name]
+        for field in ("ids", "texts", "metadatas", "vectors"):
+            buffer[field].extend(result[field])
+        written_files.append(result)
+        if len(buffer["ids"]) >= write_batch_size:
+            flush()
+            if time.perf_counter() - last_checkpoint >= checkpoint_seconds:
+                checkpoint()
+                last_checkpoint = time.perf_counter()
+                done = stats["files_changed"] + stats["files_failed"]
+                print(f"Checkpoint: {done}/{len(tasks)} files, {stats['chunks_added']} chunks written")
+
+    worker_tasks = [
+        (key, path, file_hash, old_files[key]["chunk_ids"] if key in old_files else [])
+        for key, path, file_hash in tasks
+    ]
+    try:
+        if worker_tasks:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_corpus_worker) as pool:
+                pending = set()
+                remaining = iter(worker_tasks)
+                for task in remaining:
+                    pending.add(pool.submit(_process_corpus_file, task))
+                    if len(pending) >= workers * 2:
+                        break
+                while pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        handle(future.result())
+                        task = next(remaining, None)
+                        if task is not None:
+                            pending.add(pool.submit(_process_corpus_file, task))
+        flush()
+    finally:
+        # Whatever was fully written survives an interruption
+        checkpoint()
+    _rebuild_lexical_index(vectorstore, db_dir, stats)
+
+    elapsed = time.perf_counter() - started
+    stats["pages"] = pages_total
+    stats["seconds"] = round(elapsed, 2)
+    report = {
+        "stages": [stage.to_dict() for stage in stages.values()],
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    stats["pipeline"] = report
+    _print_summary(stats, db_dir, report)
+    if stats["files_failed"]:
+        print(f"{stats['files_failed']} files could not be loaded")
+    print(f"{pages_total} pages in {elapsed:.1f}s "
+          f"({stats['chunks_added'] / elapsed if elapsed > 0 else 0:.1f} chunks/sec)")
+    return stats
+
 
 if __name__ == "__main__":
-    ingest_data()
+    parser = argparse.ArgumentParser(description="Ingest documents into the vector database")
+    parser.add_argument("--full", action="store_true", help="Rebuild the collection instead of ingesting incrementally")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes")
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE, help="Chunks per embedding batch")
+    parser.add_argument("--corpus", type=str,
+                        help="Ingest every matching file under this directory (interrupted runs resume; the BM25 "
+                             "index is then rebuilt from the whole collection, which takes a while on large corpora)")
+    parser.add_argument("--glob", action="append", dest="patterns",
+                        help="Glob pattern relative to --corpus (repeatable, default: PDF/Markdown/HTML/text)")
+    parser.add_argument("--numpy-index", choices=["float32", "float16"], nargs="?", const="float32",
+                        help="Also export the collection to the NumPy index backend (optionally as float16)")
+    args = parser.parse_args()
+    if args.corpus:
+        ingest_corpus(args.corpus, patterns=args.patterns or CORPUS_PATTERNS, workers=args.workers)
+    else:
+        ingest_data(incremental=not args.full, workers=args.workers, batch_size=args.batch_size)
+    if args.numpy_index:
+        from rag.numpy_index import NumpyIndex, NUMPY_INDEX_DIR
+        index = NumpyIndex.from_chroma(DB_DIR, NUMPY_INDEX_DIR, dtype=args.numpy_index)
+        print(f"Exported {len(index)} chunks to NumPy index at {NUMPY_INDEX_DIR}")
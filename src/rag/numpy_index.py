@@ -0,0 +1,210 @@
+"""
+NumPy Vector Index - exact top-k search over a memory-mapped embedding matrix
+
+An alternative to Chroma for RAGAgent.retrieve. The index directory holds:
+    vectors.npy   L2-normalized embeddings, float32 or float16, one row per chunk
+    chunks.jsonl  one {"id", "text", "metadata"} record per row
+    offsets.npy   byte offset of each record in chunks.jsonl
+
+Opening the index memory-maps the matrix and reads only the offsets, so cold
+start does not depend on corpus size; chunk text is read from disk only for
+the rows a query returns. Search is an exact cosine-similarity matmul plus
+argpartition, processed in row blocks so batched queries have bounded memory.
+"""
+import os
+import json
+import argparse
+from typing import List, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DB_DIR = os.path.join(PROJECT_ROOT, "chroma_db")
+NUMPY_INDEX_DIR = os.path.join(DB_DIR, "numpy_index")
+
+VECTORS_FILE = "vectors.npy"
+CHUNKS_FILE = "chunks.jsonl"
+OFFSETS_FILE = "offsets.npy"
+
+# Rows scored per matmul block during search
+SEARCH_BLOCK_ROWS = 65536
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _top_k(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Row-wise top-k of a (queries, candidates) score matrix, best first"""
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        empty = np.empty((scores.shape[0], 0))
+        return empty.astype(np.int64), empty.astype(np.float32)
+    if k < scores.shape[1]:
+        part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        part = np.tile(np.arange(scores.shape[1]), (scores.shape[0], 1))
+    part_scores = np.take_along_axis(scores, part, axis=1)
+    order = np.argsort(-part_scores, axis=1, kind="stable")
+    return np.take_along_axis(part, order, axis=1), np.take_along_axis(part_scores, order, axis=1)
+
+
+class NumpyIndex:
+    """
+    Exact vector index over a memory-mapped .npy matrix.
+
+    Implements the subset of the LangChain vector store interface RAGAgent
+    uses, so it can stand in for Chroma. Scores are cosine similarities
+    (higher is better).
+    """
+
+    def __init__(self, index_dir: str = NUMPY_INDEX_DIR, embedding_function=None, mmap: bool = True):
+        self.index_dir = index_dir
+        self.embedding_function = embedding_function
+        self.vectors = np.load(os.path.join(index_dir, VECTORS_FILE), mmap_mode="r" if mmap else None)
+        self.offsets = np.load(os.path.join(index_dir, OFFSETS_FILE))
+        self._chunks_path = os.path.join(index_dir, CHUNKS_FILE)
+        self._id_to_row = None
+
+    @staticmethod
+    def exists(index_dir: str = NUMPY_INDEX_DIR) -> bool:
+        return all(os.path.exists(os.path.join(index_dir, name))
+                   for name in (VECTORS_FILE, CHUNKS_FILE, OFFSETS_FILE))
+
+    def __len__(self) -> int:
+        return self.vectors.shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the embedding matrix and offsets (what a fully paged-in index occupies)"""
+        return int(self.vectors.nbytes + self.offsets.nbytes)
+
+    # ---- building ----
+
+    @classmethod
+    def build(cls, index_dir: str, ids: Sequence[str], vectors, texts: Sequence[str],
+              metadatas: Sequence[dict], dtype: str = "float32") -> "NumpyIndex":
+        """Write a new index from parallel lists of ids, vectors, texts and metadata"""
+        if not (len(ids) == len(vectors) == len(texts) == len(metadatas)):
+            raise ValueError("ids, vectors, texts and metadatas must have the same length")
+        os.makedirs(index_dir, exist_ok=True)
+
+        matrix = _normalize(np.asarray(vectors, dtype=np.float32).reshape(len(ids), -1)).astype(dtype)
+        offsets = np.empty(len(ids), dtype=np.int64)
+        with open(os.path.join(index_dir, CHUNKS_FILE), "wb") as f:
+            for i, (chunk_id, text, metadata) in enumerate(zip(ids, texts, metadatas)):
+                offsets[i] = f.tell()
+                record = {"id": chunk_id, "text": text, "metadata": metadata or {}}
+                f.write(json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n")
+        np.save(os.path.join(index_dir, OFFSETS_FILE), offsets)
+        # Write the matrix last: its presence marks a complete index
+        tmp_path = os.path.join(index_dir, VECTORS_FILE + ".tmp")
+        with open(tmp_path, "wb") as f:
+            np.save(f, matrix)
+        os.replace(tmp_path, os.path.join(index_dir, VECTORS_FILE))
+        return cls(index_dir)
+
+    @classmethod
+    def from_chroma(cls, db_dir: str = DB_DIR, index_dir: str = NUMPY_INDEX_DIR,
+                    dtype: str = "float32", batch_size: int = 5000) -> "NumpyIndex":
+        """Export the persisted Chroma collection into a NumPy index"""
+        from langchain_chroma import Chroma
+
+        collection = Chroma(persist_directory=db_dir)._collection
+        total = collection.count()
+        ids, vectors, texts, metadatas = [], [], [], []
+        for offset in range(0, total, batch_size):
+            batch = collection.get(
+                include=["embeddings", "documents", "metadatas"],
+                limit=batch_size,
+                offset=offset,
+            )
+            ids.extend(batch["ids"])
+            vectors.extend(batch["embeddings"])
+            texts.extend(batch["documents"])
+            metadatas.extend(batch["metadatas"])
+        return cls.build(index_dir, ids, vectors, texts, metadatas, dtype=dtype)
+
+    # ---- search ----
+
+    def search(self, query_vectors, k: int = 4) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Exact top-k for a batch of query vectors.
+
+        Returns (rows, scores), each shaped (n_queries, min(k, len(index))),
+        sorted by descending cosine similarity.
+        """
+        queries = _normalize(np.atleast_2d(np.asarray(query_vectors, dtype=np.float32)))
+        n = len(self)
+        k = min(k, n)
+        if n == 0 or k == 0:
+            return _top_k(np.empty((queries.shape[0], 0), dtype=np.float32), 0)
+
+        best_rows = None
+        best_scores = None
+        for start in range(0, n, SEARCH_BLOCK_ROWS):
+            block = np.asarray(self.vectors[start:start + SEARCH_BLOCK_ROWS], dtype=np.float32)
+            rows, scores = _top_k(queries @ block.T, k)
+            rows += start
+            if best_rows is None:
+                best_rows, best_scores = rows, scores
+            else:
+                merged_rows = np.concatenate([best_rows, rows], axis=1)
+                merged_scores = np.concatenate([best_scores, scores], axis=1)
+                pick, best_scores = _top_k(merged_scores, k)
+                best_rows = np.take_along_axis(merged_rows, pick, axis=1)
+        return best_rows, best_scores
+
+    def _read_records(self, rows: Sequence[int]) -> List[dict]:
+        records = []
+        with open(self._chunks_path, "rb") as f:
+            for row in rows:
+                f.seek(int(self.offsets[row]))
+                records.append(json.loads(f.readline()))
+        return records
+
+    def get_documents(self, rows: Sequence[int]) -> List[Document]:
+        return [
+            Document(page_content=r["text"], metadata=r["metadata"], id=r["id"])
+            for r in self._read_records(rows)
+        ]
+
+    def get_by_ids(self, ids: Sequence[str]) -> List[Document]:
+        """Fetch documents by chunk ID (unknown IDs are skipped)"""
+        if self._id_to_row is None:
+            with open(self._chunks_path, "rb") as f:
+                self._id_to_row = {json.loads(line)["id"]: i for i, line in enumerate(f)}
+        rows = [self._id_to_row[i] for i in ids if i in self._id_to_row]
+        return self.get_documents(rows)
+
+    # ---- LangChain-style interface used by RAGAgent ----
+
+    def similarity_search_by_vector_with_relevance_scores(self, embedding, k: int = 4) -> List[Tuple[Document, float]]:
+        rows, scores = self.search([embedding], k)
+        return list(zip(self.get_documents(rows[0]), scores[0].tolist()))
+
+    def similarity_search_with_score(self, query: str, k: int = 4) -> List[Tuple[Document, float]]:
+        if self.embedding_function is None:
+            raise ValueError("NumpyIndex needs an embedding_function to search by text")
+        return self.similarity_search_by_vector_with_relevance_scores(
+            self.embedding_function.embed_query(query), k
+        )
+
+    def similarity_search(self, query: str, k: int = 4) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the NumPy vector index from the Chroma collection")
+    parser.add_argument("--db-dir", default=DB_DIR, help="Chroma persist directory")
+    parser.add_argument("--index-dir", default=NUMPY_INDEX_DIR, help="Output directory")
+    parser.add_argument("--dtype", choices=["float32", "float16"], default="float32",
+                        help="Storage precision (float16 halves size and memory bandwidth)")
+    args = parser.parse_args()
+
+    index = NumpyIndex.from_chroma(args.db_dir, args.index_dir, dtype=args.dtype)
+    print(f"Exported {len(index)} chunks to {args.index_dir} "
+          f"({index.vectors.dtype}, {index.nbytes / (1024 * 1024):.1f} MiB)")
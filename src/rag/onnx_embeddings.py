@@ -0,0 +1,183 @@
+"""
+ONNX Embeddings - CPU embedding backend on ONNX Runtime, optionally int8-quantized
+
+Runs an exported copy of sentence-transformers/all-MiniLM-L6-v2 without
+PyTorch at query time. The sentence-transformers pipeline for this model is
+BERT -> mean pooling over the attention mask -> L2 normalization, which is
+reproduced here in NumPy, so vectors stay compatible with the ones already
+stored by the PyTorch path:
+    fp32 ONNX    cosine similarity to the PyTorch vector >= FP32_MIN_COSINE
+    int8 ONNX    cosine similarity to the PyTorch vector >= INT8_MIN_COSINE
+benchmarks/bench_embeddings.py measures both the agreement and the effect on
+retrieval recall.
+
+Export once (needs torch + transformers, only on the exporting machine):
+    py src/rag/onnx_embeddings.py --export
+
+Then select the backend with EMBEDDING_BACKEND=onnx-int8 (or onnx) in .env.
+"""
+import os
+import sys
+import json
+import argparse
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from rag.embeddings import CACHE_DIR, EMBEDDING_MODEL
+
+ONNX_DIR = os.path.join(CACHE_DIR, "onnx")
+FP32_FILE = "model.onnx"
+INT8_FILE = "model.int8.onnx"
+TOKENIZER_FILE = "tokenizer.json"
+EXPORT_INFO_FILE = "export_info.json"
+
+# all-MiniLM-L6-v2 truncates at 256 word pieces (sentence-transformers max_seq_length)
+MAX_LENGTH = 256
+DEFAULT_BATCH_SIZE = 32
+
+# Documented agreement with the PyTorch vectors, checked by the benchmark
+FP32_MIN_COSINE = 0.9999
+INT8_MIN_COSINE = 0.98
+
+
+def onnx_model_dir(model_name: str = EMBEDDING_MODEL) -> str:
+    return os.path.join(ONNX_DIR, model_name.replace("/", "--"))
+
+
+def export_onnx(model_name: str = EMBEDDING_MODEL, output_dir: str = None, quantize: bool = True,
+                opset: int = 17) -> str:
+    """
+    Export the transformer to ONNX (and a dynamically int8-quantized copy)
+
+    Returns:
+        The output directory, holding model.onnx, model.int8.onnx and tokenizer.json
+    """
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    output_dir = output_dir or onnx_model_dir(model_name)
+    os.makedirs(output_dir, exist_ok=True)
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name).eval()
+    # Fast tokenizers write tokenizer.json, which the `tokenizers` runtime loads directly
+    tokenizer.save_pretrained(output_dir)
+
+    sample = tokenizer(["export sample sentence"], return_tensors="pt")
+    input_names = ["input_ids", "attention_mask", "token_type_ids"]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+    fp32_path = os.path.join(output_dir, FP32_FILE)
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(sample[name] for name in input_names),
+            fp32_path,
+            input_names=input_names,
+            output_names=["last_hidden_state", "pooler_output"],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+            do_constant_folding=True,
+        )
+    print(f"Exported {model_name} to {fp32_path}")
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        int8_path = os.path.join(output_dir, INT8_FILE)
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+        print(f"Quantized weights to int8: {int8_path}")
+
+    with open(os.path.join(output_dir, EXPORT_INFO_FILE), "w", encoding="utf-8") as f:
+        json.dump({"model_name": model_name, "opset": opset, "max_length": MAX_LENGTH,
+                   "quantized": quantize}, f, indent=2)
+    return output_dir
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    LangChain Embeddings running an exported model on ONNX Runtime (CPU)
+
+    Args:
+        model_dir: Directory written by export_onnx (defaults to .cache/onnx/<model>)
+        model_name: Model the export was made from, used for the default model_dir
+        quantized: Load model.int8.onnx instead of model.onnx
+        batch_size: Sentences per inference call
+        max_length: Truncation length in word pieces
+        threads: ONNX Runtime intra-op threads (None lets the runtime decide)
+    """
+
+    def __init__(self, model_dir: str = None, model_name: str = EMBEDDING_MODEL, quantized: bool = True,
+                 batch_size: int = DEFAULT_BATCH_SIZE, max_length: int = MAX_LENGTH, threads: int = None):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self.model_dir = model_dir or onnx_model_dir(model_name)
+        self.model_path = os.path.join(self.model_dir, INT8_FILE if quantized else FP32_FILE)
+        if not os.path.exists(self.model_path):
+            raise FileNotFoundError(
+                f"ONNX model not found at {self.model_path}. "
+                f"Run `py src/rag/onnx_embeddings.py --export` first."
+            )
+        self.quantized = quantized
+        self.batch_size = batch_size
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(self.model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {node.name for node in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(self.model_dir, TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        pad_id = self.tokenizer.token_to_id("[PAD]")
+        self.tokenizer.enable_padding(pad_id=pad_id or 0, pad_token="[PAD]")
+
+    def _embed_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        feeds = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+            "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+        }
+        hidden = self.session.run(None, {name: value for name, value in feeds.items() if name in self.input_names})[0]
+
+        # Mean pooling over real tokens, then L2 normalization (as sentence-transformers does)
+        mask = feeds["attention_mask"][:, :, None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+        return pooled / np.clip(norms, 1e-12, None)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        # Batch texts of similar length together to keep padding small
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vectors = [None] * len(texts)
+        for start in range(0, len(order), self.batch_size):
+            rows = order[start:start + self.batch_size]
+            embedded = self._embed_batch([texts[i] for i in rows])
+            for i, vector in zip(rows, embedded):
+                vectors[i] = vector.tolist()
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed_batch([text])[0].tolist()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the embedding model to ONNX")
+    parser.add_argument("--export", action="store_true", help="Export model.onnx and model.int8.onnx")
+    parser.add_argument("--model", default=EMBEDDING_MODEL)
+    parser.add_argument("--output-dir", default=None)
+    parser.add_argument("--no-quantize", action="store_true", help="Skip the int8 copy")
+    args = parser.parse_args()
+
+    if args.export:
+        export_onnx(args.model, args.output_dir, quantize=not args.no_quantize)
+    else:
+        parser.print_help()
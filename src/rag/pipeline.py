@@ -0,0 +1,203 @@
+"""
+Streaming pipeline helpers - run ingestion stages concurrently with bounded queues
+
+Each stage runs in its own thread and hands items to the next stage through a
+bounded queue, so a slow stage applies back-pressure instead of letting memory
+grow with corpus size. Stages record how many units they produced and how long
+they were busy, which gives per-stage throughput.
+"""
+import sys
+import time
+import queue
+import threading
+from typing import Callable, Iterable, Iterator, List, Optional
+
+_DONE = object()
+
+
+class StageStats:
+    """Throughput counters for a single pipeline stage"""
+
+    def __init__(self, name: str, unit: str):
+        self.name = name
+        self.unit = unit
+        self.items = 0
+        self.units = 0
+        self.busy_seconds = 0.0
+
+    @property
+    def throughput(self) -> float:
+        return self.units / self.busy_seconds if self.busy_seconds > 0 else 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "stage": self.name,
+            "unit": self.unit,
+            "items": self.items,
+            "units": self.units,
+            "busy_seconds": round(self.busy_seconds, 3),
+            f"{self.unit}_per_sec": round(self.throughput, 1),
+        }
+
+
+class Stage:
+    """
+    A pipeline stage.
+
+    Args:
+        name: Stage name used in reports
+        fn: Called with each input item, returns an iterable of output items
+        unit: What `count` measures (e.g. "pages", "chunks")
+        count: Number of units in an output item (defaults to 1 per item)
+    """
+
+    def __init__(self, name: str, fn: Callable, unit: str = "items", count: Callable = None):
+        self.name = name
+        self.fn = fn
+        self.count = count or (lambda _item: 1)
+        self.stats = StageStats(name, unit)
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process in MiB, or None if unavailable"""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports KiB, macOS reports bytes
+        return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    except ImportError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return round(getattr(info, "peak_wset", info.rss) / (1024 * 1024), 1)
+    except ImportError:
+        return None
+
+
+class Pipeline:
+    """
+    Run a source iterator through a chain of stages, one thread per stage.
+
+    The source itself is treated as the first stage: it is iterated in a
+    background thread and its items are timed like any other stage.
+    """
+
+    def __init__(self, source: Stage, stages: List[Stage], queue_size: int = 8):
+        self.source = source
+        self.stages = stages
+        self.queue_size = queue_size
+        self._error = None
+        self._stop = threading.Event()
+
+    @property
+    def stats(self) -> List[StageStats]:
+        return [self.source.stats] + [stage.stats for stage in self.stages]
+
+    def _put(self, q: queue.Queue, item) -> bool:
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _fail(self, exc: BaseException) -> None:
+        if self._error is None:
+            self._error = exc
+        self._stop.set()
+
+    def _run_source(self, out_q: queue.Queue) -> None:
+        stats = self.source.stats
+        try:
+            iterator = iter(self.source.fn())
+            while not self._stop.is_set():
+                started = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                stats.busy_seconds += time.perf_counter() - started
+                stats.items += 1
+                stats.units += self.source.count(item)
+                if not self._put(out_q, item):
+                    break
+        except BaseException as exc:
+            self._fail(exc)
+        finally:
+            self._put(out_q, _DONE)
+
+    def _run_stage(self, stage: Stage, in_q: queue.Queue, out_q: queue.Queue) -> None:
+        stats = stage.stats
+        try:
+            while not self._stop.is_set():
+                try:
+                    item = in_q.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if item is _DONE:
+                    break
+                stats.items += 1
+                # Hand each output downstream as soon as it is produced, so a
+                # full queue pauses the stage mid-item (time blocked is not busy)
+                outputs = iter(stage.fn(item) or ())
+                while True:
+                    started = time.perf_counter()
+                    try:
+                        output = next(outputs)
+                    except StopIteration:
+                        stats.busy_seconds += time.perf_counter() - started
+                        break
+                    stats.busy_seconds += time.perf_counter() - started
+                    stats.units += stage.count(output)
+                    if not self._put(out_q, output):
+                        return
+        except BaseException as exc:
+            self._fail(exc)
+        finally:
+            self._put(out_q, _DONE)
+
+    def run(self) -> Iterator:
+        """Start all stages and yield the outputs of the last stage"""
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+        threads = [threading.Thread(target=self._run_source, args=(queues[0],), daemon=True)]
+        for i, stage in enumerate(self.stages):
+            threads.append(threading.Thread(
+                target=self._run_stage, args=(stage, queues[i], queues[i + 1]), daemon=True
+            ))
+        for thread in threads:
+            thread.start()
+
+        try:
+            while True:
+                try:
+                    item = queues[-1].get(timeout=0.1)
+                except queue.Empty:
+                    if self._stop.is_set():
+                        break
+                    continue
+                if item is _DONE:
+                    break
+                yield item
+        finally:
+            # Also unblocks the stages if the consumer stopped iterating early
+            self._stop.set()
+            for thread in threads:
+                thread.join(timeout=5)
+        if self._error is not None:
+            raise self._error
+
+    def report(self) -> dict:
+        return {
+            "stages": [s.to_dict() for s in self.stats],
+            "peak_rss_mb": peak_rss_mb(),
+        }
+
+
+def drain(iterable: Iterable) -> int:
+    """Consume an iterable, returning how many items it produced"""
+    n = 0
+    for _ in iterable:
+        n += 1
+    return n
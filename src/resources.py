@@ -0,0 +1,213 @@
+"""
+Shared Resources - process-wide, lazily initialized models and stores
+
+PureAgent, RAGAgent and Evaluator used to each import and build their own
+Gemini client, embedding model and vector store at construction (or even at
+import) time. Everything heavy now lives here behind thread-safe singletons
+that are created on first use, and each import/initialization is timed so
+`run_experiment.py --profile-startup` can show where startup time goes.
+"""
+import os
+import sys
+import time
+import importlib
+import threading
+
+_lock = threading.RLock()
+_instances = {}
+
+# (kind, name, seconds) in the order things were first loaded
+_timings = []
+
+_CONFIGURED_API_KEY = None
+
+# Gemini quota when LLM_RPM / LLM_TPM are not set
+DEFAULT_LLM_RPM = 60
+DEFAULT_LLM_TPM = 250_000
+
+
+def _record(kind: str, name: str, seconds: float) -> None:
+    _timings.append((kind, name, seconds))
+
+
+def timed_import(module_name: str):
+    """Import a module, recording how long it took if it was not loaded yet"""
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    started = time.perf_counter()
+    module = importlib.import_module(module_name)
+    _record("import", module_name, time.perf_counter() - started)
+    return module
+
+
+def _get_or_create(key, label: str, factory):
+    with _lock:
+        if key in _instances:
+            return _instances[key]
+        started = time.perf_counter()
+        instance = factory()
+        _record("init", label, time.perf_counter() - started)
+        _instances[key] = instance
+        return instance
+
+
+# ---- LLM ----
+
+def genai():
+    """The google.generativeai module, imported on first use"""
+    return timed_import("google.generativeai")
+
+
+def llm_backend() -> str:
+    """LLM_BACKEND: "gemini" (default) or "stub" (offline, see llm.clients.StubClient)"""
+    backend = (os.getenv("LLM_BACKEND") or "gemini").lower()
+    if backend not in ("gemini", "stub"):
+        raise ValueError(f"Unknown LLM_BACKEND '{backend}', expected 'gemini' or 'stub'")
+    return backend
+
+
+def require_api_key() -> str:
+    """
+    GOOGLE_API_KEY from the environment; raises ValueError when it is missing.
+    The stub backend needs no key (returns None).
+    """
+    if llm_backend() == "stub":
+        return None
+    api_key = os.getenv("GOOGLE_API_KEY")
+    if not api_key:
+        raise ValueError("GOOGLE_API_KEY environment variable not found. Please check your .env file")
+    return api_key
+
+
+def configure_genai() -> str:
+    """Configure the Gemini SDK with GOOGLE_API_KEY (re-configures if the key changed)"""
+    api_key = require_api_key()
+
+    global _CONFIGURED_API_KEY
+    with _lock:
+        if _CONFIGURED_API_KEY != api_key:
+            module = genai()
+            started = time.perf_counter()
+            module.configure(api_key=api_key)
+            _record("init", "genai.configure", time.perf_counter() - started)
+            _CONFIGURED_API_KEY = api_key
+
+    return api_key
+
+
+def get_llm_client(model_name: str):
+    """Shared LLM client per backend and model name (GeminiClient, or StubClient with LLM_BACKEND=stub)"""
+    backend = llm_backend()
+    if backend == "stub":
+        return _get_or_create(("llm", backend, model_name), f"StubClient({model_name})",
+                              lambda: timed_import("llm.clients").StubClient.from_env(model_name))
+    configure_genai()
+    return _get_or_create(("llm", backend, model_name), f"GenerativeModel({model_name})",
+                          lambda: timed_import("llm.clients").GeminiClient(model_name))
+
+
+def get_rate_limiter():
+    """The RPM/TPM limiter shared by both agents and the evaluator (LLM_RPM / LLM_TPM / LLM_MAX_RETRIES)"""
+    def factory():
+        from llm.rate_limiter import RateLimiter
+        return RateLimiter(
+            rpm=float(os.getenv("LLM_RPM", DEFAULT_LLM_RPM)),
+            tpm=float(os.getenv("LLM_TPM", DEFAULT_LLM_TPM)),
+            max_retries=int(os.getenv("LLM_MAX_RETRIES", 5)),
+        )
+
+    return _get_or_create("rate_limiter", "rate limiter", factory)
+
+
+def get_span_metrics():
+    """Process-wide stage histograms fed by instrumentation.span"""
+    def factory():
+        from instrumentation import SpanMetrics
+        return SpanMetrics()
+
+    return _get_or_create("span_metrics", "span metrics", factory)
+
+
+def response_cache_enabled() -> bool:
+    return os.getenv("LLM_CACHE", "0").lower() in ("1", "true", "yes")
+
+
+def get_response_cache():
+    """The on-disk LLM response cache, or None unless LLM_CACHE=1 (LLM_CACHE_MAX_MB bounds its size)"""
+    if not response_cache_enabled():
+        return None
+
+    def factory():
+        from llm.response_cache import DEFAULT_MAX_BYTES, ResponseCache
+        max_mb = os.getenv("LLM_CACHE_MAX_MB")
+        return ResponseCache(max_bytes=int(float(max_mb) * 1024 * 1024) if max_mb else DEFAULT_MAX_BYTES)
+
+    return _get_or_create("response_cache", "LLM response cache", factory)
+
+
+# ---- Retrieval ----
+
+def get_embeddings():
+    """Shared local embedding model (behind the on-disk embedding cache)"""
+    def factory():
+        embeddings_module = timed_import("rag.embeddings")
+        backend = embeddings_module.resolve_backend()
+        if backend == "torch":
+            timed_import("langchain_huggingface")
+            try:
+                timed_import("sentence_transformers")
+            except ImportError:
+                pass
+        elif ":" not in backend:
+            timed_import("onnxruntime")
+        return embeddings_module.load_embeddings(backend=backend)
+
+    return _get_or_create("embeddings", "embedding model", factory)
+
+
+def get_vectorstore(backend: str, path: str, embeddings):
+    """Shared vector store for a backend ("chroma" or "numpy") and location"""
+    def factory():
+        if backend == "numpy":
+            numpy_index = timed_import("rag.numpy_index")
+            return numpy_index.NumpyIndex(path, embedding_function=embeddings)
+        chroma = timed_import("langchain_chroma")
+        return chroma.Chroma(persist_directory=path, embedding_function=embeddings)
+
+    return _get_or_create(("vectorstore", backend, os.path.abspath(path)), f"vector store ({backend})", factory)
+
+
+def get_lexical_index(path: str):
+    """Shared BM25 index loaded from path"""
+    def factory():
+        return timed_import("rag.bm25").BM25Index.load(path)
+
+    return _get_or_create(("bm25", os.path.abspath(path)), "BM25 index", factory)
+
+
+# ---- Reporting ----
+
+def startup_report() -> list:
+    """Recorded imports and initializations as dicts, in load order"""
+    return [{"kind": kind, "name": name, "seconds": round(seconds, 4)} for kind, name, seconds in _timings]
+
+
+def print_startup_report(total_seconds: float = None) -> None:
+    print("\n" + "=" * 60)
+    print("Startup profile")
+    print("=" * 60)
+    for entry in startup_report():
+        print(f"  {entry['kind']:<7} {entry['name']:<45} {entry['seconds'] * 1000:>9.1f} ms")
+    for kind in ("import", "init"):
+        subtotal = sum(seconds for k, _, seconds in _timings if k == kind)
+        print(f"  {kind} total: {subtotal * 1000:.1f} ms")
+    if total_seconds is not None:
+        print(f"  wall total: {total_seconds * 1000:.1f} ms")
+
+
+def reset() -> None:
+    """Drop all shared instances (tests, or after changing configuration)"""
+    global _CONFIGURED_API_KEY
+    with _lock:
+        _instances.clear()
+        _CONFIGURED_API_KEY = None
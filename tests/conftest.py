@@ -1,9 +1,20 @@
 import os
 import sys
 
+import pytest
+
 
 PROJECT_ROOT = os.path.dirname(os.path.dirname(__file__))
 SRC_PATH = os.path.join(PROJECT_ROOT, "src")
 
 if SRC_PATH not in sys.path:
     sys.path.insert(0, SRC_PATH)
+
+
+@pytest.fixture(autouse=True)
+def _reset_shared_resources():
+    import resources
+
+    resources.reset()
+    yield
+    resources.reset()
@@ -1,4 +1,6 @@
 import importlib
+import os
+import subprocess
 import sys
 
 import pytest
@@ -32,14 +34,14 @@ def test_rag_agent_does_not_build_embeddings_without_vector_db(monkeypatch):
         called["embeddings"] += 1
         return object()
 
-    monkeypatch.setattr(module.genai, "configure", lambda **_kwargs: None)
-    monkeypatch.setattr(module.genai, "GenerativeModel", lambda _name: DummyModel())
-    monkeypatch.setattr(module, "HuggingFaceEmbeddings", fake_embeddings)
+    monkeypatch.setattr(module, "get_llm_client", lambda _name: DummyModel())
+    monkeypatch.setattr(module, "get_embeddings", fake_embeddings)
     monkeypatch.setattr(module, "DB_DIR", "Z:/definitely_missing_db")
 
     agent = module.RAGAgent()
 
     assert agent.vectorstore is None
+    assert agent.query("q") == "ok"
     assert called["embeddings"] == 0
 
 
@@ -49,3 +51,34 @@ def test_pure_agent_requires_api_key_at_runtime(monkeypatch):
 
     with pytest.raises(ValueError, match="GOOGLE_API_KEY"):
         module.PureAgent()
+
+
+def test_importing_agents_and_evaluator_defers_heavy_dependencies():
+    code = (
+        "import sys; sys.path.insert(0, 'src'); "
+        "import agents, eval.evaluator; "
+        "heavy = ['google.generativeai', 'langchain_chroma', 'chromadb', 'langchain_huggingface', 'torch']; "
+        "print([name for name in heavy if name in sys.modules])"
+    )
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    out = subprocess.run([sys.executable, "-c", code], cwd=root, capture_output=True, text=True, check=True)
+
+    assert out.stdout.strip() == "[]"
+
+
+def test_agents_and_evaluator_share_one_model_instance(monkeypatch):
+    monkeypatch.setenv("GOOGLE_API_KEY", "test-key")
+    import resources
+    genai = resources.genai()
+    created = []
+    monkeypatch.setattr(genai, "configure", lambda **_kwargs: None)
+    monkeypatch.setattr(genai, "GenerativeModel", lambda name: created.append(name) or object())
+    pure_module = _reload_module("agents.pure_agent")
+    evaluator_module = _reload_module("eval.evaluator")
+
+    agent = pure_module.PureAgent()
+    evaluator = evaluator_module.Evaluator()
+
+    assert created == []
+    assert agent.model is evaluator.judge_model
+    assert created == ["gemini-2.5-flash"]
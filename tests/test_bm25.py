@@ -0,0 +1,24 @@
+from rag.bm25 import BM25Index, reciprocal_rank_fusion, tokenize
+
+
+def test_bm25_ranks_exact_terms_and_round_trips(tmp_path):
+    index = BM25Index.build(
+        ["a", "b", "c"],
+        ["The SSTORE opcode costs gas", "Gas price and gas limit", "Proof of work difficulty"],
+    )
+    index.save(str(tmp_path))
+    loaded = BM25Index.load(str(tmp_path))
+
+    assert [chunk_id for chunk_id, _ in loaded.search("sstore gas", k=3)] == ["a", "b"]
+    assert loaded.search("merkle", k=3) == []
+    assert loaded.search("gas", k=1)[0][0] == "b"
+
+
+def test_tokenize_splits_cjk_characters():
+    assert tokenize("比特币 PoW-2") == ["比", "特", "币", "pow", "2"]
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([["x", "y", "z"], ["y", "w"]], k=60)
+    assert fused[0][0] == "y"
+    assert {item for item, _ in fused} == {"x", "y", "z", "w"}
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from eval.bootstrap import bootstrap_intervals, converged, score_matrices
+
+
+def _matrices(pure, rag):
+    pure, rag = np.asarray(pure, dtype=float), np.asarray(rag, dtype=float)
+    winners = np.where(rag > pure, "rag_agent", np.where(pure > rag, "pure_agent", "tie")).astype(object)
+    winners[np.isnan(pure) | np.isnan(rag)] = ""
+    return score_matrices(pure, rag, winners)
+
+
+def test_identical_trials_give_zero_width_intervals():
+    intervals = bootstrap_intervals(_matrices([[6, 6, 6], [4, 4, 4]], [[8, 8, 8], [4, 4, 4]]), n_resamples=200)
+
+    assert intervals["pure_score"] == {"mean": 5.0, "ci_low": 5.0, "ci_high": 5.0, "half_width": 0.0}
+    assert intervals["score_diff"]["mean"] == 1.0
+    assert intervals["rag_win_rate"]["mean"] == 0.5
+    assert intervals["pure_win_rate"]["mean"] == 0.0
+    assert converged(intervals, tolerance=0.0)
+
+
+def test_intervals_narrow_with_more_trials_and_are_reproducible():
+    rng = np.random.default_rng(1)
+    pure = 5 + rng.normal(0, 2, size=(10, 40))
+    rag = 7 + rng.normal(0, 2, size=(10, 40))
+
+    few = bootstrap_intervals(_matrices(pure[:, :3], rag[:, :3]), seed=3)
+    many = bootstrap_intervals(_matrices(pure, rag), seed=3)
+
+    assert many["score_diff"]["half_width"] < few["score_diff"]["half_width"]
+    assert many["score_diff"]["ci_low"] <= many["score_diff"]["mean"] <= many["score_diff"]["ci_high"]
+    assert many["score_diff"]["ci_low"] > 0
+    assert bootstrap_intervals(_matrices(pure, rag), seed=3) == many
+
+
+def test_missing_trials_are_ignored_per_question():
+    nan = np.nan
+    intervals = bootstrap_intervals(_matrices([[2, nan], [nan, nan], [8, 8]], [[4, nan], [nan, nan], [8, 8]]),
+                                    n_resamples=100)
+
+    # Question 2 has no scored trial and is left out of every average
+    assert intervals["pure_score"]["mean"] == 5.0
+    assert intervals["score_diff"]["mean"] == 1.0
+
+
+def test_question_resampling_widens_the_interval():
+    pure = np.repeat([[2.0], [8.0]], 4, axis=1)
+    fixed = bootstrap_intervals(_matrices(pure, pure), n_resamples=500)
+    resampled = bootstrap_intervals(_matrices(pure, pure), n_resamples=500, resample_questions=True)
+
+    assert fixed["pure_score"]["half_width"] == 0.0
+    assert resampled["pure_score"]["half_width"] == pytest.approx(3.0)
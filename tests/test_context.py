@@ -0,0 +1,68 @@
+import pytest
+from langchain_core.documents import Document
+
+from llm.tokens import estimate_tokens
+from rag.context import ContextAssembler
+
+
+PAGE = ("The timestamp server works by taking a hash of a block of items to be timestamped "
+        "and widely publishing the hash. Each timestamp includes the previous timestamp in its hash, "
+        "forming a chain, with each additional timestamp reinforcing the ones before it.")
+
+
+def _doc(text, page=1, source="bitcoin.pdf"):
+    return Document(page_content=text, metadata={"source": source, "page": page})
+
+
+def test_overlapping_chunks_from_same_page_are_merged():
+    first, second = PAGE[:150], PAGE[100:]
+    packed = ContextAssembler(token_budget=None).assemble([_doc(second), _doc(first)], scores=[0.9, 0.8])
+
+    assert packed.stats["chunks_merged"] == 1
+    assert [seg.text for seg in packed.segments] == [PAGE]
+    assert packed.segments[0].score == 0.9
+    assert packed.stats["tokens_saved"] > 0
+
+
+def test_chunks_from_other_pages_are_not_merged_but_duplicates_dropped():
+    docs = [_doc(PAGE, page=1), _doc(PAGE[50:], page=2), _doc(PAGE, page=3, source="copy.md")]
+    packed = ContextAssembler(token_budget=None).assemble(docs)
+
+    assert packed.stats["chunks_merged"] == 0
+    assert packed.stats["duplicates_dropped"] == 1
+    assert len(packed.segments) == 2
+
+
+def test_budget_is_filled_in_score_order():
+    docs = [_doc("alpha " * 200, page=1), _doc("beta " * 400, page=2), _doc("gamma " * 20, page=3)]
+    budget = estimate_tokens(docs[0].page_content) + 60
+    packed = ContextAssembler(token_budget=budget).assemble(docs)
+
+    assert [seg.text.split()[0] for seg in packed.segments] == ["alpha", "gamma"]
+
+
+def test_scores_take_precedence_over_retrieval_order():
+    docs = [_doc("alpha " * 200, page=1), _doc("beta " * 200, page=2)]
+    budget = estimate_tokens(docs[0].page_content) + 60
+    packed = ContextAssembler(token_budget=budget).assemble(docs, scores=[0.2, 0.7])
+
+    assert [seg.text.split()[0] for seg in packed.segments] == ["beta"]
+    assert packed.stats["dropped_for_budget"] == 1
+    assert packed.stats["context_tokens"] <= budget
+
+
+@pytest.mark.parametrize("text", ["nonce " * 400, "工作量证明" * 300, "x" * 2000])
+@pytest.mark.parametrize("source", ["bitcoin.pdf", "corpus/" + "nested/" * 30 + "whitepaper.pdf"])
+@pytest.mark.parametrize("budget", [70, 100, 200])
+def test_truncated_segment_stays_within_a_small_budget(text, source, budget):
+    packed = ContextAssembler(token_budget=budget).assemble([_doc(text, source=source)])
+
+    assert packed.stats["truncated"]
+    assert estimate_tokens(packed.segments[0].render()) + 1 <= budget
+    assert packed.stats["context_tokens"] <= budget
+    assert text.startswith(packed.segments[0].text)
+
+
+def test_estimate_tokens_counts_cjk_characters_individually():
+    assert estimate_tokens("比特币") == 3
+    assert estimate_tokens("abcdefgh") == 2
@@ -0,0 +1,71 @@
+from rag.embeddings import CachedEmbeddings, EmbeddingCache, load_embeddings
+
+
+class CountingEmbeddings:
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return [[float(len(t)), 1.0] for t in texts]
+
+    def embed_query(self, text):
+        self.calls.append([text])
+        return [float(len(text)), 1.0]
+
+
+def test_cached_embeddings_reuse_vectors_across_instances(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    inner = CountingEmbeddings()
+    first = CachedEmbeddings(inner, "test-model", EmbeddingCache(path))
+
+    vectors = first.embed_documents(["proof of work", "proof  of work ", "nonce"])
+    assert inner.calls == [["proof of work", "nonce"]]
+    assert vectors[0] == vectors[1]
+
+    second = CachedEmbeddings(inner, "test-model", EmbeddingCache(path))
+    assert second.embed_query("nonce") == [5.0, 1.0]
+    assert len(inner.calls) == 1
+    assert second.stats()["hit_rate"] == 1.0
+
+    other_model = CachedEmbeddings(inner, "other-model", EmbeddingCache(path))
+    other_model.embed_query("nonce")
+    assert len(inner.calls) == 2
+
+
+def test_embedding_cache_evicts_least_recently_used(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"), max_entries=2)
+    cache.put_many("m", {"a": [1.0]})
+    cache.put_many("m", {"b": [2.0]})
+    cache.get_many("m", ["a"])
+    cache.put_many("m", {"c": [3.0]})
+    cache.evict()
+
+    assert set(cache.get_many("m", ["a", "b", "c"])) == {"a", "c"}
+
+
+def test_module_factory_backend_loads_other_embeddings_uncached(monkeypatch):
+    monkeypatch.setenv("EMBEDDING_BACKEND", f"{__name__}:CountingEmbeddings")
+    embeddings = load_embeddings()
+
+    assert isinstance(embeddings, CountingEmbeddings)
+
+
+def test_cache_hits_refresh_lru_order_in_batches(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = EmbeddingCache(path)
+    cache.put_many("m", {"a": [1.0], "b": [2.0]})
+
+    def last_used():
+        other = EmbeddingCache(path)
+        try:
+            return dict(other._conn.execute("SELECT text_hash, last_used FROM embeddings").fetchall())
+        finally:
+            other.close()
+
+    before = last_used()
+    cache.get_many("m", ["a"])
+    # A hit alone writes nothing; the refresh goes out with the next put
+    assert last_used() == before
+    cache.put_many("m", {"c": [3.0]})
+    assert last_used()["a"] > before["b"]
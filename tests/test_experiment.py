@@ -0,0 +1,228 @@
+import asyncio
+import json
+import re
+import threading
+
+import pytest
+
+import resources
+import agents.pure_agent as pure_agent_module
+import agents.rag_agent as rag_agent_module
+import eval.evaluator as evaluator_module
+from llm.response_cache import ResponseCache
+
+QUESTIONS = [{"question": f"question {i}", "category": "test"} for i in range(6)]
+
+
+class FakeModel:
+    """Answers agents with the question number and judges by it; async calls finish out of order"""
+
+    def _respond(self, prompt):
+        number = int(re.search(r"question (\d+)", prompt).group(1))
+        if "pure_agent_score" in prompt:
+            winner = ["rag_agent", "pure_agent", "tie"][number % 3]
+            text = json.dumps({"pure_agent_score": number, "rag_agent_score": 10 - number, "winner": winner})
+        else:
+            text = f"answer {number}"
+        return number, type("Response", (), {"text": text})()
+
+    def generate_content(self, prompt, **_kwargs):
+        return self._respond(prompt)[1]
+
+    async def generate_content_async(self, prompt, **_kwargs):
+        number, response = self._respond(prompt)
+        await asyncio.sleep(0.01 * (len(QUESTIONS) - number))
+        return response
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    monkeypatch.setenv("GOOGLE_API_KEY", "test-key")
+    model = FakeModel()
+    for module in (pure_agent_module, rag_agent_module, evaluator_module):
+        monkeypatch.setattr(module, "get_llm_client", lambda _name: model)
+    monkeypatch.setattr(rag_agent_module, "DB_DIR", "Z:/definitely_missing_db")
+
+
+def _without_timing(records):
+    return [{k: v for k, v in record.items() if k not in ("timing", "spans")} for record in records]
+
+
+def test_concurrent_run_matches_sequential_order_and_summary(fake_llm):
+    sequential = evaluator_module.run_experiment(QUESTIONS, serial=True)
+    concurrent = evaluator_module.run_experiment(QUESTIONS, concurrency=4)
+
+    assert [q["question"] for q in concurrent["questions"]] == [q["question"] for q in QUESTIONS]
+    assert _without_timing(concurrent["questions"]) == _without_timing(sequential["questions"])
+    assert concurrent["summary"] == sequential["summary"]
+    assert concurrent["summary"]["rag_wins"] == 2
+    assert concurrent["questions"][3]["pure_agent_response"] == "answer 3"
+
+
+def test_async_compare_falls_back_when_judge_fails(fake_llm):
+    class BrokenModel:
+        async def generate_content_async(self, _prompt, **_kwargs):
+            raise ValueError("invalid argument")
+
+    evaluator = evaluator_module.Evaluator()
+    evaluator.judge_model = BrokenModel()
+
+    result = asyncio.run(evaluator.acompare_agents("question 1", "a", "b"))
+
+    assert result["scored"] is False
+    assert "invalid argument" in result["error"]
+
+
+@pytest.mark.parametrize("serial", [True, False])
+def test_failed_agent_calls_are_reported_but_not_scored(fake_llm, monkeypatch, serial):
+    def failing_generate(self, prompt, **_kwargs):
+        if "question 2" in prompt and "Relevant Knowledge" in prompt:
+            raise ValueError("response blocked")
+        return FakeModel._respond(self, prompt)[1]
+
+    async def failing_generate_async(self, prompt, **kwargs):
+        return failing_generate(self, prompt, **kwargs)
+
+    monkeypatch.setattr(FakeModel, "generate_content", failing_generate)
+    monkeypatch.setattr(FakeModel, "generate_content_async", failing_generate_async)
+
+    results = evaluator_module.run_experiment(QUESTIONS, serial=serial)
+
+    record = results["questions"][2]
+    assert record["scored"] is False
+    assert "response blocked" in record["comparison"]["error"]
+    assert results["summary"]["unscored"] == 1
+    assert results["summary"]["rag_wins"] + results["summary"]["pure_wins"] + results["summary"]["ties"] == 5
+    assert results["rate_limiter"]["failures"] == 1
+
+
+def test_rerun_with_response_cache_makes_no_model_calls(fake_llm, monkeypatch, tmp_path):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite3"))
+    monkeypatch.setattr(resources, "get_response_cache", lambda: cache)
+    monkeypatch.setattr(evaluator_module, "get_response_cache", lambda: cache)
+
+    first = evaluator_module.run_experiment(QUESTIONS)
+    monkeypatch.setattr(FakeModel, "generate_content", lambda *_args, **_kwargs: pytest.fail("not cached"))
+    monkeypatch.setattr(FakeModel, "generate_content_async", lambda *_args, **_kwargs: pytest.fail("not cached"))
+    second = evaluator_module.run_experiment(QUESTIONS)
+
+    assert _without_timing(second["questions"]) == _without_timing(first["questions"])
+    assert second["summary"] == first["summary"]
+    assert second["llm_cache"]["hits"] == 3 * len(QUESTIONS)
+
+
+def test_scheduler_overlaps_agents_and_reports_critical_path(fake_llm):
+    results = evaluator_module.run_experiment(QUESTIONS, serial=False)
+
+    for record in results["questions"]:
+        timing = record["timing"]
+        # Pure and RAG generation run side by side, so the critical path beats the serial sum
+        assert timing["critical_path_s"] < timing["serial_baseline_s"]
+        assert timing["serial_baseline_s"] == pytest.approx(
+            timing["pure_s"] + timing["retrieval_s"] + timing["rag_generation_s"] + timing["judge_s"], abs=0.01)
+    assert results["timing"]["critical_path_speedup"] > 1
+
+
+class BatchJudgeModel(FakeModel):
+    """Judges batched prompts with a JSON array; item 2 of every batch comes back invalid"""
+
+    def __init__(self):
+        self.judge_calls = 0
+
+    def _respond(self, prompt):
+        items = re.findall(r'<item id="(\d+)">(.*?)</item>', prompt, re.DOTALL)
+        if not items:
+            if "pure_agent_score" in prompt:
+                self.judge_calls += 1
+            return super()._respond(prompt)
+        self.judge_calls += 1
+        verdicts = []
+        for item_id, body in items:
+            verdict = json.loads(super()._respond(body + " pure_agent_score")[1].text)
+            if item_id == "2":
+                verdict["winner"] = "nobody"
+            verdicts.append({"id": int(item_id), **verdict})
+        return 0, type("Response", (), {"text": "```json\n" + json.dumps(verdicts) + "\n```"})()
+
+
+@pytest.mark.parametrize("serial", [True, False])
+def test_batched_judge_matches_single_judging_with_fewer_calls(fake_llm, monkeypatch, serial):
+    single = evaluator_module.run_experiment(QUESTIONS, serial=True)
+    model = BatchJudgeModel()
+    for module in (pure_agent_module, rag_agent_module, evaluator_module):
+        monkeypatch.setattr(module, "get_llm_client", lambda _name: model)
+
+    batched = evaluator_module.run_experiment(QUESTIONS, serial=serial, concurrency=6, judge_batch_size=3)
+
+    assert [q["comparison"] for q in batched["questions"]] == [q["comparison"] for q in single["questions"]]
+    # Two batches of three, plus one individual re-judge of the invalid item in each
+    assert model.judge_calls == 4
+    assert batched["judge"] == {"batches": 2, "batched_items": 6, "rejudged": 2}
+
+
+@pytest.mark.parametrize("failure", ["raises", "short"])
+def test_failed_batch_judge_leaves_its_questions_unscored(fake_llm, monkeypatch, failure):
+    async def broken_judge(self, items):
+        if failure == "raises":
+            raise RuntimeError("quota exhausted")
+        return [{"winner": "tie", "pure_agent_score": 5, "rag_agent_score": 5}] * (len(items) - 1)
+
+    monkeypatch.setattr(evaluator_module.Evaluator, "ajudge_items", broken_judge)
+    outcome = {}
+    worker = threading.Thread(daemon=True, target=lambda: outcome.update(
+        evaluator_module.run_experiment(QUESTIONS, concurrency=6, judge_batch_size=3)))
+    worker.start()
+    worker.join(timeout=30)
+
+    assert not worker.is_alive(), "questions waiting on the failed batch never finished"
+    assert outcome["summary"]["unscored"] == len(QUESTIONS)
+    assert all("评判调用失败" in q["comparison"]["error"] for q in outcome["questions"])
+
+
+def test_unparseable_verdict_is_flagged_and_not_scored(fake_llm, monkeypatch):
+    monkeypatch.setattr(FakeModel, "generate_content", lambda self, prompt, **_kwargs: (
+        type("Response", (), {"text": "I cannot decide"})() if "pure_agent_score" in prompt
+        else FakeModel._respond(self, prompt)[1]))
+
+    results = evaluator_module.run_experiment(QUESTIONS[:2], serial=True)
+
+    assert all(q["comparison"]["parse_failed"] and not q["scored"] for q in results["questions"])
+    assert results["summary"]["judge_parse_failures"] == 2
+    assert results["summary"]["unscored"] == 2
+    assert results["summary"]["ties"] == 0
+    assert results["summary"]["pure_agent_avg_score"] == 0
+
+
+def test_trials_reuse_retrieval_and_stop_once_intervals_are_tight(fake_llm, monkeypatch, tmp_path):
+    retrievals = []
+    monkeypatch.setattr(rag_agent_module.RAGAgent, "retrieve_many",
+                        lambda self, queries, k=4: retrievals.append(queries) or [[] for _ in queries])
+    output = tmp_path / "trials.json"
+
+    results = evaluator_module.run_trials(QUESTIONS, str(output), trials=5, min_trials=2, ci_tolerance=0.1)
+
+    # The fake judge is deterministic, so two identical trials already give zero-width intervals
+    assert results["trials_run"] == 2
+    assert results["stopped_early"]
+    assert len(retrievals) == 1
+    assert results["bootstrap"]["pure_score"]["half_width"] == 0.0
+    assert results["bootstrap"]["pure_score"]["mean"] == 2.5
+    assert results["per_question"][3]["pure_scores"] == [3.0, 3.0]
+    assert [s["rag_wins"] for s in results["trial_summaries"]] == [2, 2]
+    with open(results["log_file"], encoding="utf-8") as f:
+        assert sorted(json.loads(line)["trial"] for line in f) == [1] * 6 + [2] * 6
+    assert json.loads(output.read_text(encoding="utf-8"))["trials_run"] == 2
+
+
+def test_each_trial_uses_its_own_response_cache_namespace(fake_llm, monkeypatch, tmp_path):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite3"))
+    monkeypatch.setattr(resources, "get_response_cache", lambda: cache)
+    monkeypatch.setattr(evaluator_module, "get_response_cache", lambda: cache)
+
+    first = evaluator_module.run_trials(QUESTIONS, trials=3, min_trials=3)
+    assert first["llm_cache"]["hits"] == 0
+    assert first["llm_cache"]["entries"] == 3 * 3 * len(QUESTIONS)
+
+    second = evaluator_module.run_trials(QUESTIONS, trials=3, min_trials=3)
+    assert second["llm_cache"]["hits"] == 3 * 3 * len(QUESTIONS)
+    assert second["bootstrap"] == first["bootstrap"]
@@ -0,0 +1,143 @@
+import importlib
+import sys
+
+
+def _reload_module(module_name: str):
+    if module_name in sys.modules:
+        del sys.modules[module_name]
+    return importlib.import_module(module_name)
+
+
+class FakeCollection:
+    def __init__(self, store):
+        self.store = store
+
+    def count(self):
+        return len(self.store)
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        assert len(ids) == len(embeddings) == len(documents) == len(metadatas)
+        self.store.update(zip(ids, documents))
+
+    def get(self, include, limit, offset):
+        ids = list(self.store)[offset:offset + limit]
+        return {"ids": ids, "documents": [self.store[i] for i in ids]}
+
+
+class FakeVectorStore:
+    def __init__(self, store):
+        self.store = store
+        self._collection = FakeCollection(store)
+
+    def delete(self, ids):
+        for chunk_id in ids:
+            self.store.pop(chunk_id, None)
+
+    def reset_collection(self):
+        self.store.clear()
+
+
+def _patch_store(monkeypatch, module):
+    store = {}
+    built = {"embeddings": 0}
+
+    class FakeEmbeddings:
+        def embed_documents(self, texts):
+            return [[float(len(text))] for text in texts]
+
+    def fake_embeddings():
+        built["embeddings"] += 1
+        return FakeEmbeddings()
+
+    monkeypatch.setattr(module, "_open_vectorstore", lambda _db_dir, _embeddings=None: FakeVectorStore(store))
+    monkeypatch.setattr(module, "_build_embeddings", fake_embeddings)
+    return store, built
+
+
+def test_incremental_ingest_skips_unchanged_and_replaces_edited_files(monkeypatch, tmp_path):
+    module = _reload_module("rag.ingest")
+    store, built = _patch_store(monkeypatch, module)
+    source = tmp_path / "notes.md"
+    source.write_text("Proof of work secures the chain.\n\nNodes vote with CPU power.", encoding="utf-8")
+    db_dir = str(tmp_path / "db")
+
+    first = module.ingest_data(sources=[str(source)], db_dir=db_dir)
+    assert first["chunks_added"] == len(store) > 0
+    assert built["embeddings"] == 1
+
+    second = module.ingest_data(sources=[str(source)], db_dir=db_dir)
+    assert second["chunks_added"] == 0
+    assert second["files_unchanged"] == 1
+    assert built["embeddings"] == 1
+
+    source.write_text("Simplified payment verification uses block headers.", encoding="utf-8")
+    third = module.ingest_data(sources=[str(source)], db_dir=db_dir)
+    assert third["chunks_added"] == 1
+    assert third["chunks_deleted"] == first["chunks_added"]
+    assert list(store.values()) == ["Simplified payment verification uses block headers."]
+
+
+def test_incremental_ingest_drops_chunks_of_removed_files(monkeypatch, tmp_path):
+    module = _reload_module("rag.ingest")
+    store, _ = _patch_store(monkeypatch, module)
+    keep = tmp_path / "keep.md"
+    drop = tmp_path / "drop.md"
+    keep.write_text("Merkle trees compact old blocks.", encoding="utf-8")
+    drop.write_text("The incentive rewards honest nodes.", encoding="utf-8")
+    db_dir = str(tmp_path / "db")
+
+    module.ingest_data(sources=[str(keep), str(drop)], db_dir=db_dir)
+    stats = module.ingest_data(sources=[str(keep)], db_dir=db_dir)
+
+    assert stats["files_removed"] == 1
+    assert list(store.values()) == ["Merkle trees compact old blocks."]
+    assert len(module.load_manifest(db_dir)["files"]) == 1
+
+
+def test_source_ingest_keeps_chunks_of_corpus_runs(monkeypatch, tmp_path):
+    module = _reload_module("rag.ingest")
+    store, _ = _patch_store(monkeypatch, module)
+    data = tmp_path / "data"
+    (data / "extra").mkdir(parents=True)
+    (data / "notes.txt").write_text("Difficulty adjusts every two weeks.", encoding="utf-8")
+    (data / "extra" / "log.txt").write_text("Orphan blocks are discarded.", encoding="utf-8")
+    paper = data / "paper.md"
+    paper.write_text("Timestamps order transactions.", encoding="utf-8")
+    db_dir = str(tmp_path / "db")
+
+    module.ingest_corpus(str(data), patterns=("**/*.txt",), db_dir=db_dir, workers=1)
+    module.ingest_data(sources=[str(paper)], db_dir=db_dir)
+    stats = module.ingest_data(sources=[str(paper)], db_dir=db_dir)
+
+    assert stats["files_removed"] == 0
+    assert sorted(store.values()) == ["Difficulty adjusts every two weeks.", "Orphan blocks are discarded.",
+                                      "Timestamps order transactions."]
+    assert len(module.load_manifest(db_dir)["files"]) == 3
+
+
+def test_corpus_ingest_discovers_formats_and_resumes(monkeypatch, tmp_path):
+    module = _reload_module("rag.ingest")
+    store, _ = _patch_store(monkeypatch, module)
+    corpus = tmp_path / "corpus"
+    (corpus / "nested").mkdir(parents=True)
+    (corpus / "a.md").write_text("Blocks are chained by hashes.", encoding="utf-8")
+    (corpus / "nested" / "b.txt").write_text("Transactions are broadcast to all nodes.", encoding="utf-8")
+    (corpus / "nested" / "c.html").write_text("<html><body><p>Gas limits computation.</p></body></html>",
+                                              encoding="utf-8")
+    (corpus / "ignored.json").write_text("{}", encoding="utf-8")
+    db_dir = str(tmp_path / "db")
+
+    assert [p.rsplit("/", 1)[-1] for p in module.discover_files(str(corpus))] == ["a.md", "b.txt", "c.html"]
+
+    # Pretend an earlier run was killed after committing only a.md
+    module.ingest_corpus(str(corpus), patterns=("*.md",), db_dir=db_dir, workers=1)
+    stats = module.ingest_corpus(str(corpus), db_dir=db_dir, workers=2)
+
+    assert stats["files_unchanged"] == 1
+    assert stats["files_changed"] == 2
+    assert "Gas limits computation." in store.values()
+    stages = {stage["stage"]: stage for stage in stats["pipeline"]["stages"]}
+    assert list(stages) == ["parse", "split", "embed", "write"]
+    assert stages["parse"]["items"] == 2
+    assert stages["embed"]["units"] == stages["write"]["units"] == stats["chunks_added"] == 2
+    assert len(module.load_manifest(db_dir)["files"]) == 3
@@ -0,0 +1,96 @@
+import asyncio
+import json
+import re
+
+import pytest
+
+import agents.rag_agent as rag_agent_module
+import eval.evaluator as evaluator_module
+import resources
+from instrumentation import component, span, trace
+
+QUESTIONS = [{"id": i, "question": f"What is concept {i}?"} for i in range(3)]
+
+
+@pytest.fixture
+def stub_llm(monkeypatch):
+    monkeypatch.setenv("LLM_BACKEND", "stub")
+    monkeypatch.setattr(rag_agent_module, "DB_DIR", "Z:/definitely_missing_db")
+
+
+def test_spans_follow_traces_and_components_across_tasks():
+    async def answer():
+        with component("rag_agent"):
+            await asyncio.gather(*(asyncio.to_thread(_work, i) for i in range(2)))
+
+    def _work(i):
+        with span("vector_search", k=i):
+            pass
+
+    with trace() as outer:
+        asyncio.run(answer())
+        with pytest.raises(KeyError):
+            with span("parse"):
+                raise KeyError("bad")
+
+    records = outer.records()
+    assert sorted(r["k"] for r in records if r["stage"] == "vector_search") == [0, 1]
+    assert {r.get("component") for r in records} == {"rag_agent", None}
+    assert records[-1]["error"] == "KeyError"
+    summary = resources.get_span_metrics().summary()
+    assert summary["rag_agent/vector_search"]["count"] == 2
+    assert summary["parse"]["count"] == 1
+
+
+def test_prometheus_histograms_are_cumulative():
+    with span("generation", prompt_tokens=100, output_tokens=20, prompt_chars=400, response_chars=80):
+        pass
+    with span("generation", prompt_tokens=3000, output_tokens=20, prompt_chars=12000, response_chars=80):
+        pass
+
+    text = resources.get_span_metrics().to_prometheus()
+
+    assert "# TYPE rag_benchmark_stage_duration_seconds histogram" in text
+    assert 'rag_benchmark_stage_duration_seconds_count{stage="generation"} 2' in text
+    assert 'rag_benchmark_stage_tokens_bucket{stage="generation",kind="prompt",le="256"} 1' in text
+    assert 'rag_benchmark_stage_tokens_bucket{stage="generation",kind="prompt",le="4096"} 2' in text
+    assert 'rag_benchmark_stage_tokens_bucket{stage="generation",kind="prompt",le="+Inf"} 2' in text
+    assert 'rag_benchmark_stage_chars_total{stage="generation",kind="prompt"} 12400' in text
+    sample = re.compile(r'^[a-z_]+(\{[a-z]+="[^"]*"(,[a-z]+="[^"]*")*\})? [0-9.e+-]+$')
+    assert all(line.startswith("#") or sample.match(line) for line in text.splitlines())
+
+
+@pytest.mark.parametrize("serial", [True, False])
+def test_every_record_carries_its_own_stage_spans(stub_llm, tmp_path, serial):
+    output = tmp_path / "results.json"
+    results = evaluator_module.run_experiment(QUESTIONS, str(output), serial=serial)
+
+    with open(output, encoding="utf-8") as f:
+        records = json.load(f)["questions"]
+    assert len(records) == len(QUESTIONS)
+    for record in records:
+        spans = record["spans"]
+        generations = {s["component"]: s for s in spans if s["stage"] == "generation"}
+        assert set(generations) == {"pure_agent", "rag_agent", "judge"}
+        assert generations["rag_agent"]["prompt_chars"] > len(record["question"])
+        assert generations["judge"]["response_chars"] > 0
+        assert {"judge", "parse"} <= {s["stage"] for s in spans}
+
+    assert results["stages"]["judge/generation"]["count"] == len(QUESTIONS)
+    assert results["metrics_file"] == str(tmp_path / "results.prom")
+    metrics = (tmp_path / "results.prom").read_text(encoding="utf-8")
+    assert 'stage="generation",component="pure_agent",le="+Inf"} 3' in metrics
+
+
+def test_plain_rag_query_records_its_context_stats(stub_llm):
+    agent = rag_agent_module.RAGAgent()
+
+    with trace() as spans:
+        agent.query("What is concept 1?")
+        agent.stream_query("What is concept 2?").consume()
+
+    builds = [r for r in spans.records() if r["stage"] == "context_build"]
+    assert len(builds) == 2
+    for build in builds:
+        assert build["component"] == "rag_agent"
+        assert build["prompt_tokens_estimated"] > 0 and build["tokens_saved"] == 0
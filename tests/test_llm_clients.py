@@ -0,0 +1,117 @@
+import asyncio
+import json
+import random
+
+import pytest
+
+import resources
+import agents.rag_agent as rag_agent_module
+import eval.evaluator as evaluator_module
+from llm.clients import LatencyModel, LLMClient, StubClient
+from llm.rate_limiter import RateLimiter, classify_error
+from llm.streaming import stream_generate
+
+QUESTIONS = [{"question": f"What is concept {i}?", "category": "test"} for i in range(4)]
+
+
+def test_latency_specs_parse_and_sample_within_bounds():
+    rng = random.Random(1)
+
+    assert LatencyModel.parse("0.25").sample(rng) == 0.25
+    assert all(0.1 <= LatencyModel.parse("uniform:0.1:0.3").sample(rng) <= 0.3 for _ in range(100))
+    assert all(LatencyModel.parse("lognormal:0.2:0.5").sample(rng) > 0 for _ in range(100))
+    with pytest.raises(ValueError):
+        LatencyModel.parse("gamma:1")
+
+
+def test_stub_answers_and_verdicts_are_deterministic():
+    stub = StubClient(answers={"What is a nonce?": "A counter."})
+    judge_prompt = 'Question: q\nReturn {"pure_agent_score": ..., "rag_agent_score": ..., "winner": ...}'
+
+    verdict = json.loads(stub.generate_content(judge_prompt).text)
+
+    assert verdict == json.loads(StubClient().generate_content(judge_prompt).text)
+    assert verdict["winner"] in ("pure_agent", "rag_agent", "tie")
+    assert stub.generate_content("Question: What is a nonce?").text == "A counter."
+    assert "What is mining?" in stub.generate_content("Question: What is mining?").text
+
+
+def test_stub_errors_are_retryable_and_seeded():
+    stub = StubClient(error_rate=0.3, rate_limit_rate=0.2, seed=7)
+    outcomes = []
+    for i in range(200):
+        try:
+            stub.generate_content(f"Question: {i}")
+            outcomes.append(None)
+        except Exception as e:
+            outcomes.append(classify_error(e))
+
+    assert set(outcomes) == {None, "transient", "rate_limit"}
+    assert 0.35 < sum(o is not None for o in outcomes) / len(outcomes) < 0.65
+
+    limiter = RateLimiter(rpm=1e6, tpm=1e9, max_retries=20, sleep=lambda _s: None)
+    assert limiter.call(StubClient(error_rate=0.5).generate_content, "Question: retry me").text
+
+
+def test_stub_stream_paces_chunks():
+    stub = StubClient(latency="0.01", chunk_chars=8)
+    meta = {}
+
+    chunks = list(stream_generate(stub, "Question: What is proof of work?", meta=meta))
+
+    assert len(chunks) > 1
+    assert "".join(chunks) == stub.respond("Question: What is proof of work?")
+    assert meta["usage_metadata"].total_token_count > 0
+
+
+def test_stub_async_stream_yields_the_sync_chunks():
+    stub = StubClient(latency="0.001", chunk_chars=8)
+    prompt = "Question: What is proof of work?"
+
+    async def collect():
+        stream = await stub.generate_content_async(prompt, stream=True)
+        return [chunk.text async for chunk in stream], stream.usage_metadata
+
+    chunks, usage = asyncio.run(collect())
+
+    assert chunks == [chunk.text for chunk in stub.generate_content(prompt, stream=True)]
+    assert len(chunks) > 1
+    assert usage.total_token_count > 0
+
+
+def test_stub_forgets_attempts_once_a_request_succeeds():
+    stub = StubClient(error_rate=0.5, seed=3)
+    limiter = RateLimiter(rpm=1e6, tpm=1e9, max_retries=20, sleep=lambda _s: None)
+
+    for i in range(50):
+        limiter.call(stub.generate_content, f"Question: {i}")
+
+    assert stub.calls > 50
+    assert stub._attempts == {}
+
+
+def test_llm_client_requires_both_generate_methods():
+    class SyncOnly(LLMClient):
+        def generate_content(self, prompt, safety_settings=None, generation_config=None, stream=False):
+            return prompt
+
+    with pytest.raises(TypeError):
+        SyncOnly()
+
+
+def test_experiment_runs_offline_on_stub_backend(monkeypatch):
+    monkeypatch.delenv("GOOGLE_API_KEY", raising=False)
+    monkeypatch.setenv("LLM_BACKEND", "stub")
+    monkeypatch.setenv("LLM_STUB_LATENCY", "uniform:0.001:0.005")
+    monkeypatch.setattr(rag_agent_module, "DB_DIR", "Z:/definitely_missing_db")
+
+    first = evaluator_module.run_experiment(QUESTIONS, concurrency=2)
+    resources.reset()
+    second = evaluator_module.run_experiment(QUESTIONS, serial=True)
+
+    assert len(first["questions"]) == len(QUESTIONS)
+    assert first["summary"]["unscored"] == 0
+    assert first["summary"]["rag_wins"] + first["summary"]["pure_wins"] + first["summary"]["ties"] == len(QUESTIONS)
+    assert first["summary"] == second["summary"]
+    assert asyncio.run(resources.get_llm_client("gemini-2.5-flash").generate_content_async(
+        "Question: x")).text
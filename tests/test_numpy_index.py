@@ -0,0 +1,41 @@
+import numpy as np
+
+import rag.numpy_index as numpy_index
+from rag.numpy_index import NumpyIndex
+
+
+def _build(tmp_path, n=50, dim=8, dtype="float32"):
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(n, dim)).astype(np.float32)
+    ids = [f"chunk-{i}" for i in range(n)]
+    texts = [f"text {i}" for i in range(n)]
+    metadatas = [{"source": "bitcoin.pdf", "page": i % 9} for i in range(n)]
+    index = NumpyIndex.build(str(tmp_path / "index"), ids, vectors, texts, metadatas, dtype=dtype)
+    return index, vectors
+
+
+def test_numpy_index_matches_brute_force_across_blocks(tmp_path, monkeypatch):
+    monkeypatch.setattr(numpy_index, "SEARCH_BLOCK_ROWS", 7)
+    index, vectors = _build(tmp_path)
+    queries = np.random.default_rng(1).normal(size=(5, vectors.shape[1]))
+
+    rows, scores = index.search(queries, k=4)
+
+    normed = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    qn = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    expected = np.argsort(-(qn @ normed.T), axis=1)[:, :4]
+    assert rows.tolist() == expected.tolist()
+    assert np.all(np.diff(scores, axis=1) <= 0)
+
+
+def test_numpy_index_reads_documents_from_sidecar(tmp_path):
+    index, vectors = _build(tmp_path, dtype="float16")
+    reopened = NumpyIndex(index.index_dir)
+
+    hits = reopened.similarity_search_by_vector_with_relevance_scores(vectors[12], k=1)
+
+    assert reopened.vectors.dtype == np.float16
+    assert hits[0][0].page_content == "text 12"
+    assert hits[0][0].metadata == {"source": "bitcoin.pdf", "page": 3}
+    assert hits[0][1] > 0.99
+    assert [d.page_content for d in reopened.get_by_ids(["chunk-3", "missing", "chunk-1"])] == ["text 3", "text 1"]
@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+onnx = pytest.importorskip("onnx")
+pytest.importorskip("onnxruntime")
+pytest.importorskip("tokenizers")
+
+from onnx import TensorProto, helper, numpy_helper
+from tokenizers import Tokenizer
+from tokenizers.models import WordLevel
+from tokenizers.pre_tokenizers import Whitespace
+
+from rag import onnx_embeddings
+from rag.onnx_embeddings import FP32_FILE, INT8_FILE, TOKENIZER_FILE, OnnxEmbeddings
+
+VOCAB = ["[PAD]", "[UNK]", "proof", "of", "work", "merkle", "tree", "nonce", "block", "chain"]
+DIM = 16
+
+
+def _export_tiny_model(model_dir):
+    """A stand-in transformer: token embedding lookup followed by one dense layer"""
+    rng = np.random.default_rng(0)
+    table = rng.normal(size=(len(VOCAB), DIM)).astype(np.float32)
+    dense = rng.normal(size=(DIM, DIM)).astype(np.float32)
+
+    graph = helper.make_graph(
+        [
+            helper.make_node("Gather", ["table", "input_ids"], ["embedded"]),
+            helper.make_node("MatMul", ["embedded", "dense"], ["last_hidden_state"]),
+        ],
+        "tiny",
+        [
+            helper.make_tensor_value_info("input_ids", TensorProto.INT64, ["batch", "sequence"]),
+            helper.make_tensor_value_info("attention_mask", TensorProto.INT64, ["batch", "sequence"]),
+        ],
+        [helper.make_tensor_value_info("last_hidden_state", TensorProto.FLOAT, ["batch", "sequence", DIM])],
+        initializer=[numpy_helper.from_array(table, "table"), numpy_helper.from_array(dense, "dense")],
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 17)])
+    model.ir_version = 8
+    onnx.save(model, str(model_dir / FP32_FILE))
+
+    tokenizer = Tokenizer(WordLevel({token: i for i, token in enumerate(VOCAB)}, unk_token="[UNK]"))
+    tokenizer.pre_tokenizer = Whitespace()
+    tokenizer.save(str(model_dir / TOKENIZER_FILE))
+    return table @ dense
+
+
+def _expected(hidden_by_token, text):
+    ids = [VOCAB.index(word) if word in VOCAB else 1 for word in text.split()]
+    pooled = hidden_by_token[ids].mean(axis=0)
+    return pooled / np.linalg.norm(pooled)
+
+
+def test_onnx_embeddings_mean_pool_and_normalize_ignoring_padding(tmp_path):
+    hidden = _export_tiny_model(tmp_path)
+    texts = ["merkle tree", "proof of work nonce block chain", "nonce", "unknown words here"]
+
+    embeddings = OnnxEmbeddings(model_dir=str(tmp_path), quantized=False, batch_size=2)
+    vectors = np.array(embeddings.embed_documents(texts))
+
+    # Length-sorted batching must not reorder the output, and padding must not leak into the mean
+    expected = np.array([_expected(hidden, text) for text in texts])
+    assert np.allclose(vectors, expected, atol=1e-5)
+    assert np.allclose(embeddings.embed_query("merkle tree"), expected[0], atol=1e-5)
+
+
+def test_int8_model_stays_within_documented_tolerance(tmp_path):
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    _export_tiny_model(tmp_path)
+    quantize_dynamic(str(tmp_path / FP32_FILE), str(tmp_path / INT8_FILE), weight_type=QuantType.QInt8)
+    texts = ["merkle tree", "proof of work", "block chain nonce"]
+
+    fp32 = np.array(OnnxEmbeddings(model_dir=str(tmp_path), quantized=False).embed_documents(texts))
+    int8 = np.array(OnnxEmbeddings(model_dir=str(tmp_path), quantized=True).embed_documents(texts))
+
+    assert np.all(np.sum(fp32 * int8, axis=1) >= onnx_embeddings.INT8_MIN_COSINE)
+
+
+def test_missing_export_points_at_the_export_command(tmp_path):
+    with pytest.raises(FileNotFoundError, match="--export"):
+        OnnxEmbeddings(model_dir=str(tmp_path))
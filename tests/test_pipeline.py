@@ -0,0 +1,51 @@
+import pytest
+
+from rag.pipeline import Pipeline, Stage
+
+
+def test_pipeline_preserves_order_and_counts_units():
+    pipeline = Pipeline(
+        Stage("source", lambda: iter(range(20)), unit="numbers"),
+        [
+            Stage("split", lambda n: [n, n], unit="numbers"),
+            Stage("square", lambda n: [n * n], unit="numbers"),
+        ],
+        queue_size=2,
+    )
+
+    outputs = list(pipeline.run())
+
+    assert outputs == [n * n for n in range(20) for _ in range(2)]
+    assert [s.units for s in pipeline.stats] == [20, 40, 40]
+    assert pipeline.report()["stages"][0]["stage"] == "source"
+
+
+def test_pipeline_reraises_stage_errors():
+    def explode(n):
+        if n == 3:
+            raise RuntimeError("bad chunk")
+        return [n]
+
+    pipeline = Pipeline(Stage("source", lambda: iter(range(10))), [Stage("explode", explode)])
+
+    with pytest.raises(RuntimeError, match="bad chunk"):
+        list(pipeline.run())
+
+
+def test_stage_outputs_are_streamed_under_backpressure():
+    produced = []
+
+    def batches(n):
+        for i in range(100):
+            produced.append(i)
+            yield (n, i)
+
+    pipeline = Pipeline(Stage("source", lambda: iter([0])), [Stage("batches", batches)], queue_size=2)
+
+    ahead = []
+    for consumed, _ in enumerate(pipeline.run(), 1):
+        ahead.append(len(produced) - consumed)
+
+    assert len(ahead) == 100
+    # Bounded by the queue plus the output waiting in put(), not by the 100 outputs of the item
+    assert max(ahead) <= 4
@@ -0,0 +1,97 @@
+import json
+import re
+import zlib
+
+import numpy as np
+import pytest
+
+import eval.evaluator as evaluator_module
+from eval.prejudge import PreJudge, calibrate, final_answer, token_f1
+
+
+class HashingEmbeddings:
+    """Bag-of-tokens vectors: answers sharing words with the reference get a high cosine"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        vectors = np.zeros((len(texts), 64))
+        for row, text in enumerate(texts):
+            for token in text.lower().split():
+                vectors[row, zlib.crc32(token.encode()) % 64] += 1
+        return vectors.tolist()
+
+
+class CountingJudge:
+    def __init__(self):
+        self.prompts = []
+
+    def generate_content(self, prompt, **_kwargs):
+        self.prompts.append(prompt)
+        verdict = {"pure_agent_score": 6, "rag_agent_score": 6, "winner": "tie"}
+        ids = re.findall(r'<item id="(\d+)">', prompt)
+        text = json.dumps([{"id": int(i), **verdict} for i in ids] if ids else verdict)
+        return type("Response", (), {"text": text})()
+
+
+def _item(question, pure, rag, reference="proof of work secures the chain"):
+    return {"question": question, "pure_answer": pure, "rag_answer": rag, "reference": reference}
+
+
+def test_token_f1_handles_cjk_and_final_answer_sections():
+    assert token_f1("时间戳服务器", "时间戳") == pytest.approx(2 * 0.5 * 1 / 1.5)
+    assert token_f1("unrelated", "proof of work") == 0.0
+    assert final_answer("## Reasoning Process\nx\n\n## Final Answer\nproof of work") == "proof of work"
+
+
+def test_clear_margins_skip_the_llm_and_metrics_are_kept(monkeypatch):
+    monkeypatch.setenv("GOOGLE_API_KEY", "test-key")
+    embeddings = HashingEmbeddings()
+    judge = CountingJudge()
+    evaluator = evaluator_module.Evaluator(prejudge=PreJudge(embeddings, threshold=0.3))
+    evaluator.judge_model = judge
+    items = [
+        _item("q1", "bananas are yellow", "## Final Answer\nproof of work secures the chain"),
+        _item("q2", "proof of work secures it", "proof of work secures the chain too"),
+        _item("q3", "no idea", "no clue", reference=None),
+    ]
+
+    comparisons = evaluator.judge_items(items)
+
+    assert embeddings.calls == 1
+    assert comparisons[0]["winner"] == "rag_agent" and comparisons[0]["judged_by"] == "prejudge"
+    assert comparisons[0]["local_metrics"]["margin"] > 0.3
+    assert "judged_by" not in comparisons[1] and comparisons[1]["local_metrics"]["decided_locally"] is False
+    assert "local_metrics" not in comparisons[2]
+    # q2 and q3 go to the LLM together as one batch
+    assert len(judge.prompts) == 1
+    assert evaluator.prejudge.stats == {"scored": 2, "decided_locally": 1, "sent_to_llm": 2}
+
+
+def test_calibration_mode_never_skips():
+    prejudge = PreJudge(HashingEmbeddings(), threshold=None)
+
+    metrics = prejudge.score_many([_item("q", "bananas", "proof of work secures the chain")])
+
+    assert metrics[0]["margin"] > 0.5 and metrics[0]["decided_locally"] is False
+
+
+def test_calibrate_recommends_smallest_threshold_meeting_agreement():
+    margins = [0.4, 0.35, -0.3, 0.05, -0.02, 0.1]
+    winners = ["rag_agent", "rag_agent", "pure_agent", "pure_agent", "rag_agent", "tie"]
+
+    report = calibrate(margins, winners, thresholds=[0.0, 0.1, 0.2], min_agreement=0.9)
+
+    assert [row["skipped"] for row in report["rows"]] == [6, 4, 3]
+    assert report["rows"][1]["agreement"] == 0.75
+    assert report["recommended"] == 0.2
+
+
+def test_zero_margin_is_a_tie_locally_and_in_calibration():
+    metrics = {"pure_score": 0.5, "rag_score": 0.5, "margin": 0.0}
+
+    assert PreJudge.verdict(metrics)["winner"] == "tie"
+    report = calibrate([0.0, 0.0, 0.2], ["tie", "tie", "rag_agent"], thresholds=[0.0])
+    assert report["rows"][0]["agreement"] == 1.0
@@ -0,0 +1,113 @@
+import importlib
+import sys
+
+import numpy as np
+import pytest
+
+
+def _reload_module(module_name: str):
+    if module_name in sys.modules:
+        del sys.modules[module_name]
+    return importlib.import_module(module_name)
+
+
+TEXTS = [
+    "proof of work nonce hashing",
+    "simplified payment verification headers",
+    "merkle tree reclaiming disk space",
+    "incentive for honest nodes",
+]
+
+
+class KeywordEmbeddings:
+    """Deterministic bag-of-words embeddings over a tiny vocabulary"""
+
+    vocab = ["proof", "work", "payment", "verification", "merkle", "disk", "incentive", "nodes"]
+
+    def embed_documents(self, texts):
+        vectors = []
+        for text in texts:
+            words = text.lower().split()
+            vec = np.array([float(w in words) for w in self.vocab]) + 0.01
+            vectors.append((vec / np.linalg.norm(vec)).tolist())
+        return vectors
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+class DummyModel:
+    def generate_content(self, _prompt, **_kwargs):
+        return type("Response", (), {"text": "ok"})()
+
+
+def _make_agent(monkeypatch, tmp_path, backend, hybrid=False):
+    monkeypatch.setenv("GOOGLE_API_KEY", "test-key")
+    module = _reload_module("agents.rag_agent")
+    monkeypatch.setattr(module, "get_llm_client", lambda _name: DummyModel())
+    monkeypatch.setattr(module, "get_embeddings", KeywordEmbeddings)
+
+    db_dir = str(tmp_path / "db")
+    ids = [f"chunk-{i}" for i in range(len(TEXTS))]
+    vectors = KeywordEmbeddings().embed_documents(TEXTS)
+    metadatas = [{"source": "bitcoin.pdf", "page": i} for i in range(len(TEXTS))]
+    if backend == "chroma":
+        from langchain_chroma import Chroma
+        Chroma(persist_directory=db_dir)._collection.upsert(
+            ids=ids, embeddings=vectors, documents=TEXTS, metadatas=metadatas
+        )
+    else:
+        from rag.numpy_index import NumpyIndex
+        NumpyIndex.build(str(tmp_path / "db" / "numpy_index"), ids, vectors, TEXTS, metadatas)
+    monkeypatch.setattr(module, "DB_DIR", db_dir)
+    monkeypatch.setattr(module, "NUMPY_INDEX_DIR", str(tmp_path / "db" / "numpy_index"))
+    if hybrid:
+        from rag.bm25 import BM25Index
+        BM25Index.build(ids, TEXTS).save(str(tmp_path / "db" / "bm25"))
+        monkeypatch.setattr(module, "BM25_DIR", str(tmp_path / "db" / "bm25"))
+    return module.RAGAgent(backend=backend, hybrid=hybrid)
+
+
+@pytest.mark.parametrize("backend", ["chroma", "numpy"])
+def test_retrieve_many_returns_scored_documents_per_query(monkeypatch, tmp_path, backend):
+    agent = _make_agent(monkeypatch, tmp_path, backend)
+
+    batches = agent.retrieve_many(["merkle disk", "payment verification", "proof work"], k=2)
+
+    assert [batch[0][0].page_content for batch in batches] == [TEXTS[2], TEXTS[1], TEXTS[0]]
+    assert all(len(batch) == 2 for batch in batches)
+    for batch in batches:
+        assert batch[0][1] >= batch[1][1]
+    assert batches[0][0][1] > 0.9
+
+
+def test_query_with_reasoning_uses_prefetched_documents(monkeypatch, tmp_path):
+    agent = _make_agent(monkeypatch, tmp_path, "numpy")
+    prefetched = agent.retrieve_many(["incentive nodes"], k=1)[0]
+    monkeypatch.setattr(agent, "retrieve", lambda *_args, **_kwargs: pytest.fail("should not retrieve"))
+
+    result = agent.query_with_reasoning("incentive nodes", prefetched=prefetched)
+
+    assert result["retrieved_docs"][0]["content"] == TEXTS[3]
+    assert result["retrieved_docs"][0]["score"] > 0.9
+
+
+@pytest.mark.parametrize("backend", ["chroma", "numpy"])
+def test_hybrid_retrieval_finds_exact_terms_dense_misses(monkeypatch, tmp_path, backend):
+    agent = _make_agent(monkeypatch, tmp_path, backend, hybrid=True)
+
+    # "nonce" and "reclaiming" are outside the dense vocabulary
+    assert agent.retrieve("nonce", k=1)[0].page_content == TEXTS[0]
+    batches = agent.retrieve_many(["reclaiming", "nonce"], k=1)
+    assert [batch[0][0].page_content for batch in batches] == [TEXTS[2], TEXTS[0]]
+
+
+@pytest.mark.parametrize("space", ["cosine", "ip", "l2"])
+def test_chroma_distances_convert_to_cosine_similarity(space):
+    module = _reload_module("agents.rag_agent")
+    a = np.array([0.6, 0.8])
+    b = np.array([1.0, 0.0])
+    cosine = float(a @ b)
+    distance = {"cosine": 1.0 - cosine, "ip": 1.0 - cosine, "l2": float(np.sum((a - b) ** 2))}[space]
+
+    assert module._distance_to_similarity(distance, space) == pytest.approx(cosine)
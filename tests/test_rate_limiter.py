@@ -0,0 +1,104 @@
+import asyncio
+import random
+
+import pytest
+
+from llm.rate_limiter import RateLimiter, TokenBucket, classify_error, retry_hint
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class ResourceExhausted(Exception):
+    code = 429
+
+
+def _limiter(clock, **kwargs):
+    return RateLimiter(clock=clock, sleep=clock.sleep, rng=random.Random(0), **kwargs)
+
+
+def test_token_bucket_queues_reservations_beyond_capacity():
+    clock = FakeClock()
+    bucket = TokenBucket(capacity=2, rate=1 / 30, clock=clock)
+
+    assert [bucket.reserve(1) for _ in range(3)] == [0.0, 0.0, pytest.approx(30.0)]
+    clock.now = 30.0
+    assert bucket.reserve(1) == pytest.approx(30.0)
+
+
+def test_limiter_enforces_rpm_and_tpm():
+    clock = FakeClock()
+    limiter = _limiter(clock, rpm=60, tpm=1000)
+
+    for _ in range(3):
+        limiter.call(lambda: "ok", tokens=600)
+
+    # 1000 TPM refills ~16.7 tokens/s: the 2nd and 3rd calls each wait for 600 tokens
+    assert clock.sleeps[0] == 0.0
+    assert clock.sleeps[1] == pytest.approx(200 / (1000 / 60))
+    assert sum(clock.sleeps) == pytest.approx(800 / (1000 / 60))
+
+
+def test_rate_limit_errors_back_off_slow_down_and_recover():
+    clock = FakeClock()
+    limiter = _limiter(clock, rpm=600, tpm=1_000_000)
+    attempts = []
+
+    def flaky():
+        attempts.append(clock.now)
+        if len(attempts) < 3:
+            raise ResourceExhausted("Quota exceeded. Please retry in 7s.")
+        return "ok"
+
+    assert limiter.call(flaky) == "ok"
+    assert attempts[1] - attempts[0] >= 7.0
+    stats = limiter.stats()
+    assert stats["rate_limited"] == 2 and stats["retries"] == 2
+    # Halved twice, then one additive recovery step after the success
+    assert stats["rate_factor"] == pytest.approx(0.3)
+
+
+def test_non_retryable_errors_raise_immediately():
+    clock = FakeClock()
+    limiter = _limiter(clock)
+    calls = []
+
+    def bad_key():
+        calls.append(1)
+        raise ValueError("API key not valid")
+
+    with pytest.raises(ValueError):
+        limiter.call(bad_key)
+    assert len(calls) == 1
+    assert limiter.stats()["failures"] == 1
+
+
+def test_async_call_retries_transient_errors_until_exhausted():
+    limiter = RateLimiter(max_retries=2, base_delay=0.001, rng=random.Random(0))
+    calls = []
+
+    async def unavailable():
+        calls.append(1)
+        raise ConnectionError("connection reset")
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(limiter.acall(unavailable))
+    assert len(calls) == 3
+    assert limiter.stats()["transient_errors"] == 2
+
+
+def test_error_classification():
+    assert classify_error(ResourceExhausted("quota")) == "rate_limit"
+    assert classify_error(TimeoutError()) == "transient"
+    assert classify_error(ValueError("blocked by safety")) is None
+    assert retry_hint(Exception("retry_delay { seconds: 12 }")) == 12.0
@@ -0,0 +1,69 @@
+import asyncio
+
+from llm.generation import agenerate, generate
+from llm.rate_limiter import RateLimiter
+from llm.response_cache import ResponseCache, cache_key
+
+
+class CountingModel:
+    model_name = "models/test-model"
+
+    def __init__(self):
+        self.calls = 0
+
+    def _response(self, prompt):
+        self.calls += 1
+        usage = type("Usage", (), {"prompt_token_count": 3, "candidates_token_count": 2, "total_token_count": 5})()
+        return type("Response", (), {"text": f"answer to {prompt}", "usage_metadata": usage})()
+
+    def generate_content(self, prompt, **_kwargs):
+        return self._response(prompt)
+
+    async def generate_content_async(self, prompt, **_kwargs):
+        return self._response(prompt)
+
+
+SAFETY = [{"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"}]
+
+
+def test_cache_key_covers_model_prompt_safety_and_generation_config():
+    model = CountingModel()
+    base = cache_key(model, "prompt", SAFETY, {"temperature": 0})
+
+    assert base == cache_key(model, "prompt", [dict(SAFETY[0])], {"temperature": 0})
+    assert base != cache_key(model, "prompt ", SAFETY, {"temperature": 0})
+    assert base != cache_key(model, "prompt", None, {"temperature": 0})
+    assert base != cache_key(model, "prompt", SAFETY, {"temperature": 1})
+    other = CountingModel()
+    other.model_name = "models/other"
+    assert base != cache_key(other, "prompt", SAFETY, {"temperature": 0})
+
+
+def test_generate_replays_cached_responses_across_instances(tmp_path):
+    path = str(tmp_path / "responses.sqlite3")
+    model = CountingModel()
+    limiter = RateLimiter()
+
+    first = generate(model, "q1", limiter=limiter, cache=ResponseCache(path), safety_settings=SAFETY)
+    reopened = ResponseCache(path)
+    again = generate(model, "q1", limiter=limiter, cache=reopened, safety_settings=SAFETY)
+    replayed = asyncio.run(agenerate(model, "q1", limiter=limiter, cache=reopened, safety_settings=SAFETY))
+
+    assert model.calls == 1
+    assert again.text == replayed.text == first.text
+    assert again.usage_metadata.total_token_count == 5
+    assert reopened.stats()["hits"] == 2 and limiter.stats()["calls"] == 1
+
+
+def test_cache_evicts_least_recently_used_by_size(tmp_path):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite3"), max_bytes=800)
+    model = CountingModel()
+    for prompt in ["a", "b", "c"]:
+        generate(model, prompt * 100, limiter=RateLimiter(), cache=cache)
+    generate(model, "a" * 100, limiter=RateLimiter(), cache=cache)  # refresh "a"
+    generate(model, "d" * 100, limiter=RateLimiter(), cache=cache)
+
+    assert model.calls == 4
+    assert cache.get(cache_key(model, "a" * 100)) is not None
+    assert cache.get(cache_key(model, "b" * 100)) is None
+    assert len(cache) == 3
@@ -0,0 +1,91 @@
+import json
+
+import pytest
+
+import agents.rag_agent as rag_agent_module
+import eval.evaluator as evaluator_module
+from eval.results_log import IncrementalSummary, ResultsLog, assign_ids, iter_ordered
+
+QUESTIONS = [{"id": i, "question": f"What is concept {i}?"} for i in range(6)]
+
+
+class Crash(Exception):
+    pass
+
+
+@pytest.fixture
+def stub_llm(monkeypatch):
+    monkeypatch.setenv("LLM_BACKEND", "stub")
+    monkeypatch.setattr(rag_agent_module, "DB_DIR", "Z:/definitely_missing_db")
+
+
+def _record(qid, winner="tie", scored=True):
+    return {"id": qid, "question": str(qid), "scored": scored,
+            "comparison": {"pure_agent_score": 6, "rag_agent_score": 7, "winner": winner},
+            "rag_context_stats": {"prompt_tokens_estimated": 100, "tokens_saved": 3},
+            "timing": {"critical_path_s": 1.0, "serial_baseline_s": 2.0}}
+
+
+def test_ids_are_stable_and_unique_for_duplicate_questions():
+    questions = [{"question": "a"}, {"question": "a"}, {"id": 7, "question": "b"}]
+
+    ids = assign_ids(questions)
+
+    assert ids == assign_ids(questions)
+    assert ids[1] == ids[0] + "#2" and ids[2] == 7
+
+
+def test_incremental_summary_matches_batch_summary():
+    records = [_record(1, "rag_agent"), _record(2, "pure_agent"), _record(3, scored=False), _record(4)]
+    tally = IncrementalSummary()
+    for record in records:
+        tally.add(record)
+
+    assert tally.summary() == evaluator_module.summarize(records)
+    assert tally.summary()["unscored"] == 1 and tally.summary()["rag_wins"] == 1
+    assert tally.timing()["critical_path_speedup"] == 2.0
+
+
+def test_resume_drops_a_torn_last_line(tmp_path):
+    path = tmp_path / "log.jsonl"
+    log = ResultsLog(str(path))
+    log.append(_record(1))
+    log.close()
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"id": 2, "quest')
+
+    log = ResultsLog(str(path), resume=True)
+    log.append(_record(3))
+    log.close()
+
+    assert [r["id"] for r in iter_ordered(str(path), [3, 1])] == [3, 1]
+
+
+def test_crashed_run_resumes_and_builds_artifact(stub_llm, monkeypatch, tmp_path):
+    output = tmp_path / "results.json"
+    original = evaluator_module.Evaluator.acompare_agents
+    judged = []
+
+    async def crash_on_fourth(self, *args, **kwargs):
+        if len(judged) == 3:
+            raise Crash()
+        judged.append(kwargs["question"])
+        return await original(self, *args, **kwargs)
+
+    monkeypatch.setattr(evaluator_module.Evaluator, "acompare_agents", crash_on_fourth)
+    with pytest.raises(Crash):
+        evaluator_module.run_experiment(QUESTIONS, str(output), serial=False)
+    assert not output.exists()
+    logged = [json.loads(line)["question"] for line in open(tmp_path / "results.jsonl", encoding="utf-8")]
+    assert sorted(logged) == sorted(judged)
+
+    monkeypatch.setattr(evaluator_module.Evaluator, "acompare_agents", original)
+    resumed = evaluator_module.run_experiment(QUESTIONS, str(output), serial=False, resume=True)
+    expected = evaluator_module.run_experiment(QUESTIONS)
+
+    artifact = json.loads(output.read_text(encoding="utf-8"))
+    assert resumed["log_file"].endswith("results.jsonl")
+    assert [q["question"] for q in artifact["questions"]] == [q["question"] for q in QUESTIONS]
+    assert resumed["questions"] == artifact["questions"]
+    assert artifact["summary"] == resumed["summary"] == expected["summary"]
+    assert "\n" not in output.read_text(encoding="utf-8")
@@ -0,0 +1,119 @@
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+
+from eval.retrieval_eval import (
+    GOLD_PATH, check_thresholds, coverage_tensor, evaluate_retrieval, load_gold, retrieval_metrics, span_matches
+)
+
+
+def _doc(text, page=0, source="data/bitcoin.pdf"):
+    return Document(page_content=text, metadata={"source": source, "page": page})
+
+
+class FakeRetriever:
+    def __init__(self, results):
+        self.results = results
+        self.retrieve_calls = 0
+
+    def retrieve_many(self, queries, k=4):
+        return [[(doc, 1.0) for doc in self.results[q][:k]] for q in queries]
+
+    def retrieve(self, query, k=4):
+        self.retrieve_calls += 1
+        return self.results[query][:k]
+
+
+class CachingRetriever(FakeRetriever):
+    """Records which embedding object each call went through"""
+
+    def __init__(self, results):
+        super().__init__(results)
+        self.model = object()
+        self._embeddings = type("Cached", (), {"inner": self.model})()
+        self.calls = []
+
+    @property
+    def embeddings(self):
+        return self._embeddings
+
+    def retrieve_many(self, queries, k=4):
+        self.calls.append(("retrieve_many", self._embeddings is self.model))
+        return super().retrieve_many(queries, k)
+
+    def retrieve(self, query, k=4):
+        self.calls.append(("retrieve", self._embeddings is self.model))
+        return super().retrieve(query, k)
+
+
+def test_span_matches_requires_every_constraint():
+    doc = _doc("A Timestamp   server works\nby taking a hash of a block", page=1)
+    assert span_matches({"text": "timestamp server works by taking"}, doc)
+    assert span_matches({"source": "bitcoin.pdf", "pages": [1, 2], "text": "hash"}, doc)
+    assert not span_matches({"pages": [0], "text": "hash"}, doc)
+    assert not span_matches({"source": "other.pdf"}, doc)
+
+
+def test_metrics_match_hand_computed_values():
+    spans = [
+        [{"text": "alpha"}, {"text": "beta"}],
+        [{"text": "gamma"}],
+        [{"text": "delta"}],
+    ]
+    retrieved = [
+        [_doc("noise"), _doc("alpha"), _doc("alpha beta")],
+        [_doc("gamma"), _doc("noise"), _doc("noise")],
+        [_doc("noise"), _doc("noise"), _doc("noise")],
+    ]
+    covers, span_mask = coverage_tensor(retrieved, spans, 3)
+    metrics = retrieval_metrics(covers, span_mask, [1, 3])
+
+    assert metrics["first_hit_rank"] == [2, 1, None]
+    assert metrics["reciprocal_rank"].tolist() == pytest.approx([0.5, 1.0, 0.0])
+    assert metrics["recall@1"].tolist() == pytest.approx([0.0, 1.0, 0.0])
+    assert metrics["recall@3"].tolist() == pytest.approx([1.0, 1.0, 0.0])
+    # Question 1 gains at ranks 2 and 3; the ideal ranking gains at ranks 1 and 2
+    dcg = 1 / np.log2(3) + 1 / 2
+    ideal = 1 + 1 / np.log2(3)
+    assert metrics["ndcg@3"].tolist() == pytest.approx([dcg / ideal, 1.0, 0.0])
+
+
+def test_evaluate_retrieval_skips_unlabeled_questions_and_times_each_query():
+    questions = [{"id": 1, "question": "q1"}, {"id": 2, "question": "q2"}, {"id": 3, "question": "q3"}]
+    gold = {1: [{"text": "alpha"}], 2: [{"text": "beta"}]}
+    agent = FakeRetriever({
+        "q1": [_doc("alpha"), _doc("noise")],
+        "q2": [_doc("noise"), _doc("beta")],
+    })
+
+    report = evaluate_retrieval(agent, questions, gold, ks=[1, 2])
+
+    assert report["num_questions"] == 2
+    assert report["metrics"]["recall@1"] == 0.5
+    assert report["metrics"]["recall@2"] == 1.0
+    assert report["metrics"]["mrr"] == 0.75
+    assert agent.retrieve_calls == 2
+    assert set(report["latency_ms"]) == {"p50", "p95", "p99"}
+    assert [q["first_hit_rank"] for q in report["questions"]] == [1, 2]
+
+    assert check_thresholds(report["metrics"], ["recall@2=1.0"]) == []
+    assert check_thresholds(report["metrics"], ["mrr=0.9"]) == ["mrr = 0.75 < 0.9"]
+    with pytest.raises(ValueError):
+        check_thresholds(report["metrics"], ["recall@7=0.5"])
+
+
+def test_gold_file_covers_the_benchmark_questions():
+    gold = load_gold(GOLD_PATH)
+    assert sorted(gold) == list(range(1, 11))
+    assert all(gold[qid] for qid in gold)
+
+
+def test_single_query_latency_is_timed_first_without_the_embedding_cache():
+    agent = CachingRetriever({"q1": [_doc("alpha")], "q2": [_doc("beta")]})
+    cached = agent.embeddings
+
+    evaluate_retrieval(agent, [{"id": 1, "question": "q1"}, {"id": 2, "question": "q2"}],
+                       {1: [{"text": "alpha"}], 2: [{"text": "beta"}]}, ks=[1])
+
+    assert agent.calls == [("retrieve", True), ("retrieve", True), ("retrieve_many", False)]
+    assert agent.embeddings is cached
@@ -0,0 +1,77 @@
+import json
+
+import pytest
+
+import agents.rag_agent as rag_agent_module
+import eval.evaluator as evaluator_module
+from eval.sharding import (
+    _forwarded_args, merge_shards, parse_shard, shard_output_path, shard_questions, worker_env
+)
+
+QUESTIONS = [{"question": f"What is concept {i}?"} for i in range(7)]
+
+
+@pytest.fixture
+def stub_llm(monkeypatch):
+    monkeypatch.setenv("LLM_BACKEND", "stub")
+    monkeypatch.setattr(rag_agent_module, "DB_DIR", "Z:/definitely_missing_db")
+
+
+def _without_timing(records):
+    return [{k: v for k, v in record.items() if k not in ("timing", "spans")} for record in records]
+
+
+def test_parse_shard_validates_the_spec():
+    assert parse_shard("2/4") == (2, 4)
+    for spec in ("4/4", "-1/4", "1", "a/b", "0/0"):
+        with pytest.raises(ValueError):
+            parse_shard(spec)
+
+
+def test_shards_partition_the_questions_with_global_ids():
+    shards = [shard_questions(QUESTIONS, i, 3)[0] for i in range(3)]
+
+    assert [len(s) for s in shards] == [3, 2, 2]
+    ids = sorted(q["id"] for s in shards for q in s)
+    assert ids == sorted(evaluator_module.assign_ids(QUESTIONS))
+    assert shard_questions(QUESTIONS, 1, 3)[0] == shards[1]
+
+
+def test_merged_shards_match_an_unsharded_run(stub_llm, tmp_path):
+    full = evaluator_module.run_experiment(QUESTIONS, str(tmp_path / "full.json"))
+
+    shard_files = []
+    # Merge order must not depend on the order shards finish
+    for index in (2, 0, 1):
+        questions, shard = shard_questions(QUESTIONS, index, 3)
+        path = shard_output_path(str(tmp_path / "results.json"), index, 3)
+        evaluator_module.run_experiment(questions, path, shard=shard)
+        shard_files.append(path)
+
+    merged = merge_shards(shard_files, str(tmp_path / "merged.json"))
+
+    assert merged["summary"] == full["summary"]
+    assert [s["num_questions"] for s in merged["shards"]] == [3, 2, 2]
+    with open(tmp_path / "full.json", encoding="utf-8") as f:
+        expected = json.load(f)["questions"]
+    with open(tmp_path / "merged.json", encoding="utf-8") as f:
+        artifact = json.load(f)
+    assert _without_timing(artifact["questions"]) == _without_timing(expected)
+    assert artifact["coalescing"]["rag_agent"]["calls"] == len(QUESTIONS)
+
+    with pytest.raises(ValueError, match="Missing shard"):
+        merge_shards(shard_files[:2], str(tmp_path / "partial.json"))
+
+
+def test_launcher_forwards_only_experiment_options():
+    argv = ["--workers", "4", "--concurrency=3", "--output", "out.json", "--resume", "--log=x.jsonl", "--ingest"]
+    assert _forwarded_args(argv) == ["--concurrency=3", "--resume"]
+    assert shard_output_path("results/run.json", 1, 4) == "results/run.shard-1-of-4.json"
+
+
+def test_worker_env_splits_the_llm_quota():
+    env = worker_env(4, {"LLM_RPM": "60", "OMP_NUM_THREADS": "2"})
+
+    assert float(env["LLM_RPM"]) == 15
+    assert float(env["LLM_TPM"]) == 62_500
+    assert env["OMP_NUM_THREADS"] == "2"
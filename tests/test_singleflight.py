@@ -0,0 +1,107 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import resources
+import agents.rag_agent as rag_agent_module
+import eval.evaluator as evaluator_module
+from agents.singleflight import SingleFlight
+
+
+def test_concurrent_threads_share_one_call_and_get_copies():
+    flight = SingleFlight()
+    calls = []
+    start = threading.Barrier(4)
+
+    def work():
+        calls.append(1)
+        time.sleep(0.05)
+        return {"answer": [42]}
+
+    results = []
+
+    def caller():
+        start.wait()
+        results.append(flight.do("q", work))
+
+    threads = [threading.Thread(target=caller) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert all(r == {"answer": [42]} for r in results)
+    assert len({id(r) for r in results}) == 4
+    assert flight.stats() == {"calls": 4, "coalesced": 3, "executed": 1}
+
+
+def test_async_waiters_share_result_and_errors():
+    flight = SingleFlight()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "answer"
+
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def main():
+        answers = await asyncio.gather(*(flight.ado("q", work) for _ in range(5)))
+        errors = await asyncio.gather(*(flight.ado("bad", failing) for _ in range(2)), return_exceptions=True)
+        # The key is released once the call finishes
+        again = await flight.ado("q", work)
+        return answers, errors, again
+
+    answers, errors, again = asyncio.run(main())
+
+    assert answers == ["answer"] * 5 and again == "answer"
+    assert len(calls) == 2
+    assert all(isinstance(e, ValueError) for e in errors)
+    assert flight.stats()["coalesced"] == 5
+
+
+def test_cancelled_leader_hands_the_call_to_a_waiter():
+    flight = SingleFlight()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.02)
+        return "answer"
+
+    async def main():
+        leader = asyncio.create_task(flight.ado("q", work))
+        await asyncio.sleep(0)
+        waiters = [asyncio.create_task(flight.ado("q", work)) for _ in range(2)]
+        await asyncio.sleep(0.005)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await asyncio.gather(*waiters)
+
+    assert asyncio.run(main()) == ["answer", "answer"]
+    assert len(calls) == 2
+    assert flight.stats() == {"calls": 3, "coalesced": 1, "executed": 2}
+
+
+def test_duplicate_questions_are_coalesced_in_experiment(monkeypatch):
+    monkeypatch.setenv("LLM_BACKEND", "stub")
+    monkeypatch.setenv("LLM_STUB_LATENCY", "0.02")
+    monkeypatch.setattr(rag_agent_module, "DB_DIR", "Z:/definitely_missing_db")
+    questions = [{"question": "What is a block?"}] * 3 + [{"question": "What is a nonce?"}]
+
+    results = evaluator_module.run_experiment(questions, concurrency=4)
+
+    stub = resources.get_llm_client("gemini-2.5-flash")
+    # Two distinct questions: one pure, one RAG and one judge call each
+    assert stub.calls == 6
+    assert results["coalescing"]["pure_agent"]["coalesced"] == 2
+    assert results["coalescing"]["judge"]["coalesced"] == 2
+    answers = [q["pure_agent_response"] for q in results["questions"][:3]]
+    assert answers[0] == answers[1] == answers[2]
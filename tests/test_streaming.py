@@ -0,0 +1,125 @@
+import time
+
+import pytest
+
+import agents.pure_agent as pure_agent_module
+import agents.rag_agent as rag_agent_module
+from llm.response_cache import ResponseCache
+from instrumentation import trace
+from llm.streaming import BackgroundStream, TextStream
+
+CHUNKS = ["Proof ", "of ", "work."]
+
+
+class StreamingResponse:
+    def __init__(self, chunks, fail_after=None):
+        self._chunks = chunks
+        self._fail_after = fail_after
+        self.usage_metadata = type("Usage", (), {"prompt_token_count": 7, "total_token_count": 10})()
+
+    def __iter__(self):
+        for i, text in enumerate(self._chunks):
+            if i == self._fail_after:
+                raise RuntimeError("stream interrupted")
+            time.sleep(0.02)
+            yield type("Chunk", (), {"text": text})()
+
+
+class StreamingModel:
+    fail_after = None
+
+    def __init__(self):
+        self.calls = 0
+
+    def generate_content(self, _prompt, stream=False, **_kwargs):
+        self.calls += 1
+        assert stream
+        return StreamingResponse(CHUNKS, self.fail_after)
+
+
+@pytest.fixture
+def model(monkeypatch):
+    monkeypatch.setenv("GOOGLE_API_KEY", "test-key")
+    model = StreamingModel()
+    monkeypatch.setattr(pure_agent_module, "get_llm_client", lambda _name: model)
+    monkeypatch.setattr(rag_agent_module, "get_llm_client", lambda _name: model)
+    monkeypatch.setattr(rag_agent_module, "DB_DIR", "Z:/definitely_missing_db")
+    return model
+
+
+def test_stream_yields_chunks_and_records_ttft(model):
+    stream = pure_agent_module.PureAgent().stream_query_with_reasoning("What secures Bitcoin?")
+
+    assert stream.result is None
+    received = list(stream)
+
+    assert received == CHUNKS
+    metrics = stream.result["stream_metrics"]
+    assert metrics["chunks"] == 3 and metrics["cached"] is False
+    assert 0 < metrics["ttft_ms"] < metrics["latency_ms"]
+    assert stream.result["full_response"] == "Proof of work."
+
+
+def test_rag_stream_reports_retrieval_and_usage(model):
+    stream = rag_agent_module.RAGAgent().stream_query_with_reasoning("What secures Bitcoin?")
+
+    result = stream.consume()
+
+    assert result["full_response"] == "Proof of work."
+    assert result["retrieved_docs"] == []
+    assert result["context_stats"]["prompt_tokens"] == 7
+    assert result["stream_metrics"]["retrieval_ms"] is not None
+
+
+def test_interrupted_stream_is_reported_as_error(model):
+    model.fail_after = 2
+    stream = pure_agent_module.PureAgent().stream_query_with_reasoning("q")
+
+    assert list(stream) == CHUNKS[:2]
+    assert "stream interrupted" in stream.result["error"]
+    assert stream.result["stream_metrics"]["chunks"] == 2
+
+
+def test_cached_stream_replays_without_calling_the_model(model, monkeypatch, tmp_path):
+    import resources
+
+    cache = ResponseCache(str(tmp_path / "responses.sqlite3"))
+    monkeypatch.setattr(resources, "get_response_cache", lambda: cache)
+    agent = pure_agent_module.PureAgent()
+
+    agent.stream_query("q").consume()
+    replay = agent.stream_query("q")
+
+    assert list(replay) == ["Proof of work."]
+    assert model.calls == 1
+
+
+def test_stream_records_a_generation_span_from_a_background_thread(model):
+    with trace() as spans:
+        stream = pure_agent_module.PureAgent().stream_query("q")
+        received = list(BackgroundStream(stream))
+
+    generation, = [r for r in spans.records() if r["stage"] == "generation"]
+    assert received == CHUNKS
+    assert generation["component"] == "pure_agent" and generation["streamed"] is True
+    assert generation["response_chars"] == len("Proof of work.") and generation["prompt_tokens"] == 7
+    assert "error" not in generation
+
+
+def test_closing_a_stream_early_ends_its_span(model):
+    with trace() as spans:
+        stream = pure_agent_module.PureAgent().stream_query("q")
+        for _ in stream:
+            break
+
+    generation, = [r for r in spans.records() if r["stage"] == "generation"]
+    assert generation["closed"] is True and "error" not in generation
+    assert generation["response_chars"] == len(CHUNKS[0])
+
+
+def test_text_stream_is_single_use():
+    stream = TextStream(iter(["a"]))
+    stream.consume()
+
+    with pytest.raises(RuntimeError):
+        list(stream)